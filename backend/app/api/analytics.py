@@ -0,0 +1,44 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..models.base import get_db
+from ..auth.jwt import check_analyst_role, check_admin_role
+from ..services.analytics import (
+    SnapshotError,
+    DEFAULT_PERCENTILES,
+    list_snapshot_periods,
+    query_snapshot,
+    rebuild_snapshots
+)
+
+router = APIRouter()
+
+@router.get("/analytics/series/{series_id}/periods", dependencies=[Depends(check_analyst_role)])
+def read_snapshot_periods(series_id: int):
+    return {"series_id": series_id, "periods": list_snapshot_periods(series_id)}
+
+@router.get("/analytics/series/{series_id}/periods/{period}", dependencies=[Depends(check_analyst_role)])
+def read_snapshot_aggregates(
+    series_id: int,
+    period: str,
+    mdrm_id: str,
+    denominator: Optional[str] = None,
+    group_by: Optional[str] = None,
+    percentiles: List[float] = Query(DEFAULT_PERCENTILES)
+):
+    # Served entirely from the memory-mapped snapshot, without touching the database
+    try:
+        return query_snapshot(
+            series_id, period, mdrm_id,
+            denominator=denominator, group_by=group_by, percentiles=percentiles
+        )
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.post("/analytics/rebuild", dependencies=[Depends(check_admin_role)])
+def rebuild_analytics_snapshots(series_id: Optional[int] = None, db: Session = Depends(get_db)):
+    partitions = rebuild_snapshots(db, series_id)
+    return {"detail": f"Rebuilt {partitions} snapshot partitions"}
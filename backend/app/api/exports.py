@@ -0,0 +1,87 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from ..auth.jwt import get_current_active_user
+from ..models.base import READ_YOUR_WRITES_COOKIE
+from ..models.user import User
+from ..services.export import (
+    ExportFilter,
+    EXPORT_MEDIA_TYPES,
+    parquet_available,
+    stream_export
+)
+
+router = APIRouter()
+
+def build_export_filter(
+    current_user: User,
+    series_id: Optional[int],
+    period_from: Optional[str],
+    period_to: Optional[str],
+    institution_ids: Optional[List[int]]
+) -> ExportFilter:
+    # External users can only export their own institution's reports
+    if current_user.role == "external":
+        own_institution = int(current_user.institution)
+        if institution_ids and any(institution_id != own_institution for institution_id in institution_ids):
+            raise HTTPException(status_code=403, detail="Not authorized to export data for these institutions")
+        institution_ids = [own_institution]
+
+    return ExportFilter(
+        series_id=series_id,
+        period_from=period_from,
+        period_to=period_to,
+        institution_ids=institution_ids
+    )
+
+def export_response(
+    kind: str,
+    format: str,
+    export_filter: ExportFilter,
+    current_user: User,
+    request: Request,
+    pivot: bool = False
+):
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow to be installed")
+
+    filename = f"{kind}_export.{format}"
+    return StreamingResponse(
+        stream_export(
+            kind, format, export_filter, pivot=pivot,
+            username=current_user.username, last_write=request.cookies.get(READ_YOUR_WRITES_COOKIE)
+        ),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/exports/data")
+def export_report_data(
+    request: Request,
+    format: str = "csv",
+    series_id: Optional[int] = None,
+    period_from: Optional[str] = None,
+    period_to: Optional[str] = None,
+    institution_ids: Optional[List[int]] = Query(None),
+    pivot: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    # With pivot=true each report becomes one row with a column per MDRM element
+    export_filter = build_export_filter(current_user, series_id, period_from, period_to, institution_ids)
+    return export_response("data", format, export_filter, current_user, request, pivot=pivot)
+
+@router.get("/exports/validation-results")
+def export_validation_results(
+    request: Request,
+    format: str = "csv",
+    series_id: Optional[int] = None,
+    period_from: Optional[str] = None,
+    period_to: Optional[str] = None,
+    institution_ids: Optional[List[int]] = Query(None),
+    current_user: User = Depends(get_current_active_user)
+):
+    export_filter = build_export_filter(current_user, series_id, period_from, period_to, institution_ids)
+    return export_response("validation", format, export_filter, current_user, request)
@@ -2,7 +2,7 @@
 
 
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
 from sqlalchemy.orm import Session
 
 from ..models.base import get_db
@@ -10,11 +10,20 @@ from ..models.mdrm import MDRMElement, Series, series_mdrm_association
 from ..schemas.mdrm import (
     MDRMElement as MDRMElementSchema,
     MDRMElementCreate,
+    MDRMSearchResults,
     Series as SeriesSchema,
-    SeriesCreate
+    SeriesCreate,
+    SeriesElementsPage
 )
-from ..auth.jwt import get_current_active_user, check_analyst_role, check_admin_role
+from ..auth.jwt import get_current_active_user, get_read_db, check_analyst_role, check_admin_role
 from ..models.user import User
+from ..services.mdrm_dictionary import DictionaryImportError, import_dictionary
+from ..services.mdrm_search import search_elements
+from ..services.series_members import (
+    count_series_members,
+    replace_series_members,
+    resolve_element_ids
+)
 
 router = APIRouter()
 
@@ -31,13 +40,36 @@ def create_mdrm_element(mdrm_element: MDRMElementCreate, db: Session = Depends(g
     db.refresh(db_mdrm)
     return db_mdrm
 
+@router.post("/mdrm-elements/import", dependencies=[Depends(check_admin_role)])
+def import_mdrm_dictionary(
+    file: UploadFile = File(...),
+    active_only: bool = True,
+    update_series: bool = True,
+    db: Session = Depends(get_db)
+):
+    # Upsert the MDRM dictionary (MDRM_CSV.csv or its zip) and rebuild the
+    # memberships of the series listed in its Reporting Form column
+    try:
+        return import_dictionary(db, file.file, active_only=active_only, update_series=update_series)
+    except DictionaryImportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/mdrm-elements/", response_model=List[MDRMElementSchema])
-def read_mdrm_elements(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_mdrm_elements(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     mdrm_elements = db.query(MDRMElement).offset(skip).limit(limit).all()
     return mdrm_elements
 
+@router.get("/mdrm-elements/search", response_model=MDRMSearchResults)
+def search_mdrm_elements(q: str, skip: int = 0, limit: int = 50, db: Session = Depends(get_read_db)):
+    # Ranked full-text search over MDRM ID, name, description, item code and form type;
+    # the last word is matched as a prefix
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
+    total, mdrm_elements = search_elements(db, q, skip=max(skip, 0), limit=limit)
+    return {"query": q, "total": total, "skip": skip, "limit": limit, "items": mdrm_elements}
+
 @router.get("/mdrm-elements/{mdrm_id}", response_model=MDRMElementSchema)
-def read_mdrm_element(mdrm_id: str, db: Session = Depends(get_db)):
+def read_mdrm_element(mdrm_id: str, db: Session = Depends(get_read_db)):
     db_mdrm = db.query(MDRMElement).filter(MDRMElement.mdrm_id == mdrm_id).first()
     if db_mdrm is None:
         raise HTTPException(status_code=404, detail="MDRM element not found")
@@ -82,27 +114,70 @@ def create_series(series: SeriesCreate, db: Session = Depends(get_db)):
     
     # Add MDRM elements if provided
     if series.mdrm_element_ids:
-        for mdrm_id in series.mdrm_element_ids:
-            mdrm_element = db.query(MDRMElement).filter(MDRMElement.id == mdrm_id).first()
-            if mdrm_element:
-                db_series.mdrm_elements.append(mdrm_element)
-        
+        replace_series_members(db, {db_series.id: resolve_element_ids(db, series.mdrm_element_ids)})
         db.commit()
         db.refresh(db_series)
     
     return db_series
 
 @router.get("/series/", response_model=List[SeriesSchema])
-def read_series(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_series(
+    skip: int = 0,
+    limit: int = 100,
+    include_elements: bool = True,
+    db: Session = Depends(get_read_db)
+):
     series = db.query(Series).offset(skip).limit(limit).all()
-    return series
+    if include_elements:
+        return series
+    # Only element counts; page through members with /series/{series_id}/mdrm-elements
+    counts = count_series_members(db, [db_series.id for db_series in series])
+    return [series_summary(db_series, counts.get(db_series.id, 0)) for db_series in series]
 
 @router.get("/series/{series_id}", response_model=SeriesSchema)
-def read_series_by_id(series_id: str, db: Session = Depends(get_db)):
+def read_series_by_id(series_id: str, include_elements: bool = True, db: Session = Depends(get_read_db)):
     db_series = db.query(Series).filter(Series.series_id == series_id).first()
     if db_series is None:
         raise HTTPException(status_code=404, detail="Series not found")
-    return db_series
+    if include_elements:
+        return db_series
+    counts = count_series_members(db, [db_series.id])
+    return series_summary(db_series, counts.get(db_series.id, 0))
+
+@router.get("/series/{series_id}/mdrm-elements", response_model=SeriesElementsPage)
+def read_series_elements(
+    series_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db)
+):
+    db_series = db.query(Series).filter(Series.series_id == series_id).first()
+    if db_series is None:
+        raise HTTPException(status_code=404, detail="Series not found")
+    
+    query = db.query(MDRMElement).join(
+        series_mdrm_association, series_mdrm_association.c.mdrm_element_id == MDRMElement.id
+    ).filter(series_mdrm_association.c.series_id == db_series.id)
+    total = query.count()
+    mdrm_elements = query.order_by(MDRMElement.mdrm_id).offset(skip).limit(limit).all()
+    return {
+        "series_id": db_series.series_id,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "items": mdrm_elements
+    }
+
+def series_summary(db_series: Series, element_count: int) -> dict:
+    return {
+        "id": db_series.id,
+        "series_id": db_series.series_id,
+        "name": db_series.name,
+        "description": db_series.description,
+        "frequency": db_series.frequency,
+        "mdrm_elements": [],
+        "element_count": element_count
+    }
 
 @router.put("/series/{series_id}", response_model=SeriesSchema, dependencies=[Depends(check_analyst_role)])
 def update_series(series_id: str, series: SeriesCreate, db: Session = Depends(get_db)):
@@ -114,16 +189,9 @@ def update_series(series_id: str, series: SeriesCreate, db: Session = Depends(ge
     for key, value in series.dict(exclude={"mdrm_element_ids"}).items():
         setattr(db_series, key, value)
     
-    # Update MDRM elements if provided
+    # Update MDRM elements if provided, writing only the added and removed associations
     if series.mdrm_element_ids is not None:
-        # Clear existing associations
-        db_series.mdrm_elements = []
-        
-        # Add new associations
-        for mdrm_id in series.mdrm_element_ids:
-            mdrm_element = db.query(MDRMElement).filter(MDRMElement.id == mdrm_id).first()
-            if mdrm_element:
-                db_series.mdrm_elements.append(mdrm_element)
+        replace_series_members(db, {db_series.id: resolve_element_ids(db, series.mdrm_element_ids)})
     
     db.commit()
     db.refresh(db_series)
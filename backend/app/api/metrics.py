@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends
+
+from ..auth.jwt import check_admin_role
+from ..services.admission import submission_admission
+from ..services.report_events import report_events
+from ..services.resubmission import resubmission_stats
+
+router = APIRouter()
+
+@router.get("/metrics", dependencies=[Depends(check_admin_role)])
+def read_metrics():
+    # Per-process counters; each worker reports its own
+    return {
+        "admission": submission_admission.snapshot(),
+        "resubmission": resubmission_stats.snapshot(),
+        "event_subscribers": report_events.subscriber_count()
+    }
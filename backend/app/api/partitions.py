@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..models.base import get_db
+from ..auth.jwt import check_admin_role
+from ..services.history import history_cache
+from ..services.partitions import PartitionError, attach_partition, detach_partition, list_partitions
+
+router = APIRouter()
+
+@router.get("/partitions/data-values", dependencies=[Depends(check_admin_role)])
+def read_data_value_partitions(db: Session = Depends(get_db)):
+    return {"partitions": list_partitions(db.get_bind())}
+
+@router.post("/partitions/data-values/{year}/detach", dependencies=[Depends(check_admin_role)])
+def detach_data_value_partition(year: int, db: Session = Depends(get_db)):
+    try:
+        count = detach_partition(db.get_bind(), year)
+    except PartitionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Cached history windows may hold values of the detached year
+    history_cache.clear()
+    return {"detail": f"Detached {count} data values of {year}"}
+
+@router.post("/partitions/data-values/{year}/attach", dependencies=[Depends(check_admin_role)])
+def attach_data_value_partition(year: int, db: Session = Depends(get_db)):
+    try:
+        count = attach_partition(db.get_bind(), year)
+    except PartitionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    history_cache.clear()
+    return {"detail": f"Attached {count} data values of {year}"}
@@ -2,17 +2,21 @@
 
 
 
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+import asyncio
 import json
 import csv
 from io import StringIO
 
-from ..models.base import get_db
+from ..models.base import get_db, SessionLocal
 from ..models.mdrm import (
-    Report, Institution, DataValue, MDRMElement, 
-    ValidationRule, ValidationResult, Series
+    Report, Institution, MDRMElement, 
+    ValidationRule, ValidationResult, Series, period_year
 )
 from ..schemas.mdrm import (
     Report as ReportSchema,
@@ -23,13 +27,91 @@ from ..schemas.mdrm import (
     DataValue as DataValueSchema,
     DataValueCreate
 )
-from ..auth.jwt import get_current_active_user, check_analyst_role
+from ..auth.jwt import get_current_active_user, get_read_db, check_analyst_role, get_token_user, oauth2_scheme
 from ..models.user import User
-from ..services.validation import validate_report_data
+from ..services.admission import submission_admission
+from ..services.analytics import safe_refresh_report_snapshot
+from ..services.ingest import parse_csv_rows
+from ..services.xbrl import XBRLError, parse_instance, taxonomy_cache
+from ..services.report_diff import DiffError, diff_reports, previous_report
+from ..services.report_records import load_value_records
+from ..services.report_events import KEEPALIVE_SECONDS, format_event, report_events
+from ..services.partitions import PartitionError, ensure_partition, is_detached
+from ..services.report_data import write_report_version, get_current_data_values, get_version_data_values
+from ..services.resubmission import canonical_values, content_hash, resubmission_stats
+from ..services.peer_statistics import add_report_statistics, remove_report_statistics
+from ..services.history import history_cache
+from ..services.foreign_reports import get_dependency_version
+from ..services.validation import (
+    validate_report_data,
+    get_ruleset_version,
+    get_validation_etag,
+    is_validation_current,
+    get_persisted_validation_results,
+    clear_validation_results
+)
 
 router = APIRouter()
 
-# Institution endpoints
+def authorize_report_submission(report_id: int, current_user: User) -> Optional[int]:
+    # Returns the report's institution ID; uses its own session like authorize_report_stream
+    db = SessionLocal()
+    try:
+        institution_id = db.query(Report.institution_id).filter(Report.id == report_id).first()
+        if institution_id is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+        
+        if current_user.role == "external" and str(institution_id[0]) != current_user.institution:
+            raise HTTPException(status_code=403, detail="Not authorized to submit data for this report")
+        return institution_id[0]
+    finally:
+        db.close()
+
+def authorize_report_stream(token: str, report_id: int):
+    # Uses its own short session: a streaming endpoint would hold a request-scoped one open
+    db = SessionLocal()
+    try:
+        current_user = get_token_user(db, token)
+        if not current_user.is_active:
+            raise HTTPException(status_code=400, detail="Inactive user")
+        
+        # Check if report exists
+        institution_id = db.query(Report.institution_id).filter(Report.id == report_id).first()
+        if institution_id is None:
+            raise HTTPException(status_code=404, detail="Report not found")
+        
+        # Check authorization
+        if current_user.role == "external" and str(institution_id[0]) != current_user.institution:
+            raise HTTPException(status_code=403, detail="Not authorized to access this report")
+    finally:
+        db.close()
+
+def get_report_state(report_id: int) -> dict:
+    db = SessionLocal()
+    try:
+        report = db.query(Report).filter(Report.id == report_id).first()
+        return {"status": report.status, "data_version": report.data_version or 0} if report else {}
+    finally:
+        db.close()
+
+def publish_submission_result(report: Report, validation_results: list, duplicate: bool = False):
+    failures = sum(1 for result in validation_results if not result.is_valid)
+    report_events.publish(report.id, "status", {"status": report.status, "data_version": report.data_version or 0})
+    report_events.publish(report.id, "summary", {
+        "is_valid": failures == 0,
+        "rules_evaluated": len(validation_results),
+        "failures": failures,
+        "duplicate": duplicate
+    })
+
+async def report_submission_slot(report_id: int, current_user: User = Depends(get_current_active_user)):
+    # Submissions are queued on the event loop, before a worker thread is taken, but only
+    # once the caller may submit; rejections become 429 responses (see the
+    # AdmissionRejected handler in main)
+    institution_id = await run_in_threadpool(authorize_report_submission, report_id, current_user)
+    async with submission_admission.slot(institution_id or f"report:{report_id}"):
+        yield
+
 @router.post("/institutions/", dependencies=[Depends(check_analyst_role)])
 def create_institution(
     name: str, 
@@ -48,7 +130,7 @@ def create_institution(
     return db_institution
 
 @router.get("/institutions/")
-def read_institutions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_institutions(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     institutions = db.query(Institution).offset(skip).limit(limit).all()
     return institutions
 
@@ -84,7 +166,7 @@ def create_report(
 def read_reports(
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Filter reports based on user role
@@ -100,7 +182,7 @@ def read_reports(
 @router.get("/reports/{report_id}", response_model=ReportWithData)
 def read_report(
     report_id: int, 
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     db_report = db.query(Report).filter(Report.id == report_id).first()
@@ -111,10 +193,87 @@ def read_report(
     if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
         raise HTTPException(status_code=403, detail="Not authorized to access this report")
     
+    # Load the current values from the report's partition only
+    set_committed_value(
+        db_report, "data_values", get_current_data_values(db, report_id, db_report.reporting_period)
+    )
     return db_report
 
+@router.get("/reports/{report_id}/versions/{version}")
+def get_report_version(
+    report_id: int,
+    version: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    db_report = db.query(Report).filter(Report.id == report_id).first()
+    if db_report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    # Check authorization
+    if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
+        raise HTTPException(status_code=403, detail="Not authorized to access this report")
+    
+    if version < 1 or version > (db_report.data_version or 0):
+        raise HTTPException(status_code=404, detail="Report version not found")
+    
+    # Values as they were submitted in an earlier version of the report
+    data_values = get_version_data_values(db, report_id, version, db_report.reporting_period)
+    return {
+        "report_id": report_id,
+        "version": version,
+        "current_version": db_report.data_version,
+        "data_values": [
+            {"id": dv.id, "mdrm_element_id": dv.mdrm_element_id, "value": dv.value}
+            for dv in data_values
+        ]
+    }
+
+@router.get("/reports/{report_id}/diff")
+def get_report_diff(
+    report_id: int,
+    base_report_id: Optional[int] = None,
+    min_change: Optional[float] = Query(None, ge=0),
+    min_pct_change: Optional[float] = Query(None, ge=0),
+    sort: str = "magnitude",
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    db_report = db.query(Report).filter(Report.id == report_id).first()
+    if db_report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    # Compare with the previous period of the institution unless a base report is given
+    if base_report_id is None:
+        base_report = previous_report(db, db_report)
+        if base_report is None:
+            raise HTTPException(status_code=404, detail="No earlier report to compare with")
+    else:
+        base_report = db.query(Report).filter(Report.id == base_report_id).first()
+        if base_report is None:
+            raise HTTPException(status_code=404, detail="Base report not found")
+    
+    # Check authorization for both reports
+    if current_user.role == "external" and any(
+        str(report.institution_id) != current_user.institution for report in (db_report, base_report)
+    ):
+        raise HTTPException(status_code=403, detail="Not authorized to access this report")
+    
+    try:
+        return diff_reports(
+            db, base_report, db_report,
+            min_change=min_change, min_pct_change=min_pct_change, sort=sort, limit=limit
+        )
+    except DiffError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Data submission endpoints
-@router.post("/reports/{report_id}/data", response_model=ValidationResponse)
+@router.post(
+    "/reports/{report_id}/data",
+    response_model=ValidationResponse,
+    dependencies=[Depends(report_submission_slot)]
+)
 def submit_report_data(
     report_id: int,
     data: DataUpload,
@@ -130,37 +289,78 @@ def submit_report_data(
     if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
         raise HTTPException(status_code=403, detail="Not authorized to submit data for this report")
     
-    # Delete existing data values for this report
-    db.query(DataValue).filter(DataValue.report_id == report_id).delete()
-    
-    # Insert new data values
-    data_values = []
-    for data_item in data.data_values:
-        db_data_value = DataValue(
-            report_id=report_id,
-            mdrm_element_id=data_item["mdrm_element_id"],
-            value=data_item["value"]
-        )
-        db.add(db_data_value)
-        db.flush()  # Flush to get the ID
-        data_values.append(db_data_value)
+    # Values of a detached year cannot change until the year is attached again
+    try:
+        ensure_partition(db, period_year(db_report.reporting_period))
+    except PartitionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    # Validate data
-    validation_results = validate_report_data(db, db_report, data_values)
-    
-    # Update report status based on validation results
-    is_valid = all(result.is_valid for result in validation_results)
-    db_report.status = "validated" if is_valid else "rejected"
+    # An identical resubmission under the same rules gets the stored result, without writes
+    ruleset_version = get_ruleset_version(db, db_report.series_id)
+    dependency_version = get_dependency_version(db, db_report)
+    duplicate = (
+        db_report.content_hash == content_hash(canonical_values(data.data_values))
+        and is_validation_current(db_report, ruleset_version, dependency_version)
+    )
+    resubmission_stats.record(duplicate)
+    if duplicate:
+        validation_results = get_persisted_validation_results(db, report_id)
+        publish_submission_result(db_report, validation_results, duplicate=True)
+        return {
+            "report_id": report_id,
+            "is_valid": all(result.is_valid for result in validation_results),
+            "validation_results": validation_results
+        }
     
-    db.commit()
+    report_events.publish(report_id, "status", {"status": "processing"})
     
-    return {
-        "report_id": report_id,
-        "is_valid": is_valid,
-        "validation_results": validation_results
-    }
+    try:
+        # Withdraw the old values from the peer statistics
+        remove_report_statistics(db, db_report)
+        
+        # Store the submission as a new version; only changed values are written.
+        # Replaced values keep their validation results, the values of the new
+        # version are validated again.
+        data_values = write_report_version(db, db_report, data.data_values)
+        clear_validation_results(db, report_id)
+        
+        # Validate data, streaming progress to the report's subscribers
+        validation_results = validate_report_data(
+            db, db_report, data_values,
+            progress=lambda evaluated, total: report_events.publish(
+                report_id, "progress", {"rules_evaluated": evaluated, "rules_total": total}
+            )
+        )
+        
+        # Update report status based on validation results
+        is_valid = all(result.is_valid for result in validation_results)
+        db_report.status = "validated" if is_valid else "rejected"
+        db_report.validated_data_version = db_report.data_version
+        db_report.validated_ruleset_version = ruleset_version
+        db_report.validated_dependency_version = dependency_version
+        add_report_statistics(db, db_report)
+        
+        db.commit()
+        
+        # Later periods of this institution must not reuse history cached before the resubmission
+        history_cache.invalidate(db_report.series_id, db_report.institution_id)
+        
+        # Keep the analytics snapshot in step with the report status
+        safe_refresh_report_snapshot(db, db_report)
+        
+        publish_submission_result(db_report, validation_results)
+        return {
+            "report_id": report_id,
+            "is_valid": is_valid,
+            "validation_results": validation_results
+        }
+    except Exception:
+        # The report keeps its stored state; subscribers must not be left at "processing"
+        db.rollback()
+        report_events.publish(report_id, "status", get_report_state(report_id))
+        raise
 
-@router.post("/reports/{report_id}/upload-csv")
+@router.post("/reports/{report_id}/upload-csv", dependencies=[Depends(report_submission_slot)])
 async def upload_csv_data(
     report_id: int,
     file: UploadFile = File(...),
@@ -181,42 +381,84 @@ async def upload_csv_data(
     csv_content = content.decode('utf-8')
     csv_reader = csv.DictReader(StringIO(csv_content))
     
-    # Get series MDRM elements
-    series = db_report.series
-    mdrm_elements = {elem.mdrm_id: elem.id for elem in series.mdrm_elements}
-    
-    # Process CSV data
-    data_values = []
-    errors = []
-    
-    for row in csv_reader:
-        mdrm_id = row.get('mdrm_id')
-        value = row.get('value')
-        
-        if not mdrm_id or not value:
-            errors.append(f"Missing mdrm_id or value in row: {row}")
-            continue
-        
-        if mdrm_id not in mdrm_elements:
-            errors.append(f"MDRM ID {mdrm_id} not found in series {series.series_id}")
-            continue
-        
-        data_values.append({
-            "mdrm_element_id": mdrm_elements[mdrm_id],
-            "value": value
-        })
+    # Process CSV data against the series MDRM elements
+    data_values, errors = parse_csv_rows(csv_reader, db_report.series)
     
     if errors:
         return {"status": "error", "errors": errors}
     
-    # Submit data using existing endpoint
+    # Submit data using existing endpoint, off the event loop
     data_upload = DataUpload(report_id=report_id, data_values=data_values)
-    return submit_report_data(report_id, data_upload, db, current_user)
+    return await run_in_threadpool(submit_report_data, report_id, data_upload, db, current_user)
+
+def parse_xbrl_upload(db: Session, db_report: Report, file) -> tuple:
+    concepts = taxonomy_cache.get(db, db_report.series)
+    try:
+        return parse_instance(file, concepts, db_report.reporting_period)
+    except XBRLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/reports/{report_id}/upload-xbrl", dependencies=[Depends(report_submission_slot)])
+async def upload_xbrl_data(
+    report_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Check if report exists
+    db_report = db.query(Report).filter(Report.id == report_id).first()
+    if db_report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    # Check authorization
+    if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
+        raise HTTPException(status_code=403, detail="Not authorized to submit data for this report")
+    
+    # Stream the instance from the spooled upload instead of reading it whole
+    data_values, summary = await run_in_threadpool(parse_xbrl_upload, db, db_report, file.file)
+    
+    if not data_values:
+        return {
+            "status": "error",
+            "errors": [f"No facts for MDRM elements of series {db_report.series.series_id} in period {db_report.reporting_period}"],
+            "ingest": summary
+        }
+    
+    data_upload = DataUpload(report_id=report_id, data_values=data_values)
+    response = await run_in_threadpool(submit_report_data, report_id, data_upload, db, current_user)
+    return {**response, "ingest": summary}
+
+@router.get("/reports/{report_id}/events")
+async def stream_report_events(report_id: int, token: str = Depends(oauth2_scheme)):
+    await run_in_threadpool(authorize_report_stream, token, report_id)
+    
+    async def event_stream():
+        # Subscribe before reading the state, so no transition is missed in between
+        queue = report_events.subscribe(report_id)
+        try:
+            yield format_event("status", await run_in_threadpool(get_report_state, report_id))
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event, data)
+        finally:
+            report_events.unsubscribe(report_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/reports/{report_id}/validation", response_model=ValidationResponse)
 def validate_report(
     report_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),  # Stale results are revalidated and persisted, so this uses the primary
     current_user: User = Depends(get_current_active_user)
 ):
     # Check if report exists
@@ -228,19 +470,44 @@ def validate_report(
     if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
         raise HTTPException(status_code=403, detail="Not authorized to access this report")
     
-    # Get data values
-    data_values = db.query(DataValue).filter(DataValue.report_id == report_id).all()
+    # Neither the values of a detached year nor their results can be read until it is attached again
+    year = period_year(db_report.reporting_period)
+    if is_detached(db, year):
+        raise HTTPException(status_code=409, detail=f"Data values of {year} are detached")
     
-    # Validate data
-    validation_results = validate_report_data(db, db_report, data_values)
+    ruleset_version = get_ruleset_version(db, db_report.series_id)
+    dependency_version = get_dependency_version(db, db_report)
+    etag = get_validation_etag(db_report, ruleset_version, dependency_version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if is_validation_current(db_report, ruleset_version, dependency_version):
+        # Persisted results are up to date, let the client reuse its copy if it has one
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        validation_results = get_persisted_validation_results(db, report_id)
+    else:
+        # Data or ruleset changed since the last validation, so validate again and persist
+        clear_validation_results(db, report_id)
+        data_values = load_value_records(db, report_id, db_report.reporting_period)
+        validation_results = validate_report_data(db, db_report, data_values)
+        db_report.validated_data_version = db_report.data_version or 0
+        db_report.validated_ruleset_version = ruleset_version
+        db_report.validated_dependency_version = dependency_version
+        db.commit()
     
     # Check if all validations passed
     is_valid = all(result.is_valid for result in validation_results)
     
+    response.headers.update(headers)
     return {
         "report_id": report_id,
         "is_valid": is_valid,
         "validation_results": validation_results
     }
 
-
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
@@ -0,0 +1,204 @@
+from typing import Iterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+import anyio
+import csv
+import json
+
+from ..models.base import get_db, SessionLocal
+from ..models.mdrm import Report, UploadSession
+from ..schemas.mdrm import DataUpload
+from ..auth.jwt import get_current_active_user, get_read_db
+from ..models.user import User
+from ..services.admission import submission_admission
+from ..services.ingest import parse_csv_rows
+from ..services.uploads import (
+    ChunkError,
+    DEFAULT_CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    new_upload_id,
+    store_chunk,
+    file_checksum,
+    open_text,
+    discard_chunks
+)
+from .reports import submit_report_data
+
+router = APIRouter()
+
+def upload_status(upload: UploadSession) -> dict:
+    return {
+        "upload_id": upload.id,
+        "report_id": upload.report_id,
+        "filename": upload.filename,
+        "chunk_size": upload.chunk_size,
+        "next_chunk": upload.next_chunk,
+        "bytes_received": upload.bytes_received,
+        "status": upload.status
+    }
+
+def get_upload_session(db: Session, upload_id: str, current_user: User) -> UploadSession:
+    upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if upload.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to access this upload session")
+    return upload
+
+def authorize_upload_submission(upload_id: str, current_user: User) -> Optional[int]:
+    # Returns the institution ID of the upload's report
+    db = SessionLocal()
+    try:
+        get_upload_session(db, upload_id, current_user)
+        return db.query(Report.institution_id).join(
+            UploadSession, UploadSession.report_id == Report.id
+        ).filter(UploadSession.id == upload_id).scalar()
+    finally:
+        db.close()
+
+async def upload_submission_slot(upload_id: str, current_user: User = Depends(get_current_active_user)):
+    # Finalizing an upload validates the whole file, so it is admitted like a submission,
+    # once the caller may access the upload
+    institution_id = await run_in_threadpool(authorize_upload_submission, upload_id, current_user)
+    async with submission_admission.slot(institution_id or f"upload:{upload_id}"):
+        yield
+
+@router.post("/reports/{report_id}/uploads")
+def create_upload_session(
+    report_id: int,
+    filename: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Check if report exists
+    db_report = db.query(Report).filter(Report.id == report_id).first()
+    if db_report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    
+    # Check authorization
+    if current_user.role == "external" and str(db_report.institution_id) != current_user.institution:
+        raise HTTPException(status_code=403, detail="Not authorized to submit data for this report")
+    
+    if chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"Chunk size must be between 1 and {MAX_CHUNK_SIZE} bytes")
+    
+    upload = UploadSession(
+        id=new_upload_id(),
+        report_id=report_id,
+        user_id=current_user.id,
+        filename=filename,
+        chunk_size=chunk_size,
+        next_chunk=0,
+        bytes_received=0,
+        chunk_checksums="",
+        status="open"
+    )
+    db.add(upload)
+    db.commit()
+    return upload_status(upload)
+
+@router.get("/uploads/{upload_id}")
+def read_upload_session(
+    upload_id: str,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # next_chunk is where an interrupted upload resumes
+    return upload_status(get_upload_session(db, upload_id, current_user))
+
+def request_body_blocks(request: Request) -> Iterator[bytes]:
+    # Lets a threadpool endpoint stream the request body from the event loop, block by block
+    stream = request.stream()
+    while True:
+        try:
+            yield anyio.from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            return
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    x_chunk_checksum: str = Header(..., description="Hex SHA-256 of the chunk body"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    upload = get_upload_session(db, upload_id, current_user)
+    if upload.status != "open":
+        raise HTTPException(status_code=409, detail="Upload session is already finalized")
+    
+    try:
+        stored = store_chunk(upload, index, request_body_blocks(request), x_chunk_checksum)
+    except ChunkError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    if stored:
+        db.commit()
+    return upload_status(upload)
+
+@router.post("/uploads/{upload_id}/complete", dependencies=[Depends(upload_submission_slot)])
+def complete_upload(
+    upload_id: str,
+    checksum: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    upload = get_upload_session(db, upload_id, current_user)
+    
+    # Finalizing is idempotent: a retried call gets the original result
+    if upload.status == "finalized":
+        return json.loads(upload.result)
+    
+    if upload.next_chunk == 0:
+        raise HTTPException(status_code=400, detail="No chunks uploaded")
+    
+    if checksum and file_checksum(upload).lower() != checksum.strip().lower():
+        raise HTTPException(status_code=422, detail="Checksum mismatch for the assembled file")
+    
+    # Parse the staged chunks as one CSV stream
+    with open_text(upload) as stream:
+        data_values, errors = parse_csv_rows(csv.DictReader(stream), upload.report.series)
+    
+    # The upload stays open with its chunks, so completion can be retried once the
+    # cause is fixed, e.g. elements missing from the series
+    if errors:
+        return {"status": "error", "errors": errors}
+    
+    data_upload = DataUpload(report_id=upload.report_id, data_values=data_values)
+    response = submit_report_data(upload.report_id, data_upload, db, current_user)
+    result = {
+        "report_id": response["report_id"],
+        "is_valid": response["is_valid"],
+        "validation_results": [
+            {
+                "id": validation_result.id,
+                "data_value_id": validation_result.data_value_id,
+                "validation_rule_id": validation_result.validation_rule_id,
+                "is_valid": validation_result.is_valid,
+                "message": validation_result.message
+            }
+            for validation_result in response["validation_results"]
+        ]
+    }
+    
+    # Only a completed submission finalizes the upload and releases its chunks
+    upload.status = "finalized"
+    upload.result = json.dumps(result)
+    db.commit()
+    discard_chunks(upload.id)
+    return result
+
+@router.delete("/uploads/{upload_id}")
+def abort_upload(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    upload = get_upload_session(db, upload_id, current_user)
+    discard_chunks(upload.id)
+    db.delete(upload)
+    db.commit()
+    return {"detail": "Upload session deleted"}
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from ..schemas.mdrm import ValidationRuleDryRun
+from ..auth.jwt import check_analyst_role, get_read_db
+from ..services.rule_impact import DryRunError, dry_run_rule
+
+router = APIRouter()
+
+@router.post("/validation-rules/dry-run", dependencies=[Depends(check_analyst_role)])
+def dry_run_validation_rule(request: ValidationRuleDryRun, db: Session = Depends(get_read_db)):
+    # Evaluate a new or edited rule against existing filings; nothing is persisted
+    if request.sample_size < 0 or request.sample_size > 1000:
+        raise HTTPException(status_code=400, detail="sample_size must be between 0 and 1000")
+    
+    try:
+        return dry_run_rule(
+            db,
+            request.mdrm_element_id,
+            request.rule_type,
+            request.rule_expression,
+            series_ids=request.series_ids,
+            period_from=request.period_from,
+            period_to=request.period_to,
+            sample_size=request.sample_size,
+            max_reports=request.max_reports
+        )
+    except DryRunError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
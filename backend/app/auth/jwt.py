@@ -2,13 +2,13 @@
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from ..models.base import get_db
+from ..models.base import READ_YOUR_WRITES_COOKIE, get_db, read_session_factory
 from ..models.user import User
 from ..schemas.token import TokenData
 
@@ -20,6 +20,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -49,6 +50,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    user = get_token_user(db, token)
+    # Commits made with this session pin the user's reads to the primary for a while
+    db.info["username"] = user.username
+    return user
+
+def get_token_user(db: Session, token: str) -> User:
+    """Return the user a bearer token was issued to. Raises 401 for invalid tokens."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -67,6 +75,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     return user
 
+def get_read_db(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """
+    Database session for read-only endpoints. Uses the read replica unless the
+    requesting client recently committed a write, so users always see their own data.
+    Authentication itself is still done by get_current_user.
+    """
+    username = None
+    if token:
+        try:
+            username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            pass
+    db = read_session_factory(username, request.cookies.get(READ_YOUR_WRITES_COOKIE))()
+    try:
+        yield db
+    finally:
+        db.close()
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
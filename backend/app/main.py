@@ -2,22 +2,49 @@
 
 
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 import os
-from sqlalchemy.orm import Session
 
-from .models.base import engine, Base, get_db
-from .models.user import User, UserRole
-from .auth.jwt import get_password_hash
-from .api import auth, mdrm, reports
+from .api import auth, mdrm, reports, exports, analytics, uploads, validation_rules, metrics, partitions
+from .models.base import READ_YOUR_WRITES_COOKIE, READ_YOUR_WRITES_SECONDS, track_request_writes
+from .services.admission import AdmissionRejected
 
-# Create the database tables
-Base.metadata.create_all(bind=engine)
+# Startup does no schema changes, seeding or password hashing; run
+# "python -m app.utils.init_db" (or "python -m app.utils.migrate") once per deployment
 
 app = FastAPI(title="MDRM Data Collection System")
 
+class ReadYourWritesMiddleware:
+    """
+    Sets a cookie with the commit time on responses to requests that committed
+    to the primary, so the client's next reads skip the replica on any worker.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        writes = track_request_writes()
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and "committed_at" in writes:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={writes['committed_at']:.3f}; "
+                    f"Max-Age={int(READ_YOUR_WRITES_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+app.add_middleware(ReadYourWritesMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -31,44 +58,21 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api", tags=["Authentication"])
 app.include_router(mdrm.router, prefix="/api", tags=["MDRM"])
 app.include_router(reports.router, prefix="/api", tags=["Reports"])
+app.include_router(validation_rules.router, prefix="/api", tags=["Validation Rules"])
+app.include_router(uploads.router, prefix="/api", tags=["Uploads"])
+app.include_router(exports.router, prefix="/api", tags=["Exports"])
+app.include_router(analytics.router, prefix="/api", tags=["Analytics"])
+app.include_router(metrics.router, prefix="/api", tags=["Metrics"])
+app.include_router(partitions.router, prefix="/api", tags=["Partitions"])
 
-# Create admin user if it doesn't exist
-@app.on_event("startup")
-async def startup_event():
-    db = next(get_db())
-    admin_user = db.query(User).filter(User.username == "admin").first()
-    if not admin_user:
-        admin_user = User(
-            username="admin",
-            email="admin@example.com",
-            hashed_password=get_password_hash("admin"),
-            role=UserRole.ADMIN.value,
-            is_active=True
-        )
-        db.add(admin_user)
-        
-        # Also create an analyst user
-        analyst_user = User(
-            username="analyst",
-            email="analyst@example.com",
-            hashed_password=get_password_hash("analyst"),
-            role=UserRole.ANALYST.value,
-            is_active=True
-        )
-        db.add(analyst_user)
-        
-        # Create an external user
-        external_user = User(
-            username="external",
-            email="external@example.com",
-            hashed_password=get_password_hash("external"),
-            role=UserRole.EXTERNAL.value,
-            institution="1",  # This will be linked to an institution later
-            is_active=True
-        )
-        db.add(external_user)
-        
-        db.commit()
+# Saturated submission queue: ask the client to come back later
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 @app.get("/api/health")
 def health_check():
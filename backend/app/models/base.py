@@ -1,16 +1,111 @@
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from typing import Optional
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./mdrm_data.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./mdrm_data.db")
+
+# Optional read-only database for GET endpoints, e.g. a Postgres replica, or
+# for SQLite a read-only connection to the same file:
+#   sqlite:///file:./mdrm_data.db?mode=ro&uri=true
+READ_DATABASE_URL = os.environ.get("READ_DATABASE_URL")
+
+# How long a user's reads go to the primary after they committed a write,
+# so they always see their own submissions while the replica catches up
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "30"))
+
+def _connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"check_same_thread": False}
+    return {}
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, connect_args=_connect_args(SQLALCHEMY_DATABASE_URL)
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if READ_DATABASE_URL:
+    read_engine = create_engine(READ_DATABASE_URL, connect_args=_connect_args(READ_DATABASE_URL))
+else:
+    read_engine = engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+if READ_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # WAL lets the read-only connections read while a submission is being written
+    @event.listens_for(engine, "connect")
+    def _enable_wal(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+if READ_DATABASE_URL and READ_DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(read_engine, "connect")
+    def _set_query_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
 Base = declarative_base()
 
+# Reads are pinned to the primary in two ways: a cookie holding the time of
+# the client's last commit, which every worker process sees, and for clients
+# that do not keep cookies a per-process map of username -> time of the last
+# commit, which only holds on the worker that took the write
+READ_YOUR_WRITES_COOKIE = "last_write"
+
+_recent_writes = {}
+_recent_writes_lock = threading.Lock()
+
+# Commits of the current request, reported back by ReadYourWritesMiddleware
+_request_writes: ContextVar[Optional[dict]] = ContextVar("request_writes", default=None)
+
+def track_request_writes() -> dict:
+    """Start recording the commits of the current request; the returned dict gets a committed_at time."""
+    writes = {}
+    _request_writes.set(writes)
+    return writes
+
+@event.listens_for(SessionLocal, "after_commit")
+def _record_write(session):
+    writes = _request_writes.get()
+    if writes is not None:
+        writes["committed_at"] = time.time()
+    # get_current_user tags the request's session with the authenticated user
+    username = session.info.get("username")
+    if username:
+        with _recent_writes_lock:
+            _recent_writes[username] = time.monotonic()
+
+def wrote_recently(username: str) -> bool:
+    with _recent_writes_lock:
+        written_at = _recent_writes.get(username)
+        if written_at is None:
+            return False
+        if time.monotonic() - written_at > READ_YOUR_WRITES_SECONDS:
+            del _recent_writes[username]
+            return False
+        return True
+
+def _cookie_wrote_recently(last_write: Optional[str]) -> bool:
+    try:
+        return time.time() - float(last_write) <= READ_YOUR_WRITES_SECONDS
+    except (TypeError, ValueError):
+        return False
+
+def read_session_factory(username: str = None, last_write: Optional[str] = None) -> sessionmaker:
+    """
+    Session factory for reads: the replica, unless the client has just written
+    to the primary (last_write is the value of its READ_YOUR_WRITES_COOKIE).
+    """
+    if read_engine is engine or _cookie_wrote_recently(last_write) or (username and wrote_recently(username)):
+        return SessionLocal
+    return ReadSessionLocal
+
 def get_db():
     db = SessionLocal()
     try:
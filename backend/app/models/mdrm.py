@@ -1,9 +1,14 @@
 
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float, Boolean, Table
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float, Boolean, LargeBinary, Table, Index, and_, or_
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
 
+def period_year(reporting_period: str) -> int:
+    """Year of a period label like 2023Q1 or 2023M01, the partition key of its data values; 0 if undated."""
+    prefix = (reporting_period or "")[:4]
+    return int(prefix) if len(prefix) == 4 and prefix.isdigit() else 0
+
 # Association table for many-to-many relationship between Series and MDRMElement
 series_mdrm_association = Table(
     'series_mdrm_association',
@@ -50,11 +55,22 @@ class Report(Base):
     reporting_period = Column(String)  # e.g., 2023Q1
     submission_date = Column(DateTime, default=func.now())
     status = Column(String)  # e.g., submitted, validated, rejected
+    data_version = Column(Integer, default=0)  # Incremented on every data submission
+    validated_data_version = Column(Integer, nullable=True)  # data_version of the persisted validation results
+    validated_ruleset_version = Column(String, nullable=True)  # Ruleset version of the persisted validation results
+    validated_dependency_version = Column(String, nullable=True)  # Version of the other reports seen by cross-series, historical and peer rules
+    peer_group = Column(String, nullable=True)  # Peer group the report's values are counted in, if any
+    content_hash = Column(String, nullable=True)  # Canonical hash of the current data set, see services.resubmission
     
     # Relationships
     series = relationship("Series", back_populates="reports")
     institution = relationship("Institution", back_populates="reports")
-    data_values = relationship("DataValue", back_populates="report")
+    # Values of the latest version; earlier versions are kept as closed rows
+    data_values = relationship(
+        "DataValue",
+        primaryjoin="and_(Report.id == DataValue.report_id, DataValue.valid_to_version == None)",
+        viewonly=True
+    )
 
 class Institution(Base):
     __tablename__ = "institutions"
@@ -70,17 +86,44 @@ class Institution(Base):
 
 class DataValue(Base):
     __tablename__ = "data_values"
+    __table_args__ = (
+        Index("ix_data_values_report_version", "report_id", "valid_to_version"),
+        Index("ix_data_values_reporting_year", "reporting_year"),
+        # Ids of detached values must not be handed out again (see services.partitions)
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     report_id = Column(Integer, ForeignKey("reports.id"))
     mdrm_element_id = Column(Integer, ForeignKey("mdrm_elements.id"))
     value = Column(String)  # Store as string and convert as needed
+    valid_from_version = Column(Integer, default=1)  # First report version (data_version) containing this value
+    valid_to_version = Column(Integer, nullable=True)  # First report version no longer containing it; NULL while current
+    reporting_year = Column(Integer, nullable=True)  # Partition key, period_year() of the report; see services.partitions
     
     # Relationships
-    report = relationship("Report", back_populates="data_values")
+    report = relationship("Report")
     mdrm_element = relationship("MDRMElement", back_populates="data_values")
     validation_results = relationship("ValidationResult", back_populates="data_value")
 
+    @classmethod
+    def is_current(cls):
+        """Filter clause selecting the values of the latest version of a report."""
+        return cls.valid_to_version.is_(None)
+
+    @classmethod
+    def in_partition(cls, reporting_period: str):
+        """Filter clause restricting a query to the partition holding a reporting period's values."""
+        return cls.reporting_year == period_year(reporting_period)
+
+    @classmethod
+    def in_version(cls, version: int):
+        """Filter clause selecting the values of a given version of a report."""
+        return and_(
+            func.coalesce(cls.valid_from_version, 0) <= version,
+            or_(cls.valid_to_version.is_(None), cls.valid_to_version > version)
+        )
+
 class ValidationRule(Base):
     __tablename__ = "validation_rules"
 
@@ -109,3 +152,51 @@ class ValidationResult(Base):
     # Relationships
     data_value = relationship("DataValue", back_populates="validation_results")
     validation_rule = relationship("ValidationRule", back_populates="validation_results")
+
+class ValidationSummary(Base):
+    __tablename__ = "validation_summaries"
+
+    report_id = Column(Integer, ForeignKey("reports.id"), primary_key=True)
+    data_version = Column(Integer)  # Report data version the summary was computed for
+    rule_count = Column(Integer)  # Number of rules evaluated
+    failure_count = Column(Integer)
+    evaluated_rules = Column(LargeBinary)  # zlib-compressed bitmap of the evaluated rule IDs
+    validated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class PeerStatistic(Base):
+    __tablename__ = "peer_statistics"
+    __table_args__ = (
+        Index(
+            "ix_peer_statistics_lookup",
+            "series_id", "reporting_period", "peer_group", "mdrm_element_id",
+            unique=True
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    series_id = Column(Integer, ForeignKey("series.id"))
+    reporting_period = Column(String)
+    peer_group = Column(String)  # e.g., bank|1b_10b
+    mdrm_element_id = Column(Integer, ForeignKey("mdrm_elements.id"))
+    count = Column(Integer, default=0)
+    mean = Column(Float, default=0.0)
+    m2 = Column(Float, default=0.0)  # Sum of squared deviations from the mean
+    sketch = Column(Text, nullable=True)  # Serialized quantile sketch
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True, index=True)  # Random upload session ID
+    report_id = Column(Integer, ForeignKey("reports.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    filename = Column(String, nullable=True)
+    chunk_size = Column(Integer)
+    next_chunk = Column(Integer, default=0)  # Index of the next chunk expected; all earlier ones are acknowledged
+    bytes_received = Column(Integer, default=0)
+    chunk_checksums = Column(Text, default="")  # Comma-separated SHA-256 of each acknowledged chunk
+    status = Column(String, default="open")  # e.g., open, finalized
+    result = Column(Text, nullable=True)  # JSON ingest result, returned again on repeated finalize calls
+    created_at = Column(DateTime, default=func.now())
+    
+    # Relationships
+    report = relationship("Report")
@@ -22,6 +22,13 @@ class MDRMElement(MDRMElementBase):
     class Config:
         orm_mode = True
 
+class MDRMSearchResults(BaseModel):
+    query: str
+    total: int
+    skip: int
+    limit: int
+    items: List[MDRMElement] = []
+
 # Series Schemas
 class SeriesBase(BaseModel):
     series_id: str
@@ -35,10 +42,18 @@ class SeriesCreate(SeriesBase):
 class Series(SeriesBase):
     id: int
     mdrm_elements: List[MDRMElement] = []
+    element_count: Optional[int] = None  # Set when mdrm_elements is not included
 
     class Config:
         orm_mode = True
 
+class SeriesElementsPage(BaseModel):
+    series_id: str
+    total: int
+    skip: int
+    limit: int
+    items: List[MDRMElement] = []
+
 # Institution Schemas
 class InstitutionBase(BaseModel):
     name: str
@@ -105,6 +120,16 @@ class ValidationRule(ValidationRuleBase):
     class Config:
         orm_mode = True
 
+class ValidationRuleDryRun(BaseModel):
+    mdrm_element_id: int
+    rule_type: str
+    rule_expression: str
+    series_ids: Optional[List[int]] = None
+    period_from: Optional[str] = None
+    period_to: Optional[str] = None
+    sample_size: int = 20
+    max_reports: Optional[int] = None
+
 # ValidationResult Schemas
 class ValidationResultBase(BaseModel):
     data_value_id: int
@@ -116,7 +141,7 @@ class ValidationResultCreate(ValidationResultBase):
     pass
 
 class ValidationResult(ValidationResultBase):
-    id: int
+    id: Optional[int] = None  # Passing results have no ID under compact storage
 
     class Config:
         orm_mode = True
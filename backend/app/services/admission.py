@@ -0,0 +1,150 @@
+"""
+Admission control for heavy submission work.
+
+At most max_active submissions run at once; further requests wait in a
+bounded FIFO queue, and each institution may only have a few submissions
+running or queued. When the queue is full, an institution is over its cap,
+or a request waits longer than the queue timeout, the request is rejected
+with a retry hint instead of piling up on the database writer.
+
+Waiting happens on the event loop, so queued submissions hold no worker
+threads and read endpoints keep being served during a surge.
+"""
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable
+import asyncio
+import math
+import os
+import time
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+class AdmissionRejected(Exception):
+    """Raised when a submission cannot be admitted; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_active: int,
+        max_queued: int,
+        per_institution: int,
+        queue_timeout: float
+    ):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.per_institution = per_institution
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.by_institution: Counter = Counter()
+
+        # Metrics
+        self.admitted = 0
+        self.rejected: Counter = Counter()
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+
+    def _average_service_time(self) -> float:
+        return self.total_service / self.completed if self.completed else 1.0
+
+    def _retry_after(self) -> int:
+        # Time for the queue ahead to drain at the observed service rate
+        backlog = len(self.waiters) + self.active
+        return max(1, math.ceil(backlog * self._average_service_time() / self.max_active))
+
+    def _reject(self, reason: str, message: str):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(message, self._retry_after())
+
+    async def acquire(self, institution_key: Hashable):
+        """Wait for a slot. Raises AdmissionRejected when saturated."""
+        if self.by_institution[institution_key] >= self.per_institution:
+            self._reject("institution", "Too many concurrent submissions for this institution")
+        if self.active >= self.max_active and len(self.waiters) >= self.max_queued:
+            self._reject("queue_full", "Submission queue is full")
+
+        # Queued submissions count towards the institution's cap as well
+        self.by_institution[institution_key] += 1
+        started = time.monotonic()
+        if self.active < self.max_active and not self.waiters:
+            self.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except BaseException as e:
+                self._forget(institution_key)
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we gave up, pass it on
+                    self._release_slot()
+                else:
+                    waiter.cancel()
+                    self.waiters.remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._reject("timeout", "Timed out waiting for a submission slot")
+                raise
+
+        self.admitted += 1
+        self.total_wait += time.monotonic() - started
+
+    def _forget(self, institution_key: Hashable):
+        self.by_institution[institution_key] -= 1
+        if self.by_institution[institution_key] <= 0:
+            del self.by_institution[institution_key]
+
+    def release(self, institution_key: Hashable, service_time: float):
+        self._forget(institution_key)
+        self.completed += 1
+        self.total_service += service_time
+        self._release_slot()
+
+    def _release_slot(self):
+        # Hand the slot straight to the next waiter, so it cannot be overtaken
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, institution_key: Hashable):
+        await self.acquire(institution_key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(institution_key, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "active": self.active,
+            "queued": len(self.waiters),
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+            "per_institution": self.per_institution,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "average_wait_ms": round(self.total_wait / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "average_service_ms": round(self._average_service_time() * 1000, 2) if self.completed else None
+        }
+
+# Submissions write through a single database writer, so only a few run at once
+submission_admission = AdmissionController(
+    max_active=_env_int("SUBMISSION_MAX_ACTIVE", 4),
+    max_queued=_env_int("SUBMISSION_MAX_QUEUED", 100),
+    per_institution=_env_int("SUBMISSION_PER_INSTITUTION", 2),
+    queue_timeout=float(os.environ.get("SUBMISSION_QUEUE_TIMEOUT", 30))
+)
@@ -0,0 +1,292 @@
+"""
+Columnar analytics snapshot of validated filings.
+
+Each (series, reporting period) partition is an Arrow IPC file with one row
+per validated report and one float64 column per numeric MDRM element.
+Files are memory-mapped for queries, so cross-institution aggregates never
+touch the OLTP tables. A partition is updated incrementally whenever one of
+its reports is (re)validated.
+
+pyarrow is imported on first use, so importing this module (which the
+submission endpoints do) stays cheap.
+"""
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional
+import logging
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: partitions are only locked within the process
+    fcntl = None
+
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import Report, DataValue, MDRMElement, Institution
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get("ANALYTICS_SNAPSHOT_DIR", "./analytics_snapshots")
+
+KEY_COLUMNS = ["report_id", "institution_id", "institution_type"]
+NUMERIC_DATA_TYPES = ("numeric", "integer")
+DEFAULT_PERCENTILES = [10, 25, 50, 75, 90]
+
+_PERIOD_RE = re.compile(r"^[0-9A-Za-z_-]+$")
+
+# Memory-mapped partitions keyed by path, with the file mtime they were read at
+_snapshot_cache: Dict[str, tuple] = {}
+
+# In-process locks per partition path; fcntl locks serialize the worker processes
+_partition_locks: Dict[str, threading.Lock] = {}
+_partition_locks_lock = threading.Lock()
+
+class SnapshotError(ValueError):
+    """Raised for invalid snapshot queries."""
+
+def snapshot_path(series_id: int, period: str) -> str:
+    if not _PERIOD_RE.match(period):
+        raise SnapshotError(f"Invalid reporting period: {period}")
+    return os.path.join(SNAPSHOT_DIR, f"series_{int(series_id)}", f"{period}.arrow")
+
+def list_snapshot_periods(series_id: int) -> List[str]:
+    directory = os.path.join(SNAPSHOT_DIR, f"series_{int(series_id)}")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".arrow")] for name in os.listdir(directory) if name.endswith(".arrow"))
+
+def load_snapshot(series_id: int, period: str) -> Optional["pa.Table"]:
+    """Open a partition as a zero-copy, memory-mapped Arrow table."""
+    import pyarrow as pa
+
+    path = snapshot_path(series_id, period)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        _snapshot_cache.pop(path, None)
+        return None
+
+    cached = _snapshot_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    _snapshot_cache[path] = (mtime, table)
+    return table
+
+@contextmanager
+def partition_lock(series_id: int, period: str):
+    """Serialize the writers of a partition, across threads and worker processes."""
+    path = snapshot_path(series_id, period)
+    with _partition_locks_lock:
+        lock = _partition_locks.setdefault(path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def write_snapshot(series_id: int, period: str, table: "pa.Table"):
+    """Atomically replace a partition file. Callers hold the partition lock."""
+    import pyarrow as pa
+
+    path = snapshot_path(series_id, period)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A temporary file of its own, so an interrupted writer never clobbers another's
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        os.close(fd)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    _snapshot_cache.pop(path, None)
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _build_table(rows: List[dict], mdrm_ids: List[str]) -> "pa.Table":
+    import pyarrow as pa
+
+    columns = {
+        "report_id": pa.array([row["report_id"] for row in rows], type=pa.int64()),
+        "institution_id": pa.array([row["institution_id"] for row in rows], type=pa.int64()),
+        "institution_type": pa.array([row["institution_type"] for row in rows], type=pa.string())
+    }
+    for mdrm_id in mdrm_ids:
+        columns[mdrm_id] = pa.array([row["values"].get(mdrm_id) for row in rows], type=pa.float64())
+    return pa.table(columns)
+
+def _report_rows(db: Session, report_filter) -> List[dict]:
+    """Load snapshot rows for validated reports matching a filter, pivoting values into dicts."""
+    query = db.query(
+        Report.id, Report.institution_id, Institution.type, MDRMElement.mdrm_id, DataValue.value
+    ).select_from(DataValue).join(
+        Report, DataValue.report_id == Report.id
+    ).join(
+        Institution, Report.institution_id == Institution.id
+    ).join(
+        MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+    ).filter(
+        report_filter,
+        DataValue.is_current(),
+        MDRMElement.data_type.in_(NUMERIC_DATA_TYPES)
+    ).order_by(Report.id)
+
+    rows = {}
+    for report_id, institution_id, institution_type, mdrm_id, value in query.yield_per(5000):
+        row = rows.get(report_id)
+        if row is None:
+            row = rows[report_id] = {
+                "report_id": report_id,
+                "institution_id": institution_id,
+                "institution_type": institution_type,
+                "values": {}
+            }
+        row["values"][mdrm_id] = _to_float(value)
+    return list(rows.values())
+
+def refresh_report_snapshot(db: Session, report: Report):
+    """
+    Bring a report's row in its partition up to date: upsert it when the
+    report is validated, drop it otherwise.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    rows = _report_rows(db, Report.id == report.id) if report.status == "validated" else []
+
+    # Read-modify-write of the partition: concurrent refreshes of a period must not lose each other's rows
+    with partition_lock(report.series_id, report.reporting_period):
+        existing = load_snapshot(report.series_id, report.reporting_period)
+        if existing is not None:
+            existing = existing.filter(pc.not_equal(existing["report_id"], report.id))
+
+        if rows:
+            new_row = _build_table(rows, sorted(rows[0]["values"]))
+            if existing is None:
+                existing = new_row
+            else:
+                existing = pa.concat_tables([existing, new_row], promote_options="default")
+
+        if existing is not None:
+            write_snapshot(report.series_id, report.reporting_period, existing)
+
+def safe_refresh_report_snapshot(db: Session, report: Report):
+    """Refresh a report's snapshot row; failures are logged and never fail the submission."""
+    try:
+        refresh_report_snapshot(db, report)
+    except Exception:
+        logger.exception("Failed to refresh analytics snapshot for report %s", report.id)
+
+def rebuild_snapshots(db: Session, series_id: Optional[int] = None) -> int:
+    """Rebuild partitions from scratch for one or all series. Returns the number of partitions written."""
+    partitions = db.query(Report.series_id, Report.reporting_period).filter(
+        Report.status == "validated"
+    )
+    if series_id is not None:
+        partitions = partitions.filter(Report.series_id == series_id)
+
+    count = 0
+    for partition_series_id, period in partitions.distinct().all():
+        # Rows are read under the lock, so a refresh finishing meanwhile is not overwritten
+        with partition_lock(partition_series_id, period):
+            rows = _report_rows(
+                db,
+                (Report.series_id == partition_series_id)
+                & (Report.reporting_period == period)
+                & (Report.status == "validated")
+            )
+            mdrm_ids = sorted({mdrm_id for row in rows for mdrm_id in row["values"]})
+            write_snapshot(partition_series_id, period, _build_table(rows, mdrm_ids))
+        count += 1
+    return count
+
+def _summarize(values: "pa.Array", percentiles: List[float]) -> dict:
+    import pyarrow.compute as pc
+
+    values = pc.drop_null(values)
+    count = len(values)
+    if count == 0:
+        return {"count": 0}
+    min_max = pc.min_max(values)
+    quantiles = pc.quantile(values, q=[p / 100 for p in percentiles], interpolation="linear")
+    return {
+        "count": count,
+        "sum": pc.sum(values).as_py(),
+        "mean": pc.mean(values).as_py(),
+        "stddev": pc.stddev(values, ddof=1).as_py() if count > 1 else None,
+        "min": min_max["min"].as_py(),
+        "max": min_max["max"].as_py(),
+        "percentiles": {f"p{p:g}": q for p, q in zip(percentiles, quantiles.to_pylist())}
+    }
+
+def query_snapshot(
+    series_id: int,
+    period: str,
+    mdrm_id: str,
+    denominator: Optional[str] = None,
+    group_by: Optional[str] = None,
+    percentiles: Optional[List[float]] = None
+) -> dict:
+    """
+    Compute aggregates and percentiles of an MDRM element (or of the ratio
+    mdrm_id / denominator) across the institutions of a partition.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    percentiles = percentiles or DEFAULT_PERCENTILES
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise SnapshotError("Percentiles must be between 0 and 100")
+    if group_by not in (None, "institution_type"):
+        raise SnapshotError(f"Unsupported group_by: {group_by}")
+
+    table = load_snapshot(series_id, period)
+    if table is None:
+        raise LookupError(f"No snapshot for series {series_id} period {period}")
+    for column in filter(None, (mdrm_id, denominator)):
+        if column not in table.column_names or column in KEY_COLUMNS:
+            raise LookupError(f"MDRM element {column} not in snapshot")
+
+    values = table[mdrm_id]
+    if denominator:
+        divisor = table[denominator]
+        # Ratios with a zero denominator are treated as missing
+        divisor = pc.if_else(pc.equal(divisor, 0), pa.scalar(None, pa.float64()), divisor)
+        values = pc.divide(values, divisor)
+
+    result = {
+        "series_id": series_id,
+        "reporting_period": period,
+        "mdrm_id": mdrm_id,
+        "denominator": denominator,
+        "summary": _summarize(values, percentiles)
+    }
+    if group_by:
+        groups = {}
+        keys = table[group_by]
+        for key in pc.unique(keys).to_pylist():
+            mask = pc.is_null(keys) if key is None else pc.equal(keys, key)
+            groups[str(key)] = _summarize(pc.filter(values, mask), percentiles)
+        result["groups"] = groups
+    return result
@@ -0,0 +1,281 @@
+from typing import Iterable, Iterator, List, Optional
+import csv
+import json
+from io import StringIO
+
+from sqlalchemy.orm import Session
+
+from ..models.base import read_session_factory
+from ..models.mdrm import (
+    Report, Series, Institution, DataValue, MDRMElement,
+    ValidationRule, ValidationResult
+)
+
+# Number of rows fetched from the server-side cursor and written per output chunk
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+REPORT_COLUMNS = [
+    "report_id", "series_id", "institution_id", "institution_identifier",
+    "reporting_period", "status"
+]
+
+DATA_COLUMNS = REPORT_COLUMNS + ["mdrm_id", "value"]
+
+VALIDATION_COLUMNS = REPORT_COLUMNS + [
+    "mdrm_id", "value", "validation_rule_id", "rule_name", "severity", "is_valid", "message"
+]
+
+class ExportFilter:
+    """Selection of reports to export: a series, a period range and/or a set of institutions."""
+
+    def __init__(
+        self,
+        series_id: Optional[int] = None,
+        period_from: Optional[str] = None,
+        period_to: Optional[str] = None,
+        institution_ids: Optional[List[int]] = None
+    ):
+        self.series_id = series_id
+        self.period_from = period_from
+        self.period_to = period_to
+        self.institution_ids = institution_ids
+
+    def apply(self, query):
+        if self.series_id is not None:
+            query = query.filter(Report.series_id == self.series_id)
+        # Periods are formatted like 2023Q1, so they compare correctly as strings
+        if self.period_from:
+            query = query.filter(Report.reporting_period >= self.period_from)
+        if self.period_to:
+            query = query.filter(Report.reporting_period <= self.period_to)
+        if self.institution_ids:
+            query = query.filter(Report.institution_id.in_(self.institution_ids))
+        return query
+
+def _report_columns():
+    return (
+        Report.id,
+        Series.series_id,
+        Report.institution_id,
+        Institution.identifier,
+        Report.reporting_period,
+        Report.status
+    )
+
+def _data_query(db: Session, export_filter: ExportFilter):
+    query = db.query(
+        *_report_columns(),
+        MDRMElement.mdrm_id,
+        DataValue.value
+    ).select_from(DataValue).join(
+        Report, DataValue.report_id == Report.id
+    ).join(
+        Series, Report.series_id == Series.id
+    ).join(
+        Institution, Report.institution_id == Institution.id
+    ).join(
+        MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+    ).filter(DataValue.is_current())
+    return export_filter.apply(query)
+
+def iter_data_rows(db: Session, export_filter: ExportFilter) -> Iterator[tuple]:
+    """Yield one row per data value, streamed through a server-side cursor."""
+    query = _data_query(db, export_filter).order_by(Report.id, MDRMElement.mdrm_id)
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        yield tuple(row)
+
+def get_pivot_columns(db: Session, export_filter: ExportFilter) -> List[str]:
+    """Return the MDRM IDs that become columns of a pivoted export."""
+    query = export_filter.apply(
+        db.query(MDRMElement.mdrm_id).select_from(DataValue).join(
+            Report, DataValue.report_id == Report.id
+        ).join(
+            MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+        ).filter(DataValue.is_current())
+    ).distinct().order_by(MDRMElement.mdrm_id)
+    return [mdrm_id for (mdrm_id,) in query]
+
+def iter_pivot_rows(db: Session, export_filter: ExportFilter, mdrm_ids: List[str]) -> Iterator[tuple]:
+    """
+    Yield one row per report with a column per MDRM element.
+    Rows arrive ordered by report, so only the current report is held in memory.
+    """
+    positions = {mdrm_id: i for i, mdrm_id in enumerate(mdrm_ids)}
+    width = len(REPORT_COLUMNS)
+    current_key = None
+    current_values = None
+    for row in iter_data_rows(db, export_filter):
+        key = row[:width]
+        if key != current_key:
+            if current_key is not None:
+                yield current_key + tuple(current_values)
+            current_key = key
+            current_values = [None] * len(mdrm_ids)
+        mdrm_id, value = row[width], row[width + 1]
+        current_values[positions[mdrm_id]] = value
+    if current_key is not None:
+        yield current_key + tuple(current_values)
+
+def iter_validation_rows(db: Session, export_filter: ExportFilter) -> Iterator[tuple]:
+    """
+    Yield one row per stored validation result, streamed through a server-side
+    cursor. Under compact storage only failing results are stored.
+    """
+    query = db.query(
+        *_report_columns(),
+        MDRMElement.mdrm_id,
+        DataValue.value,
+        ValidationResult.validation_rule_id,
+        ValidationRule.name,
+        ValidationRule.severity,
+        ValidationResult.is_valid,
+        ValidationResult.message
+    ).select_from(ValidationResult).join(
+        DataValue, ValidationResult.data_value_id == DataValue.id
+    ).join(
+        Report, DataValue.report_id == Report.id
+    ).join(
+        Series, Report.series_id == Series.id
+    ).join(
+        Institution, Report.institution_id == Institution.id
+    ).join(
+        MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+    ).join(
+        ValidationRule, ValidationResult.validation_rule_id == ValidationRule.id
+    ).filter(DataValue.is_current())
+    query = export_filter.apply(query).order_by(Report.id, ValidationResult.id)
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        yield tuple(row)
+
+def stream_csv(columns: List[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    """Encode rows as CSV, yielding one chunk per batch of rows."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def stream_ndjson(columns: List[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON objects, yielding one chunk per batch of rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=str))
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the streaming generator."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_parquet(columns: List[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    """
+    Encode rows as Parquet, writing one row group per batch of rows.
+    All columns are written as strings, matching how data values are stored.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write_batch(batch):
+        arrays = [
+            pa.array([None if row[i] is None else str(row[i]) for row in batch], type=pa.string())
+            for i in range(len(columns))
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            write_batch(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.drain()
+
+ENCODERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "parquet": stream_parquet
+}
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def stream_export(
+    kind: str,
+    export_format: str,
+    export_filter: ExportFilter,
+    pivot: bool = False,
+    username: Optional[str] = None,
+    last_write: Optional[str] = None
+) -> Iterator[bytes]:
+    """
+    Stream an export of report data ("data") or validation results ("validation").
+    Uses its own read session, since the response body is produced after the
+    request dependencies have been cleaned up; username and last_write (the
+    client's read-your-writes cookie) route it like get_read_db.
+    """
+    db = read_session_factory(username, last_write)()
+    try:
+        if kind == "validation":
+            columns, rows = VALIDATION_COLUMNS, iter_validation_rows(db, export_filter)
+        elif pivot:
+            mdrm_ids = get_pivot_columns(db, export_filter)
+            columns, rows = REPORT_COLUMNS + mdrm_ids, iter_pivot_rows(db, export_filter, mdrm_ids)
+        else:
+            columns, rows = DATA_COLUMNS, iter_data_rows(db, export_filter)
+
+        for chunk in ENCODERS[export_format](columns, rows):
+            if chunk:
+                yield chunk
+    finally:
+        db.close()
@@ -0,0 +1,110 @@
+"""
+Batched loading of other series' reports for cross-series rule references.
+
+A reference like FFIEC031:RCFD1480 resolves against the report of series
+FFIEC 031 filed by the same institution for the same period. All foreign
+reports needed by a validation are loaded in one query, and a cache instance
+can be shared by the validations of a batch run so each is loaded only once.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+import hashlib
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import Report, Series, DataValue, MDRMElement, ValidationRule, series_mdrm_association
+from .rule_graph import series_key
+
+class ForeignReportCache:
+    """Values of foreign reports keyed by (series ID, institution ID, reporting period)."""
+
+    def __init__(self):
+        # None marks a report that was looked up and does not exist
+        self.reports: Dict[tuple, Optional[Dict[str, Tuple[str, str]]]] = {}
+        self._series_ids: Optional[Dict[str, int]] = None
+
+    def series_id_for(self, db: Session, qualifier: str) -> Optional[int]:
+        """Resolve a reference qualifier like FFIEC031 to a series primary key."""
+        if self._series_ids is None:
+            self._series_ids = {
+                series_key(code): series_id for series_id, code in db.query(Series.id, Series.series_id)
+            }
+        return self._series_ids.get(qualifier)
+
+    def load(self, db: Session, institution_id: int, period: str, series_ids: Iterable[int]):
+        """Load the latest report of each series for an institution and period, in one query."""
+        missing = [
+            series_id for series_id in set(series_ids)
+            if (series_id, institution_id, period) not in self.reports
+        ]
+        if not missing:
+            return
+
+        for series_id in missing:
+            self.reports[(series_id, institution_id, period)] = None
+
+        rows = db.query(
+            Report.id, Report.series_id, MDRMElement.mdrm_id, DataValue.value, MDRMElement.data_type
+        ).select_from(DataValue).join(
+            Report, DataValue.report_id == Report.id
+        ).join(
+            MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+        ).filter(
+            Report.series_id.in_(missing),
+            Report.institution_id == institution_id,
+            Report.reporting_period == period,
+            DataValue.is_current()
+        ).order_by(Report.id)
+
+        # Rows are ordered by report, so a later report of the same series replaces an earlier one
+        latest_report = {}
+        for report_id, series_id, mdrm_id, value, data_type in rows:
+            key = (series_id, institution_id, period)
+            if latest_report.get(series_id) != report_id:
+                latest_report[series_id] = report_id
+                self.reports[key] = {}
+            self.reports[key][mdrm_id] = (value, data_type)
+
+    def get(self, series_id: int, institution_id: int, period: str) -> Optional[Dict[str, Tuple[str, str]]]:
+        return self.reports.get((series_id, institution_id, period))
+
+def has_peer_rules(db: Session, series_id: int) -> bool:
+    """True if any element of the series has a peer rule."""
+    return db.query(ValidationRule.id).join(
+        series_mdrm_association,
+        series_mdrm_association.c.mdrm_element_id == ValidationRule.mdrm_element_id
+    ).filter(
+        series_mdrm_association.c.series_id == series_id,
+        ValidationRule.rule_type == "peer"
+    ).first() is not None
+
+def get_dependency_version(db: Session, report: Report) -> str:
+    """
+    Version of the other reports a report's rules can see: the other series'
+    reports of the period, for cross-series rules, the earlier periods of
+    the series, for historical rules, and, if the series has peer rules, the
+    other reports counted in the peer statistics of the period. Changes
+    whenever one of them is created, removed or resubmitted, or a peer
+    report enters or leaves the statistics.
+    """
+    seen = [
+        and_(Report.institution_id == report.institution_id, or_(
+            and_(Report.reporting_period == report.reporting_period, Report.series_id != report.series_id),
+            and_(Report.series_id == report.series_id, Report.reporting_period < report.reporting_period)
+        ))
+    ]
+    if has_peer_rules(db, report.series_id):
+        seen.append(and_(
+            Report.series_id == report.series_id,
+            Report.reporting_period == report.reporting_period,
+            Report.peer_group.isnot(None),
+            Report.id != report.id
+        ))
+    rows = db.query(Report.id, Report.data_version, Report.peer_group).filter(
+        or_(*seen)
+    ).order_by(Report.id).all()
+    
+    digest = hashlib.sha256()
+    for report_id, data_version, peer_group in rows:
+        digest.update(f"{report_id}:{data_version or 0}:{peer_group or ''}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
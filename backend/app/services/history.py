@@ -0,0 +1,229 @@
+"""
+Rolling-window cache of an institution's previously filed values.
+
+Historical rules of one validation share a single window holding the last K
+periods filed by the institution for the series, loaded with two queries.
+Windows are kept in a process-wide LRU bounded by the number of cached
+values, and are reloaded when any earlier report of the institution was
+resubmitted since the window was loaded.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import re
+import threading
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import Report, DataValue, period_year
+
+# Upper bound on the number of data values held by the cache across all windows
+MAX_CACHED_VALUES = 2_000_000
+
+_YEAR_RE = re.compile(r"^(\d{4})(.*)$")
+
+def periods_per_year(period: str) -> int:
+    """Number of periods per year implied by a period label like 2023Q1, 2023M01 or 2023."""
+    match = _YEAR_RE.match(period or "")
+    suffix = match.group(2) if match else ""
+    if suffix.upper().startswith("Q"):
+        return 4
+    if suffix.upper().startswith("M") or suffix.startswith("-"):
+        return 12
+    return 1
+
+def same_period_last_year(period: str) -> Optional[str]:
+    """Shift a period label back by one year, e.g. 2023Q1 -> 2022Q1."""
+    match = _YEAR_RE.match(period or "")
+    if not match:
+        return None
+    return f"{int(match.group(1)) - 1:04d}{match.group(2)}"
+
+class HistoryWindow:
+    """Values of the last periods before a report, most recent period first."""
+
+    def __init__(self, periods: List[str], values: List[Dict[int, str]], stamp: Optional[tuple], complete: bool):
+        self.periods = periods
+        self.values = values
+        self.stamp = stamp
+        self.complete = complete  # True when no earlier periods exist beyond the window
+        self.size = sum(len(period_values) for period_values in values)
+
+    def series(self, mdrm_element_id: int, last: int) -> List[str]:
+        """Values of an element over the last N periods, skipping periods without a value."""
+        return [
+            period_values[mdrm_element_id]
+            for period_values in self.values[:last]
+            if mdrm_element_id in period_values
+        ]
+
+    def value_for_period(self, mdrm_element_id: int, period: str) -> Optional[str]:
+        if period not in self.periods:
+            return None
+        return self.values[self.periods.index(period)].get(mdrm_element_id)
+
+class HistoryCache:
+    """Process-wide LRU of history windows keyed by (series, institution, period)."""
+
+    def __init__(self, max_values: int = MAX_CACHED_VALUES):
+        self.max_values = max_values
+        self.windows: "OrderedDict[tuple, HistoryWindow]" = OrderedDict()
+        self.total_values = 0
+        self.lock = threading.Lock()
+
+    def _history_stamp(self, db: Session, report: Report) -> tuple:
+        # Changes whenever an earlier report is added, removed or resubmitted
+        count, version_sum = db.query(
+            func.count(Report.id), func.coalesce(func.sum(Report.data_version), 0)
+        ).filter(
+            Report.series_id == report.series_id,
+            Report.institution_id == report.institution_id,
+            Report.reporting_period < report.reporting_period
+        ).one()
+        return (count, version_sum)
+
+    def get_window(self, db: Session, report: Report, periods: int) -> HistoryWindow:
+        """Return a window covering at least the last N periods before the report."""
+        key = (report.series_id, report.institution_id, report.reporting_period)
+        stamp = self._history_stamp(db, report)
+        with self.lock:
+            window = self.windows.get(key)
+            if (
+                window is not None and window.stamp == stamp
+                and (window.complete or len(window.periods) >= periods)
+            ):
+                self.windows.move_to_end(key)
+                return window
+
+        window = load_window(db, report, periods, stamp)
+        with self.lock:
+            self._discard(key)
+            self.windows[key] = window
+            self.total_values += window.size
+            while self.total_values > self.max_values and len(self.windows) > 1:
+                self._discard(next(iter(self.windows)))
+        return window
+
+    def clear(self):
+        """Drop every cached window, e.g. after data values were detached or attached."""
+        with self.lock:
+            self.windows.clear()
+            self.total_values = 0
+
+    def invalidate(self, series_id: int, institution_id: int):
+        """Drop every cached window of an institution's series, e.g. after a resubmission."""
+        with self.lock:
+            for key in [key for key in self.windows if key[:2] == (series_id, institution_id)]:
+                self._discard(key)
+
+    def _discard(self, key: tuple):
+        window = self.windows.pop(key, None)
+        if window is not None:
+            self.total_values -= window.size
+
+def load_window(db: Session, report: Report, periods: int, stamp: tuple) -> HistoryWindow:
+    """Load the last N periods before a report: one query for the reports, one for their values."""
+    earlier_reports = db.query(Report.id, Report.reporting_period).filter(
+        Report.series_id == report.series_id,
+        Report.institution_id == report.institution_id,
+        Report.reporting_period < report.reporting_period
+    ).order_by(Report.reporting_period.desc(), Report.id.desc()).all()
+
+    # Keep the latest report of each of the last N periods
+    report_ids: List[int] = []
+    period_labels: List[str] = []
+    complete = True
+    for report_id, period in earlier_reports:
+        if period_labels and period_labels[-1] == period:
+            continue
+        if len(period_labels) == periods:
+            complete = False
+            break
+        report_ids.append(report_id)
+        period_labels.append(period)
+
+    values_by_report: Dict[int, Dict[int, str]] = {report_id: {} for report_id in report_ids}
+    if report_ids:
+        # Only the partitions of the window's years are read
+        rows = db.query(DataValue.report_id, DataValue.mdrm_element_id, DataValue.value).filter(
+            DataValue.report_id.in_(report_ids),
+            DataValue.reporting_year.in_({period_year(period) for period in period_labels}),
+            DataValue.is_current()
+        )
+        for report_id, mdrm_element_id, value in rows:
+            values_by_report[report_id][mdrm_element_id] = value
+
+    return HistoryWindow(
+        period_labels, [values_by_report[report_id] for report_id in report_ids], stamp, complete
+    )
+
+def load_windows(db: Session, reports: List[Report], element_ids: List[int]) -> Dict[int, HistoryWindow]:
+    """
+    Load the complete history of many reports at once, limited to some
+    elements: one query for the earlier reports of all their institutions,
+    one for the values. Returns a window per report ID. The windows are not
+    cached, so batch runs such as rule dry runs do not evict the windows of
+    live validation.
+    """
+    pairs = {(report.series_id, report.institution_id) for report in reports}
+    if not pairs:
+        return {}
+    latest_period = max(report.reporting_period for report in reports)
+    earlier_reports = db.query(
+        Report.id, Report.series_id, Report.institution_id, Report.reporting_period
+    ).filter(
+        tuple_(Report.series_id, Report.institution_id).in_(pairs),
+        Report.reporting_period < latest_period
+    ).order_by(Report.reporting_period.desc(), Report.id.desc()).all()
+
+    # Latest report of each period, most recent first, per institution's series
+    filed: Dict[tuple, List[Tuple[int, str]]] = {pair: [] for pair in pairs}
+    for report_id, series_id, institution_id, period in earlier_reports:
+        periods = filed[(series_id, institution_id)]
+        if not periods or periods[-1][1] != period:
+            periods.append((report_id, period))
+
+    values_by_report: Dict[int, Dict[int, str]] = {}
+    report_ids = [report_id for periods in filed.values() for report_id, _ in periods]
+    if report_ids:
+        rows = db.query(DataValue.report_id, DataValue.mdrm_element_id, DataValue.value).join(
+            Report, Report.id == DataValue.report_id
+        ).filter(
+            tuple_(Report.series_id, Report.institution_id).in_(pairs),
+            Report.reporting_period < latest_period,
+            DataValue.reporting_year.in_({period_year(period) for _, _, _, period in earlier_reports}),
+            DataValue.mdrm_element_id.in_(element_ids),
+            DataValue.is_current()
+        )
+        for report_id, mdrm_element_id, value in rows:
+            values_by_report.setdefault(report_id, {})[mdrm_element_id] = value
+
+    windows = {}
+    for report in reports:
+        window = [
+            (report_id, period) for report_id, period in filed[(report.series_id, report.institution_id)]
+            if period < report.reporting_period
+        ]
+        windows[report.id] = HistoryWindow(
+            [period for _, period in window],
+            [values_by_report.get(report_id, {}) for report_id, _ in window],
+            None, True
+        )
+    return windows
+
+history_cache = HistoryCache()
+
+def parse_history_reference(reference: str) -> Tuple[str, int]:
+    """
+    Parse the historical part of a rule into (aggregate, number of periods).
+    previous_period is ("last", 1) and same_period_last_year is ("last_year", 0).
+    """
+    reference = reference.strip().lower()
+    if reference == "previous_period":
+        return "last", 1
+    if reference == "same_period_last_year":
+        return "last_year", 0
+    match = re.match(r"^(avg|max|min)\(\s*last\s+(\d+)\s+periods?\s*\)$", reference)
+    if not match or int(match.group(2)) < 1:
+        raise ValueError(f"Unknown historical reference: {reference}")
+    return match.group(1), int(match.group(2))
@@ -0,0 +1,35 @@
+from typing import Iterable, List, Tuple
+
+from ..models.mdrm import Series
+
+def get_series_element_ids(series: Series) -> dict:
+    """Map MDRM IDs of a series to MDRM element primary keys."""
+    return {elem.mdrm_id: elem.id for elem in series.mdrm_elements}
+
+def parse_csv_rows(rows: Iterable[dict], series: Series) -> Tuple[List[dict], List[str]]:
+    """
+    Convert mdrm_id,value CSV rows into data value dicts for a series.
+    Returns (data_values, errors).
+    """
+    mdrm_elements = get_series_element_ids(series)
+    data_values = []
+    errors = []
+    
+    for row in rows:
+        mdrm_id = row.get('mdrm_id')
+        value = row.get('value')
+        
+        if not mdrm_id or not value:
+            errors.append(f"Missing mdrm_id or value in row: {row}")
+            continue
+        
+        if mdrm_id not in mdrm_elements:
+            errors.append(f"MDRM ID {mdrm_id} not found in series {series.series_id}")
+            continue
+        
+        data_values.append({
+            "mdrm_element_id": mdrm_elements[mdrm_id],
+            "value": value
+        })
+    
+    return data_values, errors
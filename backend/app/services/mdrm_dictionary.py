@@ -0,0 +1,184 @@
+"""
+Bulk import of the Federal Reserve MDRM data dictionary.
+
+Accepts the published MDRM_CSV.csv (or the zip it is distributed in) and
+also a plain CSV with the MDRMElement column names. Rows are streamed and
+upserted in batches: the existing elements of a batch are found with IN
+queries, then one bulk UPDATE and one bulk INSERT write the batch. Afterwards the
+memberships of every series named in the "Reporting Form" column are
+replaced with the imported items in one diff.
+"""
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, Optional, Set
+import csv
+import io
+import time
+import zipfile
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import MDRMElement, Series
+from .rule_graph import series_key
+from .series_members import chunked, replace_series_members
+
+IMPORT_BATCH_SIZE = 5000
+
+# ItemType codes of the MDRM dictionary that are not amounts
+TEXT_ITEM_TYPES = {"S"}
+
+ELEMENT_FIELDS = ("name", "description", "data_type", "item_code", "form_type")
+
+# Fields the MDRMElement schema requires as strings
+REQUIRED_TEXT_FIELDS = ("name", "description")
+
+class DictionaryImportError(ValueError):
+    """Raised for files that are not an MDRM dictionary."""
+
+def _open_text(file: IO[bytes]) -> IO[str]:
+    """Open a CSV or a zip containing one as a text stream, without reading it into memory."""
+    head = file.read(4)
+    file.seek(0)
+    if head.startswith(b"PK"):
+        archive = zipfile.ZipFile(file)
+        members = [name for name in archive.namelist() if name.lower().endswith(".csv")]
+        if not members:
+            raise DictionaryImportError("Zip file does not contain a CSV file")
+        file = archive.open(members[0])
+    return io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    value = (value or "").strip()
+    for date_format in ("%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+def iter_dictionary_rows(file: IO[bytes], active_only: bool = True) -> Iterator[dict]:
+    """Yield one normalized element per dictionary row, with the series it is reported on."""
+    text = _open_text(file)
+    header_line = text.readline()
+    if "Mnemonic" not in header_line and "mdrm_id" not in header_line:
+        # The published file starts with a "PUBLIC" line before the header
+        header_line = text.readline()
+    header = next(csv.reader([header_line]), None)
+    if not header or not ({"Mnemonic", "Item Code"} <= set(header) or "mdrm_id" in header):
+        raise DictionaryImportError("Missing MDRM dictionary header")
+
+    now = datetime.now()
+    for row in csv.DictReader(text, fieldnames=header):
+        if "mdrm_id" in row:
+            mdrm_id = (row.get("mdrm_id") or "").strip().upper()
+            element = {field: (row.get(field) or "").strip() or None for field in ELEMENT_FIELDS}
+            for field in REQUIRED_TEXT_FIELDS:
+                element[field] = element[field] or ""
+            element["data_type"] = element["data_type"] or "numeric"
+            forms = element["form_type"]
+            start = None
+        else:
+            mnemonic = (row.get("Mnemonic") or "").strip().upper()
+            item_code = (row.get("Item Code") or "").strip().upper()
+            end = _parse_date(row.get("End Date"))
+            if active_only and end is not None and end < now:
+                continue
+            mdrm_id = mnemonic + item_code
+            forms = (row.get("Reporting Form") or "").strip()
+            element = {
+                "name": (row.get("Item Name") or "").strip(),
+                "description": (row.get("Description") or "").strip(),
+                "data_type": "text" if (row.get("ItemType") or "").strip().upper() in TEXT_ITEM_TYPES else "numeric",
+                "item_code": item_code or None,
+                "form_type": forms or None
+            }
+            start = _parse_date(row.get("Start Date"))
+        if not mdrm_id:
+            continue
+        element["mdrm_id"] = mdrm_id
+        element["series_keys"] = {series_key(form) for form in (forms or "").split(",") if form.strip()}
+        element["start"] = start
+        yield element
+
+def _write_batch(db: Session, batch: Dict[str, dict]) -> tuple:
+    existing = {}
+    for chunk in chunked(list(batch)):
+        existing.update(db.query(MDRMElement.mdrm_id, MDRMElement.id).filter(MDRMElement.mdrm_id.in_(chunk)))
+    updates = []
+    inserts = []
+    for mdrm_id, element in batch.items():
+        values = {field: element[field] for field in ELEMENT_FIELDS}
+        if mdrm_id in existing:
+            updates.append({"id": existing[mdrm_id], **values})
+        else:
+            inserts.append({"mdrm_id": mdrm_id, **values})
+
+    if updates:
+        db.execute(update(MDRMElement), updates)
+    if inserts:
+        db.execute(insert(MDRMElement), inserts)
+    return len(inserts), len(updates)
+
+def import_dictionary(
+    db: Session,
+    file: IO[bytes],
+    active_only: bool = True,
+    update_series: bool = True
+) -> dict:
+    """
+    Upsert every element of an MDRM dictionary file and, unless disabled,
+    rebuild the memberships of the series it names. Commits once at the end.
+    """
+    started = time.perf_counter()
+    inserted = updated = 0
+    # Start date and series of the listing kept for each item so far, across batches
+    kept: Dict[str, tuple] = {}
+
+    batch: Dict[str, dict] = {}
+    for element in iter_dictionary_rows(file, active_only=active_only):
+        mdrm_id = element["mdrm_id"]
+        start = element["start"] or datetime.min
+        # An item may be listed once per validity period; keep the most recent one.
+        # A newer listing in a later batch updates the row an earlier batch wrote.
+        if mdrm_id in kept and start < kept[mdrm_id][0]:
+            continue
+        kept[mdrm_id] = (start, element["series_keys"])
+        batch[mdrm_id] = element
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            batch_inserted, batch_updated = _write_batch(db, batch)
+            inserted += batch_inserted
+            updated += batch_updated
+            batch = {}
+    if batch:
+        batch_inserted, batch_updated = _write_batch(db, batch)
+        inserted += batch_inserted
+        updated += batch_updated
+
+    series_mdrm_ids: Dict[str, Set[str]] = {}
+    for mdrm_id, (_, series_keys) in kept.items():
+        for key in series_keys:
+            series_mdrm_ids.setdefault(key, set()).add(mdrm_id)
+
+    added = removed = 0
+    series_updated: List[str] = []
+    if update_series and series_mdrm_ids:
+        series_by_key = {series_key(code): (series_id, code) for series_id, code in db.query(Series.id, Series.series_id)}
+        wanted = {key: ids for key, ids in series_mdrm_ids.items() if key in series_by_key}
+        if wanted:
+            element_ids = dict(db.query(MDRMElement.mdrm_id, MDRMElement.id))
+            memberships = {
+                series_by_key[key][0]: {element_ids[mdrm_id] for mdrm_id in mdrm_ids}
+                for key, mdrm_ids in wanted.items()
+            }
+            added, removed = replace_series_members(db, memberships)
+            series_updated = sorted(series_by_key[key][1] for key in wanted)
+
+    db.commit()
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "series_updated": series_updated,
+        "memberships_added": added,
+        "memberships_removed": removed,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -0,0 +1,167 @@
+"""
+Full-text search over MDRM elements.
+
+On SQLite the index is an FTS5 table over mdrm_elements, kept in sync by
+triggers, so bulk imports and ORM writes are both covered. On Postgres it
+is a generated tsvector column with a GIN index. Both are created by the
+migration step (python -m app.utils.migrate); without an index, search
+falls back to LIKE filtering.
+"""
+from typing import List, Tuple
+import re
+
+from sqlalchemy import inspect, or_, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import MDRMElement
+
+FTS_TABLE = "mdrm_elements_fts"
+SEARCH_COLUMNS = ("mdrm_id", "name", "description", "item_code", "form_type")
+
+# bm25 weights in SEARCH_COLUMNS order: identifier matches rank first
+FTS_WEIGHTS = (10.0, 5.0, 1.0, 3.0, 2.0)
+
+MAX_SEARCH_TERMS = 8
+
+# Shorter last words are matched whole, since a one-letter prefix matches
+# most of the dictionary and ranking all of it is slow
+MIN_PREFIX_LENGTH = 2
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Engines known to have the search index; the index is never dropped once created
+_indexed_engines = set()
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {", ".join(SEARCH_COLUMNS)},
+        content='mdrm_elements', content_rowid='id',
+        tokenize='unicode61', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS mdrm_elements_fts_insert AFTER INSERT ON mdrm_elements BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + column for column in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS mdrm_elements_fts_delete AFTER DELETE ON mdrm_elements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + column for column in SEARCH_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS mdrm_elements_fts_update AFTER UPDATE ON mdrm_elements BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.id, {", ".join("old." + column for column in SEARCH_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {", ".join(SEARCH_COLUMNS)})
+        VALUES (new.id, {", ".join("new." + column for column in SEARCH_COLUMNS)});
+    END"""
+]
+
+_POSTGRES_DOCUMENT = " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS)
+
+_POSTGRES_DDL = [
+    f"""ALTER TABLE mdrm_elements ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', {_POSTGRES_DOCUMENT})) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_mdrm_elements_search_vector ON mdrm_elements USING GIN (search_vector)"
+]
+
+def ensure_search_index(connection: Connection) -> List[str]:
+    """Create the search index if it is missing. Returns a description of each change."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        if inspect(connection).has_table(FTS_TABLE):
+            return []
+        for statement in _SQLITE_DDL:
+            connection.exec_driver_sql(statement)
+        # Index the elements that existed before the triggers
+        connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        return [f"Created search index {FTS_TABLE}"]
+    if dialect == "postgresql":
+        columns = {column["name"] for column in inspect(connection).get_columns("mdrm_elements")}
+        if "search_vector" in columns:
+            return []
+        for statement in _POSTGRES_DDL:
+            connection.exec_driver_sql(statement)
+        return ["Created search index on mdrm_elements.search_vector"]
+    return []
+
+def search_terms(query: str) -> List[str]:
+    return _TERM_RE.findall(query.lower())[:MAX_SEARCH_TERMS]
+
+def _search_index_available(db: Session) -> bool:
+    bind = db.get_bind()
+    if bind.url in _indexed_engines:
+        return True
+    if bind.dialect.name == "sqlite":
+        available = inspect(bind).has_table(FTS_TABLE)
+    elif bind.dialect.name == "postgresql":
+        available = "search_vector" in {column["name"] for column in inspect(bind).get_columns("mdrm_elements")}
+    else:
+        available = False
+    if available:
+        _indexed_engines.add(bind.url)
+    return available
+
+def _search_sqlite(db: Session, terms: List[str], skip: int, limit: int) -> Tuple[int, List[int]]:
+    # Every term must match, the last one as a prefix of a word
+    quoted = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        quoted[-1] += "*"
+    match = " AND ".join(quoted)
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    total = db.execute(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"), {"match": match}
+    ).scalar()
+    ids = [row[0] for row in db.execute(
+        text(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT :limit OFFSET :skip"
+        ),
+        {"match": match, "limit": limit, "skip": skip}
+    )]
+    return total, ids
+
+def _search_postgres(db: Session, terms: List[str], skip: int, limit: int) -> Tuple[int, List[int]]:
+    last = terms[-1] + ":*" if len(terms[-1]) >= MIN_PREFIX_LENGTH else terms[-1]
+    tsquery = " & ".join(terms[:-1] + [last])
+    total = db.execute(
+        text("SELECT count(*) FROM mdrm_elements WHERE search_vector @@ to_tsquery('simple', :query)"),
+        {"query": tsquery}
+    ).scalar()
+    ids = [row[0] for row in db.execute(
+        text(
+            "SELECT id FROM mdrm_elements WHERE search_vector @@ to_tsquery('simple', :query) "
+            "ORDER BY ts_rank(search_vector, to_tsquery('simple', :query)) DESC, mdrm_id "
+            "LIMIT :limit OFFSET :skip"
+        ),
+        {"query": tsquery, "limit": limit, "skip": skip}
+    )]
+    return total, ids
+
+def _search_like(db: Session, terms: List[str], skip: int, limit: int) -> Tuple[int, List[int]]:
+    query = db.query(MDRMElement.id)
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.filter(or_(*(getattr(MDRMElement, column).ilike(pattern) for column in SEARCH_COLUMNS)))
+    total = query.count()
+    ids = [element_id for (element_id,) in query.order_by(MDRMElement.mdrm_id).offset(skip).limit(limit)]
+    return total, ids
+
+def search_elements(db: Session, query: str, skip: int = 0, limit: int = 50) -> Tuple[int, List[MDRMElement]]:
+    """
+    Ranked search of MDRM elements. All words must match; the last word
+    matches as a prefix, so results update while the user types.
+    Returns (total matches, elements of the requested page).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return 0, []
+
+    dialect = db.get_bind().dialect.name
+    if not _search_index_available(db):
+        total, ids = _search_like(db, terms, skip, limit)
+    elif dialect == "sqlite":
+        total, ids = _search_sqlite(db, terms, skip, limit)
+    else:
+        total, ids = _search_postgres(db, terms, skip, limit)
+
+    elements = {elem.id: elem for elem in db.query(MDRMElement).filter(MDRMElement.id.in_(ids))} if ids else {}
+    return total, [elements[element_id] for element_id in ids if element_id in elements]
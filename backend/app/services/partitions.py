@@ -0,0 +1,297 @@
+"""
+Partitioning of data values by reporting year.
+
+Every data value carries the year of its report's period (reporting_year,
+0 for undated periods), and report reads and history loads filter on it,
+so they only touch the partitions of the periods they ask for.
+
+On Postgres data_values is partitioned by range of reporting_year, one
+partition per year named data_values_y<year>; a year's partition is created
+before its first value is written, and the migration step converts an
+existing table. On SQLite the live years share the data_values table, where
+the year filter is served by the indexes. On both, an old year can be
+detached: the Postgres partition becomes a standalone table, on SQLite the
+values move to a database file of their own (data_values_<year>.db in
+DATA_VALUE_ARCHIVE_DIR, by default a partitions directory next to the
+database), and the table's ids are AUTOINCREMENT so that the ids of
+detached values are not handed out again. The application no longer sees
+detached values: reports of that year read as empty and cannot be
+resubmitted, and historical rules treat them as missing, until the year
+is attached again. Validation results are kept in place.
+"""
+from typing import List, Optional
+import os
+import re
+import threading
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import DataValue, Report, period_year
+
+ARCHIVE_DIR = os.environ.get("DATA_VALUE_ARCHIVE_DIR")
+
+_ARCHIVE_FILE_RE = re.compile(r"^data_values_(\d{4})\.db$")
+
+# (database URL, year) of Postgres partitions known to be attached
+_attached_partitions = set()
+_attached_partitions_lock = threading.Lock()
+
+class PartitionError(ValueError):
+    """Raised for partition operations that cannot be carried out."""
+
+def partition_name(year: int) -> str:
+    return f"data_values_y{year:04d}"
+
+def backfill_reporting_years(connection: Connection) -> int:
+    """Set the partition key of data values written before it existed. Returns the number of rows updated."""
+    period_prefix = func.substr(Report.reporting_period, 1, 4)
+    updated = 0
+    for (prefix,) in connection.execute(select(period_prefix).distinct()).all():
+        reports = select(Report.id).where(period_prefix == prefix if prefix is not None else period_prefix.is_(None))
+        updated += connection.execute(update(DataValue).where(
+            DataValue.reporting_year.is_(None),
+            DataValue.report_id.in_(reports)
+        ).values(reporting_year=period_year(prefix))).rowcount
+    # Values of reports that no longer exist
+    updated += connection.execute(
+        update(DataValue).where(DataValue.reporting_year.is_(None)).values(reporting_year=0)
+    ).rowcount
+    return updated
+
+def _postgres_partition_state(connection: Connection, year: int) -> Optional[bool]:
+    """True if the year's partition is attached, False if it is detached, None if it does not exist."""
+    return connection.exec_driver_sql(
+        "SELECT relispartition FROM pg_class WHERE oid = to_regclass(%(name)s)", {"name": partition_name(year)}
+    ).scalar()
+
+def _create_postgres_partition(connection: Connection, year: int):
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF data_values "
+        f"FOR VALUES FROM ({year}) TO ({year + 1})"
+    )
+
+def _partition_postgres_table(connection: Connection):
+    """Replace the plain data_values table with one partitioned by reporting_year, keeping ids."""
+    years = [row[0] for row in connection.exec_driver_sql("SELECT DISTINCT reporting_year FROM data_values")]
+    sequence = connection.exec_driver_sql("SELECT pg_get_serial_sequence('data_values', 'id')").scalar()
+    for statement in [
+        "ALTER TABLE data_values RENAME TO data_values_unpartitioned",
+        # A foreign key to a partitioned table must include the partition key
+        "ALTER TABLE validation_results DROP CONSTRAINT IF EXISTS validation_results_data_value_id_fkey",
+        "CREATE TABLE data_values (LIKE data_values_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (reporting_year)",
+        "ALTER TABLE data_values ALTER COLUMN reporting_year SET NOT NULL",
+        "ALTER TABLE data_values ADD PRIMARY KEY (id, reporting_year)",
+        "ALTER TABLE data_values ADD FOREIGN KEY (report_id) REFERENCES reports (id)",
+        "ALTER TABLE data_values ADD FOREIGN KEY (mdrm_element_id) REFERENCES mdrm_elements (id)"
+    ]:
+        connection.exec_driver_sql(statement)
+    for year in years:
+        _create_postgres_partition(connection, year)
+    connection.exec_driver_sql("INSERT INTO data_values SELECT * FROM data_values_unpartitioned")
+    if sequence:
+        connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY data_values.id")
+    connection.exec_driver_sql("DROP TABLE data_values_unpartitioned")
+    # Indexes of a partitioned table are created on every partition
+    for index in DataValue.__table__.indexes:
+        index.create(connection)
+
+def _sqlite_autoincrement(connection: Connection) -> bool:
+    table_sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'data_values'"
+    ).scalar()
+    return "AUTOINCREMENT" in (table_sql or "").upper()
+
+def _rebuild_sqlite_table(connection: Connection):
+    """Recreate data_values with AUTOINCREMENT, keeping ids, so ids of detached values are never reused."""
+    columns = ", ".join(column.name for column in DataValue.__table__.columns)
+    indexes = connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'data_values' AND sql IS NOT NULL"
+    ).scalars().all()
+    for index in indexes:
+        connection.exec_driver_sql(f"DROP INDEX {index}")
+    # Keeps the references of validation_results pointing at data_values
+    connection.exec_driver_sql("PRAGMA legacy_alter_table = ON")
+    try:
+        connection.exec_driver_sql("ALTER TABLE data_values RENAME TO data_values_rowid")
+    finally:
+        connection.exec_driver_sql("PRAGMA legacy_alter_table = OFF")
+    DataValue.__table__.create(connection)
+    connection.exec_driver_sql(f"INSERT INTO data_values ({columns}) SELECT {columns} FROM data_values_rowid")
+    connection.exec_driver_sql("DROP TABLE data_values_rowid")
+
+def ensure_partitions(connection: Connection) -> List[str]:
+    """
+    Migration step: fill in the partition key, partition the table on
+    Postgres and make its ids never reused on SQLite. Returns a
+    description of each change.
+    """
+    changes = []
+    updated = backfill_reporting_years(connection)
+    if updated:
+        changes.append(f"Set reporting_year of {updated} data values")
+    if connection.dialect.name == "sqlite" and not _sqlite_autoincrement(connection):
+        _rebuild_sqlite_table(connection)
+        changes.append("Rebuilt data_values with AUTOINCREMENT ids")
+    if connection.dialect.name == "postgresql":
+        relkind = connection.exec_driver_sql("SELECT relkind FROM pg_class WHERE oid = to_regclass('data_values')").scalar()
+        if relkind != "p":
+            _partition_postgres_table(connection)
+            changes.append("Partitioned data_values by reporting_year")
+    return changes
+
+def archive_path(engine: Engine, year: int) -> str:
+    """Database file holding the detached values of a year on SQLite."""
+    database = engine.url.database
+    if not database or database == ":memory:":
+        raise PartitionError("Partitions can only be detached from a file database")
+    directory = ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(database)), "partitions")
+    return os.path.join(directory, f"data_values_{year:04d}.db")
+
+def is_detached(db: Session, year: int) -> bool:
+    """True if the data values of a year are detached."""
+    bind = db.get_bind()
+    if bind.dialect.name == "sqlite":
+        return bool(bind.url.database) and bind.url.database != ":memory:" and os.path.exists(archive_path(bind, year))
+    if bind.dialect.name == "postgresql":
+        return _postgres_partition_state(db.connection(), year) is False
+    return False
+
+def ensure_partition(db: Session, year: int):
+    """
+    Make sure values of a year can be written: creates the year's partition
+    on Postgres, and raises PartitionError if the year is detached.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name == "sqlite":
+        if is_detached(db, year):
+            raise PartitionError(f"Data values of {year} are detached")
+        return
+    if bind.dialect.name != "postgresql":
+        return
+
+    key = (str(bind.url), year)
+    with _attached_partitions_lock:
+        if key in _attached_partitions:
+            return
+    connection = db.connection()
+    state = _postgres_partition_state(connection, year)
+    if state is False:
+        raise PartitionError(f"Data values of {year} are detached")
+    if state is None:
+        _create_postgres_partition(connection, year)
+    with _attached_partitions_lock:
+        _attached_partitions.add(key)
+
+def list_partitions(engine: Engine) -> List[dict]:
+    """Years with data values, attached or detached, with the number of live values."""
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(DataValue.reporting_year, func.count(DataValue.id)).group_by(DataValue.reporting_year)
+        ).all()
+        partitions = {year: {"year": year, "state": "attached", "data_values": count} for year, count in rows}
+
+        if engine.dialect.name == "postgresql":
+            detached = connection.exec_driver_sql(
+                "SELECT relname FROM pg_class WHERE relname LIKE 'data\\_values\\_y%%' "
+                "AND relkind = 'r' AND NOT relispartition"
+            ).scalars().all()
+            years = [int(name[len("data_values_y"):]) for name in detached if name[len("data_values_y"):].isdigit()]
+        elif engine.dialect.name == "sqlite" and engine.url.database and engine.url.database != ":memory:":
+            directory = os.path.dirname(archive_path(engine, 0))
+            names = os.listdir(directory) if os.path.isdir(directory) else []
+            years = [int(match.group(1)) for match in map(_ARCHIVE_FILE_RE.match, names) if match]
+        else:
+            years = []
+
+    for year in years:
+        partitions.setdefault(year, {"year": year, "state": "detached", "data_values": 0})["state"] = "detached"
+    return [partitions[year] for year in sorted(partitions)]
+
+def _attached_count(connection: Connection, year: int) -> int:
+    return connection.execute(
+        select(func.count(DataValue.id)).where(DataValue.reporting_year == year)
+    ).scalar()
+
+def detach_partition(engine: Engine, year: int) -> int:
+    """Take a year's data values out of the live table. Returns the number of values detached."""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            if not _postgres_partition_state(connection, year):
+                raise PartitionError(f"No attached partition for {year}")
+            count = _attached_count(connection, year)
+            connection.exec_driver_sql(f"ALTER TABLE data_values DETACH PARTITION {partition_name(year)}")
+        with _attached_partitions_lock:
+            _attached_partitions.discard((str(engine.url), year))
+        return count
+
+    if engine.dialect.name != "sqlite":
+        raise PartitionError(f"Partitions are not supported on {engine.dialect.name}")
+    path = archive_path(engine, year)
+    if os.path.exists(path):
+        raise PartitionError(f"Data values of {year} are already detached")
+
+    columns = ", ".join(column.name for column in DataValue.__table__.columns)
+    with engine.connect() as connection:
+        if not _attached_count(connection, year):
+            raise PartitionError(f"No data values for {year}")
+        connection.rollback()
+
+        # ATTACH and DETACH are not allowed inside a transaction
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            # The archive file is complete before any live row is deleted
+            connection.exec_driver_sql(
+                f"CREATE TABLE archive.data_values AS SELECT {columns} FROM main.data_values WHERE reporting_year = ?",
+                (year,)
+            )
+            count = connection.exec_driver_sql(
+                "DELETE FROM main.data_values WHERE reporting_year = ?", (year,)
+            ).rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            connection.exec_driver_sql("DETACH DATABASE archive")
+            os.remove(path)
+            raise
+        connection.exec_driver_sql("DETACH DATABASE archive")
+    return count
+
+def attach_partition(engine: Engine, year: int) -> int:
+    """Bring a detached year back into the live table. Returns the number of values attached."""
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as connection:
+            if _postgres_partition_state(connection, year) is not False:
+                raise PartitionError(f"No detached partition for {year}")
+            connection.exec_driver_sql(
+                f"ALTER TABLE data_values ATTACH PARTITION {partition_name(year)} "
+                f"FOR VALUES FROM ({year}) TO ({year + 1})"
+            )
+            return _attached_count(connection, year)
+
+    if engine.dialect.name != "sqlite":
+        raise PartitionError(f"Partitions are not supported on {engine.dialect.name}")
+    path = archive_path(engine, year)
+    if not os.path.exists(path):
+        raise PartitionError(f"Data values of {year} are not detached")
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            # Columns added to the live table since the year was detached stay NULL
+            archived = {row[1] for row in connection.exec_driver_sql("PRAGMA archive.table_info(data_values)")}
+            columns = ", ".join(column.name for column in DataValue.__table__.columns if column.name in archived)
+            count = connection.exec_driver_sql(
+                f"INSERT INTO main.data_values ({columns}) SELECT {columns} FROM archive.data_values"
+            ).rowcount
+            connection.commit()
+        except IntegrityError:
+            connection.rollback()
+            raise PartitionError(f"Data values of {year} collide with live data values")
+        finally:
+            connection.exec_driver_sql("DETACH DATABASE archive")
+    os.remove(path)
+    return count
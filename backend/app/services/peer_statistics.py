@@ -0,0 +1,334 @@
+"""
+Incrementally maintained peer-group statistics for outlier edits.
+
+For every (series, reporting period, MDRM element, peer group) we keep the
+count, mean and M2 of the validated values (Welford's algorithm) plus a
+mergeable quantile sketch. Reports add their values when they are validated
+and remove them again before they are resubmitted, so peer rules can be
+evaluated without scanning the other filings of the period.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import math
+
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import Report, DataValue, MDRMElement, PeerStatistic
+
+# Peer groups are split by institution size, measured by total assets
+# (in thousands of dollars) at these thresholds
+SIZE_BAND_MDRM_ID = "RCFD1480"
+SIZE_BANDS = [
+    (1_000_000, "under_1b"),
+    (10_000_000, "1b_10b"),
+    (100_000_000, "10b_100b")
+]
+LARGEST_SIZE_BAND = "over_100b"
+UNKNOWN_SIZE_BAND = "unknown"
+
+NUMERIC_DATA_TYPES = ("numeric", "integer")
+
+# INSERT ... ON CONFLICT DO NOTHING per dialect
+_INSERT_IGNORE = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Rows per multi-row INSERT, well below the bind parameter limits
+INSERT_BATCH_SIZE = 500
+
+# Peer rules pass when the peer group has fewer validated filings than this
+MIN_PEER_COUNT = 5
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch (DDSketch) with a fixed relative accuracy.
+    Bucket counts can be decremented, so values can be removed exactly.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, positive=None, negative=None, zero_count: int = 0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = positive or {}
+        self.negative: Dict[int, int] = negative or {}
+        self.zero_count = zero_count
+
+    @property
+    def count(self) -> int:
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.zero_count
+
+    def _key(self, magnitude: float) -> int:
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def _bucket_value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1):
+        if value == 0:
+            self.zero_count += weight
+            return
+        store = self.positive if value > 0 else self.negative
+        key = self._key(abs(value))
+        store[key] = store.get(key, 0) + weight
+        if store[key] <= 0:
+            del store[key]
+
+    def remove(self, value: float):
+        self.add(value, weight=-1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        # Walk buckets from the most negative value to the most positive one
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._bucket_value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._bucket_value(key)
+        return self._bucket_value(max(self.positive)) if self.positive else 0.0
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "relative_accuracy": self.relative_accuracy,
+            "positive": self.positive,
+            "negative": self.negative,
+            "zero_count": self.zero_count
+        })
+
+    @classmethod
+    def from_json(cls, data: Optional[str]) -> "QuantileSketch":
+        if not data:
+            return cls()
+        state = json.loads(data)
+        return cls(
+            state["relative_accuracy"],
+            {int(key): count for key, count in state["positive"].items()},
+            {int(key): count for key, count in state["negative"].items()},
+            state["zero_count"]
+        )
+
+class PeerSummary:
+    """Detached copy of a peer statistic that a report's own value can be removed from."""
+
+    def __init__(self, count: int, mean: float, m2: float, sketch: QuantileSketch):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.sketch = sketch
+
+    @classmethod
+    def from_statistic(cls, statistic: PeerStatistic) -> "PeerSummary":
+        return cls(
+            statistic.count or 0, statistic.mean or 0.0, statistic.m2 or 0.0,
+            QuantileSketch.from_json(statistic.sketch)
+        )
+
+    def add(self, value: float):
+        self.count, self.mean, self.m2 = welford_add(self.count, self.mean, self.m2, value)
+        self.sketch.add(value)
+
+    def remove(self, value: float):
+        self.count, self.mean, self.m2 = welford_remove(self.count, self.mean, self.m2, value)
+        self.sketch.remove(value)
+
+    @property
+    def stddev(self) -> Optional[float]:
+        if self.count < 2:
+            return None
+        return math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+
+    @property
+    def median(self) -> Optional[float]:
+        return self.sketch.quantile(0.5)
+
+def welford_add(count: int, mean: float, m2: float, value: float) -> tuple:
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+def welford_remove(count: int, mean: float, m2: float, value: float) -> tuple:
+    if count <= 1:
+        return 0, 0.0, 0.0
+    new_count = count - 1
+    delta = value - mean
+    new_mean = mean - delta / new_count
+    m2 -= delta * (value - new_mean)
+    return new_count, new_mean, m2
+
+def get_size_band(total_assets: Optional[float]) -> str:
+    if total_assets is None:
+        return UNKNOWN_SIZE_BAND
+    for threshold, band in SIZE_BANDS:
+        if total_assets < threshold:
+            return band
+    return LARGEST_SIZE_BAND
+
+def get_peer_group(institution_type: Optional[str], values_by_mdrm_id: Dict[str, float]) -> str:
+    """Peer group key for a report: institution type and size band."""
+    size_band = get_size_band(values_by_mdrm_id.get(SIZE_BAND_MDRM_ID))
+    return f"{institution_type or 'unknown'}|{size_band}"
+
+def _numeric_values(db: Session, report_id: int) -> Dict[int, tuple]:
+    """Map MDRM element ID to (mdrm_id, float value) for the numeric values of a report."""
+    rows = db.query(
+        DataValue.mdrm_element_id, MDRMElement.mdrm_id, DataValue.value
+    ).join(
+        MDRMElement, DataValue.mdrm_element_id == MDRMElement.id
+    ).filter(
+        DataValue.report_id == report_id,
+        DataValue.is_current(),
+        MDRMElement.data_type.in_(NUMERIC_DATA_TYPES)
+    ).all()
+    values = {}
+    for element_id, mdrm_id, value in rows:
+        try:
+            values[element_id] = (mdrm_id, float(value))
+        except (TypeError, ValueError):
+            continue
+    return values
+
+def _load_statistics(
+    db: Session, report: Report, peer_group: str, element_ids: Iterable[int], for_update: bool = False
+) -> Dict[int, PeerStatistic]:
+    query = db.query(PeerStatistic).filter(
+        PeerStatistic.series_id == report.series_id,
+        PeerStatistic.reporting_period == report.reporting_period,
+        PeerStatistic.peer_group == peer_group,
+        PeerStatistic.mdrm_element_id.in_(list(element_ids))
+    )
+    if for_update:
+        # Locked in a fixed order, and refreshed in case the session read them earlier
+        query = query.order_by(PeerStatistic.mdrm_element_id).with_for_update().populate_existing()
+    return {statistic.mdrm_element_id: statistic for statistic in query.all()}
+
+def _insert_missing_statistics(db: Session, report: Report, peer_group: str, element_ids: Iterable[int]):
+    """
+    Create empty statistics for the elements of a peer group that have none,
+    skipping rows another submission inserted meanwhile. On SQLite this also
+    takes the database write lock before the rows are read.
+    """
+    insert = _INSERT_IGNORE.get(db.get_bind().dialect.name)
+    rows = [
+        {
+            "series_id": report.series_id,
+            "reporting_period": report.reporting_period,
+            "peer_group": peer_group,
+            "mdrm_element_id": element_id,
+            "count": 0, "mean": 0.0, "m2": 0.0
+        }
+        for element_id in element_ids
+    ]
+    if insert is None:
+        return
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(insert(PeerStatistic).values(rows[start:start + INSERT_BATCH_SIZE]).on_conflict_do_nothing())
+
+def _apply(db: Session, report: Report, peer_group: str, values: Dict[int, tuple], remove: bool):
+    # Read-modify-write of shared rows: they are created atomically and updated under a row lock
+    _insert_missing_statistics(db, report, peer_group, values.keys())
+    statistics = _load_statistics(db, report, peer_group, values.keys(), for_update=True)
+    for element_id, (_, value) in values.items():
+        statistic = statistics.get(element_id)
+        if remove and (statistic is None or not statistic.count):
+            continue
+        if statistic is None:
+            statistic = PeerStatistic(
+                series_id=report.series_id,
+                reporting_period=report.reporting_period,
+                peer_group=peer_group,
+                mdrm_element_id=element_id,
+                count=0, mean=0.0, m2=0.0
+            )
+            db.add(statistic)
+        summary = PeerSummary.from_statistic(statistic)
+        if remove:
+            summary.remove(value)
+        else:
+            summary.add(value)
+        statistic.count = summary.count
+        statistic.mean = summary.mean
+        statistic.m2 = summary.m2
+        statistic.sketch = summary.sketch.to_json()
+
+def remove_report_statistics(db: Session, report: Report):
+    """Withdraw a report's current values from the peer statistics it contributed to."""
+    if not report.peer_group:
+        return
+    _apply(db, report, report.peer_group, _numeric_values(db, report.id), remove=True)
+    report.peer_group = None
+
+def add_report_statistics(db: Session, report: Report):
+    """Contribute the values of a validated report to its peer group's statistics."""
+    if report.peer_group or report.status != "validated":
+        return
+    values = _numeric_values(db, report.id)
+    peer_group = get_peer_group(
+        report.institution.type if report.institution else None,
+        {mdrm_id: value for mdrm_id, value in values.values()}
+    )
+    _apply(db, report, peer_group, values, remove=False)
+    report.peer_group = peer_group
+
+def _own_values_removed(
+    statistics: Dict[int, PeerStatistic], report: Report, peer_group: str, own_values: Dict[int, float]
+) -> Dict[int, PeerSummary]:
+    summaries = {}
+    for element_id, statistic in statistics.items():
+        summary = PeerSummary.from_statistic(statistic)
+        if report.peer_group == peer_group and element_id in own_values:
+            summary.remove(own_values[element_id])
+        summaries[element_id] = summary
+    return summaries
+
+def load_peer_summaries(
+    db: Session,
+    report: Report,
+    peer_group: str,
+    element_ids: List[int],
+    own_values: Dict[int, float]
+) -> Dict[int, PeerSummary]:
+    """
+    Load the peer statistics of a report's peer group for the given elements.
+    If the report already contributed to that group, its own values are
+    removed so a report is never compared against itself.
+    """
+    return _own_values_removed(
+        _load_statistics(db, report, peer_group, element_ids), report, peer_group, own_values
+    )
+
+def load_batch_peer_summaries(
+    db: Session,
+    reports: List[Tuple[Report, str, Dict[int, float]]],
+    element_ids: List[int]
+) -> Dict[int, Dict[int, PeerSummary]]:
+    """
+    load_peer_summaries for many reports in one query. reports holds
+    (report, peer group, own numeric values); returns the summaries per report ID.
+    """
+    keys = {(report.series_id, report.reporting_period, peer_group) for report, peer_group, _ in reports}
+    statistics: Dict[tuple, Dict[int, PeerStatistic]] = {}
+    if keys:
+        for statistic in db.query(PeerStatistic).filter(
+            tuple_(PeerStatistic.series_id, PeerStatistic.reporting_period, PeerStatistic.peer_group).in_(keys),
+            PeerStatistic.mdrm_element_id.in_(element_ids)
+        ):
+            key = (statistic.series_id, statistic.reporting_period, statistic.peer_group)
+            statistics.setdefault(key, {})[statistic.mdrm_element_id] = statistic
+    return {
+        report.id: _own_values_removed(
+            statistics.get((report.series_id, report.reporting_period, peer_group), {}),
+            report, peer_group, own_values
+        )
+        for report, peer_group, own_values in reports
+    }
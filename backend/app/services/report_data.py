@@ -0,0 +1,74 @@
+"""
+Copy-on-write storage of report data versions.
+
+Every submission creates a new version of the report (its data_version).
+Values that did not change are shared with the previous version; only
+added and changed values are inserted, and replaced or removed values are
+closed by setting valid_to_version instead of being deleted, so earlier
+amendments and the validation results that point at them are preserved.
+"""
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import Report, DataValue, period_year
+from .resubmission import canonical_values, content_hash
+
+def get_current_data_values(db: Session, report_id: int, reporting_period: Optional[str] = None) -> List[DataValue]:
+    # With the report's period, only its year's partition is read
+    query = db.query(DataValue).filter(
+        DataValue.report_id == report_id,
+        DataValue.is_current()
+    )
+    if reporting_period is not None:
+        query = query.filter(DataValue.in_partition(reporting_period))
+    return query.all()
+
+def get_version_data_values(
+    db: Session, report_id: int, version: int, reporting_period: Optional[str] = None
+) -> List[DataValue]:
+    query = db.query(DataValue).filter(
+        DataValue.report_id == report_id,
+        DataValue.in_version(version)
+    )
+    if reporting_period is not None:
+        query = query.filter(DataValue.in_partition(reporting_period))
+    return query.order_by(DataValue.mdrm_element_id).all()
+
+def write_report_version(db: Session, report: Report, data_items: List[dict]) -> List[DataValue]:
+    """
+    Store submitted values as the next version of a report, writing only the delta.
+    Returns the data values of the new version.
+    """
+    version = (report.data_version or 0) + 1
+    report.data_version = version
+    
+    current = {dv.mdrm_element_id: dv for dv in get_current_data_values(db, report.id, report.reporting_period)}
+    
+    submitted = canonical_values(data_items)
+    report.content_hash = content_hash(submitted)
+    
+    data_values = []
+    new_values = []
+    for mdrm_element_id, value in submitted.items():
+        existing = current.pop(mdrm_element_id, None)
+        if existing is not None and existing.value == value:
+            data_values.append(existing)  # Unchanged, shared with the previous version
+            continue
+        if existing is not None:
+            existing.valid_to_version = version
+        new_values.append(DataValue(
+            report_id=report.id,
+            mdrm_element_id=mdrm_element_id,
+            value=value,
+            valid_from_version=version,
+            reporting_year=period_year(report.reporting_period)
+        ))
+    
+    # Elements missing from the submission are no longer part of the report
+    for removed in current.values():
+        removed.valid_to_version = version
+    
+    db.add_all(new_values)
+    db.flush()  # Flush to get the IDs
+    return data_values + new_values
@@ -0,0 +1,133 @@
+"""
+Period-over-period comparison of two reports.
+
+The current values of both reports are joined on mdrm_element_id in one
+grouped query: each element becomes one row holding its value in the base
+report and in the compared report, and rows whose values are equal are
+dropped by the database. Only the differences reach Python, where the
+absolute and percentage changes are computed, filtered by threshold and
+sorted.
+"""
+from typing import List, Optional
+import math
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import DataValue, MDRMElement, Report, period_year
+
+SORT_ORDERS = ("magnitude", "pct", "element")
+
+class DiffError(ValueError):
+    """Raised for comparisons that cannot be made."""
+
+def previous_report(db: Session, report: Report) -> Optional[Report]:
+    """Latest report of the institution for the series in an earlier period."""
+    return db.query(Report).filter(
+        Report.series_id == report.series_id,
+        Report.institution_id == report.institution_id,
+        Report.reporting_period < report.reporting_period
+    ).order_by(Report.reporting_period.desc(), Report.id.desc()).first()
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def _changed_elements(db: Session, base_report: Report, report: Report):
+    """(element ID, MDRM ID, base value, new value) of every element whose value differs."""
+    base_report_id, report_id = base_report.id, report.id
+    base_value = func.max(case((DataValue.report_id == base_report_id, DataValue.value)))
+    new_value = func.max(case((DataValue.report_id == report_id, DataValue.value)))
+    grouped = select(
+        DataValue.mdrm_element_id.label("mdrm_element_id"),
+        base_value.label("base_value"),
+        new_value.label("new_value")
+    ).where(
+        DataValue.report_id.in_((base_report_id, report_id)),
+        DataValue.reporting_year.in_({period_year(base_report.reporting_period), period_year(report.reporting_period)}),
+        DataValue.is_current()
+    ).group_by(DataValue.mdrm_element_id).having(or_(
+        base_value.is_(None), new_value.is_(None), base_value != new_value
+    )).subquery()
+    return db.execute(select(
+        grouped.c.mdrm_element_id, MDRMElement.mdrm_id, grouped.c.base_value, grouped.c.new_value
+    ).join(MDRMElement, MDRMElement.id == grouped.c.mdrm_element_id))
+
+def diff_reports(
+    db: Session,
+    base_report: Report,
+    report: Report,
+    min_change: Optional[float] = None,
+    min_pct_change: Optional[float] = None,
+    sort: str = "magnitude",
+    limit: Optional[int] = None
+) -> dict:
+    """
+    Added, removed and changed elements of a report relative to a base report.
+
+    min_change and min_pct_change keep only differences at least that large
+    in absolute value; percentages are relative to the base value. Added and
+    removed numeric values count as a change from or to zero and have no
+    percentage, so only min_change applies to them. Text values have no
+    magnitude and are dropped whenever a threshold is given.
+    """
+    if sort not in SORT_ORDERS:
+        raise DiffError(f"Unknown sort order {sort}; expected one of {', '.join(SORT_ORDERS)}")
+    if base_report.series_id != report.series_id:
+        raise DiffError("Reports of different series cannot be compared")
+
+    counts = {"added": 0, "removed": 0, "changed": 0}
+    items: List[dict] = []
+    for mdrm_element_id, mdrm_id, old_value, new_value in _changed_elements(db, base_report, report):
+        change = "added" if old_value is None else "removed" if new_value is None else "changed"
+        counts[change] += 1
+
+        old_number, new_number = _number(old_value), _number(new_value)
+        absolute_change = pct_change = None
+        if change == "added" and new_number is not None:
+            absolute_change = new_number
+        elif change == "removed" and old_number is not None:
+            absolute_change = -old_number
+        elif old_number is not None and new_number is not None:
+            absolute_change = new_number - old_number
+            if old_number:
+                pct_change = absolute_change / abs(old_number) * 100
+
+        if (min_change is not None or min_pct_change is not None) and absolute_change is None:
+            continue
+        if min_change is not None and abs(absolute_change) < min_change:
+            continue
+        if min_pct_change is not None and change == "changed" and (
+            pct_change is None or abs(pct_change) < min_pct_change
+        ):
+            continue
+
+        items.append({
+            "mdrm_element_id": mdrm_element_id,
+            "mdrm_id": mdrm_id,
+            "change": change,
+            "old_value": old_value,
+            "new_value": new_value,
+            "absolute_change": absolute_change,
+            "pct_change": None if pct_change is None else round(pct_change, 4)
+        })
+
+    if sort == "element":
+        items.sort(key=lambda item: item["mdrm_id"])
+    else:
+        # Largest first; differences without a magnitude go last
+        field = "absolute_change" if sort == "magnitude" else "pct_change"
+        items.sort(key=lambda item: (item[field] is None, -abs(item[field] or 0), item["mdrm_id"]))
+
+    return {
+        "report_id": report.id,
+        "reporting_period": report.reporting_period,
+        "base_report_id": base_report.id,
+        "base_reporting_period": base_report.reporting_period,
+        "counts": counts,
+        "total": len(items),
+        "items": items[:limit] if limit is not None else items
+    }
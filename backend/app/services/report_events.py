@@ -0,0 +1,70 @@
+"""
+Per-report event fan-out for Server-Sent Events subscribers.
+
+Submissions run in worker threads and publish events (status transitions,
+validation progress and the final summary) for their report. The broker
+hands each event to the event loop, which copies it into the small queue
+of every subscriber of that report. An idle subscriber is one queue and
+one suspended coroutine, so a worker can hold thousands of them.
+
+Events are per process: a subscriber sees the submissions handled by the
+worker it is connected to, and gets the stored state of the report when it
+connects.
+"""
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import json
+
+# Events buffered per subscriber; a subscriber that falls behind loses the oldest
+SUBSCRIBER_QUEUE_SIZE = 64
+
+# Comment lines keep idle connections open through proxies
+KEEPALIVE_SECONDS = 15
+
+# Validation publishes progress every this many rules
+PROGRESS_INTERVAL = 500
+
+Event = Tuple[str, dict]
+
+class ReportEventBroker:
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, report_id: int) -> asyncio.Queue:
+        """Register a subscriber; must be called on the event loop."""
+        self.loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(report_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, report_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(report_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[report_id]
+
+    def publish(self, report_id: int, event: str, data: dict):
+        """Send an event to the subscribers of a report. Safe to call from any thread."""
+        loop = self.loop
+        if loop is None or report_id not in self.subscribers or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._fan_out, report_id, (event, data))
+
+    def _fan_out(self, report_id: int, event: Event):
+        for queue in self.subscribers.get(report_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+def format_event(event: str, data: dict) -> str:
+    """Encode an event in the text/event-stream format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+report_events = ReportEventBroker()
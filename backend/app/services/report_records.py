@@ -0,0 +1,59 @@
+"""
+ORM-free records of report data for the validation engine.
+
+Validation reads every value and element of a report many times and
+changes none of them, so they are loaded as plain rows with core select()
+and kept in slotted records: no identity map, no instrumented attributes
+and a fraction of the memory of ORM instances. ORM objects are only
+created for the validation results that are stored.
+"""
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import DataValue, MDRMElement
+
+class ValueRecord:
+    """Read-only stand-in for a DataValue row."""
+    __slots__ = ("id", "mdrm_element_id", "value")
+
+    def __init__(self, id: int, mdrm_element_id: int, value: str):
+        self.id = id
+        self.mdrm_element_id = mdrm_element_id
+        self.value = value
+
+class ElementRecord:
+    """The MDRMElement columns validation needs."""
+    __slots__ = ("id", "mdrm_id", "data_type")
+
+    def __init__(self, id: int, mdrm_id: str, data_type: str):
+        self.id = id
+        self.mdrm_id = mdrm_id
+        self.data_type = data_type
+
+def as_value_records(data_values: Iterable) -> List[ValueRecord]:
+    """Copy DataValue objects (or records) into records, reading each attribute once."""
+    return [
+        data_value if isinstance(data_value, ValueRecord)
+        else ValueRecord(data_value.id, data_value.mdrm_element_id, data_value.value)
+        for data_value in data_values
+    ]
+
+def load_value_records(db: Session, report_id: int, reporting_period: Optional[str] = None) -> List[ValueRecord]:
+    """Current data values of a report; with its period, read from that year's partition only."""
+    query = select(
+        DataValue.id, DataValue.mdrm_element_id, DataValue.value
+    ).where(
+        DataValue.report_id == report_id,
+        DataValue.is_current()
+    )
+    if reporting_period is not None:
+        query = query.where(DataValue.in_partition(reporting_period))
+    rows = db.execute(query)
+    return [ValueRecord(*row) for row in rows]
+
+def load_element_records(db: Session, *criteria) -> Dict[int, ElementRecord]:
+    """MDRM elements matching the given criteria, by ID."""
+    rows = db.execute(select(MDRMElement.id, MDRMElement.mdrm_id, MDRMElement.data_type).where(*criteria))
+    return {row[0]: ElementRecord(*row) for row in rows}
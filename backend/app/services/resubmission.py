@@ -0,0 +1,52 @@
+"""
+Detection of identical resubmissions.
+
+Every stored data set is fingerprinted with a canonical content hash
+(reports.content_hash): SHA-256 over the submitted values sorted by MDRM
+element, so item order and repeated items do not matter. A submission with
+the same hash as the stored data, while the persisted validation is still
+current for the ruleset and the other series' reports, is answered with
+the stored results without writing anything.
+"""
+from typing import Dict, List
+import hashlib
+import threading
+
+def canonical_values(data_items: List[dict]) -> Dict[int, str]:
+    """Submitted values by MDRM element ID, as stored; the last value submitted for an element wins."""
+    submitted = {}
+    for data_item in data_items:
+        submitted[data_item["mdrm_element_id"]] = str(data_item["value"])
+    return submitted
+
+def content_hash(values: Dict[int, str]) -> str:
+    digest = hashlib.sha256()
+    for line in sorted(f"{mdrm_element_id}\t{value}\n" for mdrm_element_id, value in values.items()):
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+class ResubmissionStats:
+    """Per-process counts of submissions answered from the stored results."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def record(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "submissions": total,
+                "duplicates": self.hits,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+resubmission_stats = ResubmissionStats()
@@ -0,0 +1,147 @@
+"""
+Code generation of ruleset evaluators.
+
+A compiled RuleGraph is turned into one Python function that evaluates
+every rule of the ruleset in straight-line code: each expression node
+becomes a local variable, assigned in topological order, and each rule one
+comparison. The function returns a pass/fail vector with one byte per rule.
+
+The source is generated from the parsed node tuples only, never from rule
+text: constants must be finite numbers, references become indexes into the
+argument tuple, and operators are looked up in fixed tables. It is compiled
+with no builtins available.
+
+The generated code is a fast path for numeric rules. It reports UNDECIDED
+for anything it does not handle exactly like the interpreter (missing or
+non-numeric values, division by zero, historical and peer rules, invalid
+expressions); those rules, and failed ones whose message is needed, are
+evaluated by the interpreter in services.validation.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from functools import lru_cache
+import math
+
+from .rule_graph import ARITHMETIC_OPS, COMPARISON_OPS, RuleGraph, compile_rule_graph
+
+FAIL, PASS, UNDECIDED = 0, 1, 2
+
+# Python operator for each operator of the rule grammar
+_COMPARISON_SOURCE = {op: ("==" if op == "=" else op) for op in COMPARISON_OPS}
+_ARITHMETIC_SOURCE = {op: op for op in ARITHMETIC_OPS}
+
+_NUMBER_TYPES = frozenset((int, float))
+
+class RulesetEvaluator:
+    """
+    A generated evaluator for one ruleset.
+
+    Call it with the values of the graph's reference nodes, in the order of
+    ref_nodes, and a dict of the numeric value of each reported MDRM element
+    by element ID. Returns one of FAIL, PASS or UNDECIDED per rule of the
+    graph, or None if the whole ruleset has to be interpreted.
+    """
+    __slots__ = ("graph", "ref_nodes", "source", "function")
+
+    def __init__(self, graph: RuleGraph, ref_nodes: List[str], source: str, function: Callable):
+        self.graph = graph
+        self.ref_nodes = ref_nodes
+        self.source = source
+        self.function = function
+
+    def __call__(self, ref_values: list, element_values: Dict[int, object]) -> Optional[bytes]:
+        return self.function(ref_values, element_values)
+
+def _check_int(value) -> int:
+    if type(value) is not int:
+        raise ValueError(f"Expected an integer, got {value!r}")
+    return value
+
+def _constant_source(value) -> str:
+    if type(value) not in _NUMBER_TYPES or not math.isfinite(value):
+        raise ValueError(f"Unsupported constant {value!r}")
+    return repr(value)
+
+def generate_source(graph: RuleGraph) -> Tuple[str, List[str]]:
+    """Python source of the evaluator of a graph, and the references it expects in order."""
+    ref_nodes: List[str] = []
+    lines = [
+        "def evaluate(refs, values):",
+        f"    out = bytearray(b'\\x{UNDECIDED:02x}' * {len(graph.rules)})",
+        "    try:",
+        "        pass"
+    ]
+    emit = lines.append
+
+    for index, node in enumerate(graph.nodes):
+        kind = node[0]
+        name = f"n{index}"
+        children = [f"n{_check_int(child)}" for child in graph.children[index]]
+        if kind == "const":
+            emit(f"        {name} = {_constant_source(node[1])}")
+        elif kind == "ref":
+            emit(f"        {name} = refs[{len(ref_nodes)}]")
+            emit(f"        if {name}.__class__ not in NUMBER_TYPES: {name} = None")
+            ref_nodes.append(node[1])
+        elif kind == "neg":
+            emit(f"        {name} = None if {children[0]} is None else -{children[0]}")
+        elif kind in _ARITHMETIC_SOURCE:
+            left, right = children
+            guard = f"{left} is None or {right} is None"
+            if kind == "/":
+                # Division by zero is an error the interpreter reports
+                guard += f" or not {right}"
+            emit(f"        {name} = None if {guard} else {left} {_ARITHMETIC_SOURCE[kind]} {right}")
+        else:
+            raise ValueError(f"Unsupported expression node {kind!r}")
+
+    for position, rule in enumerate(graph.rules):
+        if rule.error or rule.rule_type not in ("range", "comparison", "formula"):
+            continue
+        element_id = _check_int(rule.mdrm_element_id)
+        emit(f"        v = values.get({element_id})")
+        if rule.bounds:
+            low, high = (_constant_source(bound) for bound in rule.bounds)
+            emit(f"        if v is not None: out[{position}] = 1 if {low} <= v <= {high} else 0")
+            continue
+        if rule.op not in _COMPARISON_SOURCE or rule.target is None:
+            continue
+        target = f"n{_check_int(rule.target)}"
+        emit(
+            f"        if v is not None and {target} is not None: "
+            f"out[{position}] = 1 if v {_COMPARISON_SOURCE[rule.op]} {target} else 0"
+        )
+
+    emit("    except ArithmeticError:")
+    emit("        return None")
+    emit("    return bytes(out)")
+    return "\n".join(lines) + "\n", ref_nodes
+
+def build_evaluator(graph: RuleGraph) -> RulesetEvaluator:
+    source, ref_nodes = generate_source(graph)
+    namespace = {"__builtins__": {}, "NUMBER_TYPES": _NUMBER_TYPES, "bytearray": bytearray, "bytes": bytes}
+    exec(compile(source, "<ruleset>", "exec"), namespace)
+    return RulesetEvaluator(graph, ref_nodes, source, namespace["evaluate"])
+
+@lru_cache(maxsize=128)
+def compile_ruleset(rule_specs: Tuple[Tuple[int, int, str, str], ...]) -> RulesetEvaluator:
+    """
+    Generated evaluator for (rule_id, mdrm_element_id, rule_type, rule_expression)
+    tuples. Like compile_rule_graph, cached per ruleset version.
+    """
+    return build_evaluator(compile_rule_graph(rule_specs))
+
+def numeric_element_values(data_value_dict: dict, mdrm_element_dict: dict) -> Dict[int, object]:
+    """Reported values of numeric and integer elements, converted like convert_value does."""
+    values = {}
+    for element_id, data_value in data_value_dict.items():
+        mdrm_element = mdrm_element_dict.get(element_id)
+        if mdrm_element is None:
+            continue
+        try:
+            if mdrm_element.data_type == "numeric":
+                values[element_id] = float(data_value.value)
+            elif mdrm_element.data_type == "integer":
+                values[element_id] = int(data_value.value)
+        except (TypeError, ValueError):
+            continue
+    return values
@@ -0,0 +1,284 @@
+"""
+Compilation of validation rules into an expression dependency graph.
+
+Rule expressions are parsed once into expression nodes. Identical
+subexpressions (e.g. "RCFD2170 + RCFD3210" used by several edits) share a
+single node, so a ruleset becomes a DAG that is evaluated in one
+topologically ordered pass per report, computing every derived value once.
+"""
+from typing import List, Optional, Tuple
+from functools import lru_cache
+import operator
+import re
+
+# Comparison operators, longest first so ">=" is never read as ">"
+COMPARISON_OPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '=': operator.eq,
+    '>': operator.gt,
+    '<': operator.lt
+}
+
+ARITHMETIC_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv
+}
+
+MDRM_ID_PATTERN = r'[A-Z]{4}\d{4}'
+
+# A reference to another series of the same institution and period, e.g. FFIEC031:RCFD1480
+SERIES_QUALIFIER_PATTERN = r'[A-Z0-9]+:'
+REF_PATTERN = r'(?:' + SERIES_QUALIFIER_PATTERN + r')?' + MDRM_ID_PATTERN
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:(?P<ref>" + REF_PATTERN + r")|(?P<number>\d+\.\d*|\.\d+|\d+)|(?P<op>[-+*/()]))"
+)
+_LEADING_OP_RE = re.compile(r"\s*(==|!=|>=|<=|=|>|<)\s*(.*)$", re.DOTALL)
+_ANY_OP_RE = re.compile(r"(==|!=|>=|<=|=|>|<)")
+_BETWEEN_RE = re.compile(r"\s*between\s+(\S+)\s+and\s+(\S+)\s*$", re.IGNORECASE)
+
+class RuleSyntaxError(ValueError):
+    """Raised when a rule expression does not match the expression grammar."""
+
+class NodeError:
+    """Failed value of a graph node, propagated to every node that depends on it."""
+    __slots__ = ("message", "is_reference")
+
+    def __init__(self, message: str, is_reference: bool = False):
+        self.message = message
+        self.is_reference = is_reference
+
+def tokenize(expression: str) -> List[Tuple[str, str]]:
+    """Split an arithmetic expression into (kind, text) tokens."""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match:
+            raise RuleSyntaxError(f"Unexpected input at position {position}: {expression[position:]}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+def parse_expression(expression: str) -> tuple:
+    """
+    Parse an arithmetic expression over MDRM IDs and numbers into a node tuple.
+    Nodes are ("const", value), ("ref", mdrm_id), ("neg", node) or (op, left, right),
+    where mdrm_id may be qualified with a series, as in "FFIEC031:RCFD1480".
+    """
+    tokens = tokenize(expression)
+    if not tokens:
+        raise RuleSyntaxError("Empty expression")
+    node, position = _parse_sum(tokens, 0)
+    if position != len(tokens):
+        raise RuleSyntaxError(f"Unexpected token: {tokens[position][1]}")
+    return node
+
+def _parse_sum(tokens, position):
+    node, position = _parse_product(tokens, position)
+    while position < len(tokens) and tokens[position][1] in ('+', '-'):
+        op = tokens[position][1]
+        right, position = _parse_product(tokens, position + 1)
+        node = _binary(op, node, right)
+    return node, position
+
+def _parse_product(tokens, position):
+    node, position = _parse_unary(tokens, position)
+    while position < len(tokens) and tokens[position][1] in ('*', '/'):
+        op = tokens[position][1]
+        right, position = _parse_unary(tokens, position + 1)
+        node = _binary(op, node, right)
+    return node, position
+
+def _parse_unary(tokens, position):
+    if position < len(tokens) and tokens[position][1] in ('+', '-'):
+        op = tokens[position][1]
+        node, position = _parse_unary(tokens, position + 1)
+        return (node if op == '+' else ("neg", node)), position
+    return _parse_atom(tokens, position)
+
+def _parse_atom(tokens, position):
+    if position >= len(tokens):
+        raise RuleSyntaxError("Unexpected end of expression")
+    kind, text = tokens[position]
+    if kind == "number":
+        value = float(text) if '.' in text else int(text)
+        return ("const", value), position + 1
+    if kind == "ref":
+        return ("ref", text), position + 1
+    if text == '(':
+        node, position = _parse_sum(tokens, position + 1)
+        if position >= len(tokens) or tokens[position][1] != ')':
+            raise RuleSyntaxError("Missing closing parenthesis")
+        return node, position + 1
+    raise RuleSyntaxError(f"Unexpected token: {text}")
+
+def _binary(op: str, left: tuple, right: tuple) -> tuple:
+    # Addition and multiplication commute exactly, so order their operands
+    # canonically to let "A + B" and "B + A" share one node
+    if op in ('+', '*') and repr(right) < repr(left):
+        left, right = right, left
+    return (op, left, right)
+
+def series_key(series_id: str) -> str:
+    """Normalize a series ID for use as a reference qualifier, e.g. "FFIEC 031" -> "FFIEC031"."""
+    return re.sub(r'[^A-Z0-9]', '', (series_id or "").upper())
+
+def split_ref(ref: str) -> Tuple[Optional[str], str]:
+    """Split a reference into (series qualifier or None, MDRM ID)."""
+    if ':' in ref:
+        qualifier, mdrm_id = ref.split(':', 1)
+        return qualifier, mdrm_id
+    return None, ref
+
+def expression_refs(expression: str) -> List[str]:
+    """Return the (possibly series-qualified) MDRM IDs referenced by an expression, in order of appearance."""
+    refs = []
+    for mdrm_id in re.findall(REF_PATTERN, expression):
+        if mdrm_id not in refs:
+            refs.append(mdrm_id)
+    return refs
+
+class CompiledRule:
+    """A validation rule bound to the graph node holding its expected value."""
+    __slots__ = (
+        "rule_id", "mdrm_element_id", "rule_type", "expression",
+        "op", "target", "bounds", "refs", "error"
+    )
+
+    def __init__(self, rule_id: int, mdrm_element_id: int, rule_type: str, expression: str):
+        self.rule_id = rule_id
+        self.mdrm_element_id = mdrm_element_id
+        self.rule_type = rule_type
+        self.expression = expression
+        self.op: Optional[str] = None
+        self.target: Optional[int] = None
+        self.bounds: Optional[Tuple[float, float]] = None
+        self.refs: List[int] = []  # Reference nodes, in order of appearance
+        self.error: Optional[str] = None
+
+class RuleGraph:
+    """
+    A compiled ruleset: unique expression nodes in topological order plus
+    the rules that compare reported values against those nodes.
+    """
+
+    def __init__(self):
+        self.nodes: List[tuple] = []
+        self.children: List[Tuple[int, ...]] = []
+        self.index = {}
+        self.rules: List[CompiledRule] = []
+
+    def foreign_refs(self) -> List[Tuple[str, str]]:
+        """(series qualifier, MDRM ID) pairs of all series-qualified references in the graph."""
+        return [split_ref(node[1]) for node in self.nodes if node[0] == "ref" and ':' in node[1]]
+
+    def add_node(self, node: tuple) -> int:
+        """Add a node and its subexpressions, returning the index of the shared node."""
+        if node in self.index:
+            return self.index[node]
+        kind = node[0]
+        if kind in ("const", "ref"):
+            children = ()
+        else:
+            children = tuple(self.add_node(child) for child in node[1:])
+        # Children are always added first, so list order is a topological order
+        self.index[node] = len(self.nodes)
+        self.nodes.append(node)
+        self.children.append(children)
+        return self.index[node]
+
+    def add_rule(self, rule_id: int, mdrm_element_id: int, rule_type: str, expression: str) -> CompiledRule:
+        compiled = CompiledRule(rule_id, mdrm_element_id, rule_type, expression or "")
+        try:
+            if rule_type == "range":
+                _compile_range(self, compiled)
+            elif rule_type == "formula":
+                _compile_formula(self, compiled)
+            elif rule_type == "comparison":
+                _compile_comparison(self, compiled)
+        except RuleSyntaxError:
+            compiled.error = f"Invalid {rule_type} expression: {expression}"
+        self.rules.append(compiled)
+        return compiled
+
+    def evaluate(self, resolve_ref) -> list:
+        """
+        Evaluate every node once in topological order.
+        resolve_ref maps a reference to its value or a NodeError.
+        """
+        frame = [None] * len(self.nodes)
+        for i, node in enumerate(self.nodes):
+            kind = node[0]
+            if kind == "const":
+                frame[i] = node[1]
+            elif kind == "ref":
+                frame[i] = resolve_ref(node[1])
+            else:
+                args = [frame[child] for child in self.children[i]]
+                failed = next((arg for arg in args if isinstance(arg, NodeError)), None)
+                if failed is not None:
+                    frame[i] = failed
+                    continue
+                try:
+                    if kind == "neg":
+                        frame[i] = -args[0]
+                    else:
+                        frame[i] = ARITHMETIC_OPS[kind](args[0], args[1])
+                except (ArithmeticError, TypeError, ValueError) as e:
+                    frame[i] = NodeError(str(e))
+        return frame
+
+def _compile_range(graph: RuleGraph, compiled: CompiledRule):
+    match = _BETWEEN_RE.match(compiled.expression)
+    if match:
+        try:
+            compiled.bounds = (float(match.group(1)), float(match.group(2)))
+        except ValueError:
+            raise RuleSyntaxError(compiled.expression)
+        return
+    match = _LEADING_OP_RE.match(compiled.expression)
+    if not match:
+        raise RuleSyntaxError(compiled.expression)
+    try:
+        threshold = float(match.group(2).strip())
+    except ValueError:
+        raise RuleSyntaxError(compiled.expression)
+    compiled.op = match.group(1)
+    compiled.target = graph.add_node(("const", threshold))
+
+def _compile_formula(graph: RuleGraph, compiled: CompiledRule):
+    match = _LEADING_OP_RE.match(compiled.expression)
+    if not match:
+        raise RuleSyntaxError(compiled.expression)
+    compiled.op = match.group(1)
+    compiled.target = graph.add_node(parse_expression(match.group(2)))
+    compiled.refs = [graph.add_node(("ref", mdrm_id)) for mdrm_id in expression_refs(match.group(2))]
+
+def _compile_comparison(graph: RuleGraph, compiled: CompiledRule):
+    # The value is compared against the right-hand side; a left-hand side, if present, is ignored
+    match = _ANY_OP_RE.search(compiled.expression)
+    if not match:
+        raise RuleSyntaxError(compiled.expression)
+    right_side = compiled.expression[match.end():]
+    compiled.op = match.group(1)
+    compiled.target = graph.add_node(parse_expression(right_side))
+    compiled.refs = [graph.add_node(("ref", mdrm_id)) for mdrm_id in expression_refs(right_side)]
+
+@lru_cache(maxsize=128)
+def compile_rule_graph(rule_specs: Tuple[Tuple[int, int, str, str], ...]) -> RuleGraph:
+    """
+    Compile (rule_id, mdrm_element_id, rule_type, rule_expression) tuples into a RuleGraph.
+    Compiled graphs are cached, so a ruleset is only parsed once per process.
+    """
+    graph = RuleGraph()
+    for rule_id, mdrm_element_id, rule_type, expression in rule_specs:
+        graph.add_rule(rule_id, mdrm_element_id, rule_type, expression)
+    return graph
@@ -0,0 +1,187 @@
+"""
+Dry-run impact analysis of a candidate validation rule.
+
+The candidate is compiled once and evaluated against the current values of
+existing reports without writing anything. Reports are processed in
+batches: the values a batch needs (the rule's element and the elements its
+expression references) are loaded with one query, so rules that only look
+at the report itself never touch the database per report. The earlier
+periods of historical rules and the peer statistics of peer rules are
+likewise loaded once per batch, outside the history cache of live
+validation. Cross-series rules reuse the lookups of a normal validation,
+with a foreign report cache shared across the whole run.
+"""
+from typing import Dict, List, Optional
+import time
+
+from sqlalchemy.orm import Session, joinedload
+
+from ..models.mdrm import Report, DataValue, MDRMElement, series_mdrm_association
+from .foreign_reports import ForeignReportCache
+from .history import load_windows
+from .peer_statistics import SIZE_BAND_MDRM_ID, load_batch_peer_summaries
+from .report_records import ValueRecord, load_element_records
+from .rule_graph import compile_rule_graph, expression_refs, split_ref
+from .validation import ValidationContext, evaluate_graph, evaluate_rule
+
+RULE_TYPES = ("range", "comparison", "formula", "historical", "peer")
+
+# Reports whose values are loaded together
+DRY_RUN_BATCH_SIZE = 500
+
+# Placeholder rule ID for a candidate that is not stored yet
+CANDIDATE_RULE_ID = 0
+
+class DryRunError(ValueError):
+    """Raised when a candidate rule cannot be compiled."""
+
+def _candidate_reports(
+    db: Session,
+    mdrm_element_id: int,
+    series_ids: Optional[List[int]],
+    period_from: Optional[str],
+    period_to: Optional[str]
+):
+    query = db.query(Report).options(joinedload(Report.institution))
+    if series_ids:
+        query = query.filter(Report.series_id.in_(series_ids))
+    else:
+        # Every series that collects the rule's element
+        query = query.filter(Report.series_id.in_(
+            db.query(series_mdrm_association.c.series_id).filter(
+                series_mdrm_association.c.mdrm_element_id == mdrm_element_id
+            )
+        ))
+    if period_from:
+        query = query.filter(Report.reporting_period >= period_from)
+    if period_to:
+        query = query.filter(Report.reporting_period <= period_to)
+    return query.order_by(Report.id)
+
+def _load_values(db: Session, report_ids: List[int], element_ids: List[int]) -> Dict[int, Dict[int, ValueRecord]]:
+    values: Dict[int, Dict[int, ValueRecord]] = {report_id: {} for report_id in report_ids}
+    rows = db.query(
+        DataValue.id, DataValue.report_id, DataValue.mdrm_element_id, DataValue.value
+    ).filter(
+        DataValue.report_id.in_(report_ids),
+        DataValue.mdrm_element_id.in_(element_ids),
+        DataValue.is_current()
+    )
+    for data_value_id, report_id, mdrm_element_id, value in rows:
+        values[report_id][mdrm_element_id] = ValueRecord(data_value_id, mdrm_element_id, value)
+    return values
+
+def dry_run_rule(
+    db: Session,
+    mdrm_element_id: int,
+    rule_type: str,
+    rule_expression: str,
+    series_ids: Optional[List[int]] = None,
+    period_from: Optional[str] = None,
+    period_to: Optional[str] = None,
+    sample_size: int = 20,
+    max_reports: Optional[int] = None
+) -> dict:
+    """
+    Evaluate a candidate rule against existing reports without persisting results.
+    Returns pass/fail counts, failures per period, sample failures and the elapsed time.
+    """
+    started = time.perf_counter()
+
+    if rule_type not in RULE_TYPES:
+        raise DryRunError(f"Unknown rule type: {rule_type}")
+    graph = compile_rule_graph(((CANDIDATE_RULE_ID, mdrm_element_id, rule_type, rule_expression),))
+    compiled = graph.rules[0]
+    if compiled.error:
+        raise DryRunError(compiled.error)
+
+    mdrm_element_dict = load_element_records(db, MDRMElement.id == mdrm_element_id)
+    if not mdrm_element_dict:
+        raise LookupError(f"MDRM element {mdrm_element_id} not found")
+
+    # Elements of the report itself that the expression reads
+    local_mdrm_ids = {
+        mdrm_id for qualifier, mdrm_id in map(split_ref, expression_refs(rule_expression))
+        if qualifier is None
+    }
+    if rule_type == "peer":
+        local_mdrm_ids.add(SIZE_BAND_MDRM_ID)  # Decides the report's peer group
+    mdrm_element_dict.update(load_element_records(db, MDRMElement.mdrm_id.in_(local_mdrm_ids)))
+
+    foreign_cache = ForeignReportCache()
+    evaluated = passed = failed = skipped = 0
+    failures_by_period: Dict[str, int] = {}
+    sample_failures = []
+
+    query = _candidate_reports(db, mdrm_element_id, series_ids, period_from, period_to)
+    if max_reports:
+        query = query.limit(max_reports)
+
+    batch: List[Report] = []
+
+    def run_batch():
+        nonlocal evaluated, passed, failed, skipped
+        values = _load_values(db, [report.id for report in batch], list(mdrm_element_dict))
+        contexts = []
+        for report in batch:
+            if mdrm_element_id in values[report.id]:
+                contexts.append(ValidationContext(db, report, values[report.id], mdrm_element_dict, foreign_cache))
+            else:
+                skipped += 1
+
+        # Earlier periods and peer statistics are loaded for the whole batch,
+        # bypassing the history cache of live validation
+        if rule_type == "historical":
+            windows = load_windows(db, [context.report for context in contexts], [mdrm_element_id])
+            for context in contexts:
+                context.preload(history=windows[context.report.id])
+        elif rule_type == "peer":
+            summaries = load_batch_peer_summaries(db, [
+                (context.report, context.peer_group(), context.numeric_values()) for context in contexts
+            ], [mdrm_element_id])
+            for context in contexts:
+                context.preload(peer_summaries=summaries[context.report.id])
+
+        for context in contexts:
+            report = context.report
+            data_value = context.data_value_dict[mdrm_element_id]
+            frame = evaluate_graph(graph, context)
+            is_valid, message = evaluate_rule(compiled, data_value, frame, context)
+            evaluated += 1
+            if is_valid:
+                passed += 1
+                continue
+
+            failed += 1
+            failures_by_period[report.reporting_period] = failures_by_period.get(report.reporting_period, 0) + 1
+            if len(sample_failures) < sample_size:
+                sample_failures.append({
+                    "report_id": report.id,
+                    "series_id": report.series_id,
+                    "institution_id": report.institution_id,
+                    "reporting_period": report.reporting_period,
+                    "value": data_value.value,
+                    "message": message
+                })
+        batch.clear()
+
+    for report in query.yield_per(DRY_RUN_BATCH_SIZE):
+        batch.append(report)
+        if len(batch) == DRY_RUN_BATCH_SIZE:
+            run_batch()
+    if batch:
+        run_batch()
+
+    return {
+        "mdrm_element_id": mdrm_element_id,
+        "rule_type": rule_type,
+        "rule_expression": rule_expression,
+        "reports_evaluated": evaluated,
+        "reports_skipped": skipped,  # No value reported for the rule's element
+        "passed": passed,
+        "failed": failed,
+        "fail_rate": failed / evaluated if evaluated else 0.0,
+        "failures_by_period": dict(sorted(failures_by_period.items())),
+        "sample_failures": sample_failures,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -0,0 +1,77 @@
+"""
+Set-based maintenance of series memberships (series_mdrm_association).
+
+Memberships are changed as a diff against the rows already stored: one
+query loads the current members, then the added pairs are inserted and
+the removed pairs deleted in bulk, instead of clearing and re-appending
+the ORM collection row by row.
+"""
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import MDRMElement, series_mdrm_association
+
+# Maximum number of bound parameters per IN list
+IN_BATCH_SIZE = 900
+
+def chunked(values: List, size: int = IN_BATCH_SIZE):
+    """Split a list into chunks that fit in one IN clause."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def resolve_element_ids(db: Session, element_ids: Iterable[int]) -> Set[int]:
+    """Return the given MDRM element IDs that exist, resolved with one IN query per chunk."""
+    existing: Set[int] = set()
+    for chunk in chunked(sorted(set(element_ids))):
+        existing.update(element_id for (element_id,) in db.query(MDRMElement.id).filter(MDRMElement.id.in_(chunk)))
+    return existing
+
+def count_series_members(db: Session, series_ids: List[int]) -> Dict[int, int]:
+    """Number of MDRM elements of each series, in one grouped query."""
+    if not series_ids:
+        return {}
+    return dict(db.query(
+        series_mdrm_association.c.series_id, func.count(series_mdrm_association.c.mdrm_element_id)
+    ).filter(
+        series_mdrm_association.c.series_id.in_(series_ids)
+    ).group_by(series_mdrm_association.c.series_id))
+
+def get_series_members(db: Session, series_ids: Iterable[int]) -> Dict[int, Set[int]]:
+    """Map each series to the set of its MDRM element IDs."""
+    series_ids = list(series_ids)
+    members: Dict[int, Set[int]] = {series_id: set() for series_id in series_ids}
+    for chunk in chunked(series_ids):
+        rows = db.query(
+            series_mdrm_association.c.series_id, series_mdrm_association.c.mdrm_element_id
+        ).filter(series_mdrm_association.c.series_id.in_(chunk))
+        for series_id, mdrm_element_id in rows:
+            members[series_id].add(mdrm_element_id)
+    return members
+
+def replace_series_members(db: Session, memberships: Dict[int, Set[int]]) -> Tuple[int, int]:
+    """
+    Make the members of each given series exactly the given element IDs.
+    Returns (rows added, rows removed). The caller commits.
+    """
+    current = get_series_members(db, memberships)
+    added = []
+    removed = 0
+    for series_id, element_ids in memberships.items():
+        existing = current[series_id]
+        added.extend(
+            {"series_id": series_id, "mdrm_element_id": element_id}
+            for element_id in element_ids - existing
+        )
+        stale = sorted(existing - set(element_ids))
+        for chunk in chunked(stale):
+            db.execute(series_mdrm_association.delete().where(and_(
+                series_mdrm_association.c.series_id == series_id,
+                series_mdrm_association.c.mdrm_element_id.in_(chunk)
+            )))
+        removed += len(stale)
+
+    if added:
+        db.execute(series_mdrm_association.insert(), added)
+    return len(added), removed
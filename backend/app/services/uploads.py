@@ -0,0 +1,135 @@
+"""
+Staging of resumable, chunked report uploads.
+
+Chunks are written to local disk as they are acknowledged, one file per
+chunk, and read back sequentially when the upload is finalized, so a large
+filing is never held in memory and an interrupted upload resumes from the
+last acknowledged chunk.
+"""
+from typing import Iterable, Iterator, List
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import uuid
+
+from ..models.mdrm import UploadSession
+
+UPLOAD_STAGING_DIR = os.environ.get("UPLOAD_STAGING_DIR", "./upload_staging")
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+class ChunkError(ValueError):
+    """Raised when a chunk cannot be accepted."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def new_upload_id() -> str:
+    return uuid.uuid4().hex
+
+def session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, upload_id)
+
+def chunk_path(upload_id: str, index: int) -> str:
+    return os.path.join(session_dir(upload_id), f"{index:08d}.part")
+
+def acknowledged_checksums(upload: UploadSession) -> List[str]:
+    return [checksum for checksum in (upload.chunk_checksums or "").split(",") if checksum]
+
+def store_chunk(
+    upload: UploadSession,
+    index: int,
+    body: Iterable[bytes],
+    checksum: str
+) -> bool:
+    """
+    Stream a chunk to disk and verify its SHA-256 checksum.
+    Chunks must arrive in order; re-sending an acknowledged chunk with the same
+    checksum is accepted as a no-op so retries are idempotent.
+    Returns True if the chunk was newly stored.
+    """
+    checksum = (checksum or "").strip().lower()
+    if not checksum:
+        raise ChunkError("Missing chunk checksum")
+
+    checksums = acknowledged_checksums(upload)
+    if index < upload.next_chunk:
+        if checksums[index] != checksum:
+            raise ChunkError(f"Chunk {index} was already acknowledged with a different checksum", 409)
+        return False
+    if index > upload.next_chunk:
+        raise ChunkError(f"Expected chunk {upload.next_chunk}, got chunk {index}", 409)
+
+    os.makedirs(session_dir(upload.id), exist_ok=True)
+    path = chunk_path(upload.id, index)
+    # A temporary file per request: a retried PUT of the same chunk may be running concurrently
+    fd, tmp_path = tempfile.mkstemp(dir=session_dir(upload.id), prefix=f"{index:08d}.", suffix=".tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for data in body:
+                size += len(data)
+                if size > upload.chunk_size:
+                    raise ChunkError(f"Chunk exceeds the session chunk size of {upload.chunk_size} bytes", 413)
+                digest.update(data)
+                out.write(data)
+        if digest.hexdigest() != checksum:
+            raise ChunkError(f"Checksum mismatch for chunk {index}", 422)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    upload.next_chunk = index + 1
+    upload.bytes_received = (upload.bytes_received or 0) + size
+    upload.chunk_checksums = ",".join(checksums + [checksum])
+    return True
+
+def iter_chunks(upload: UploadSession, block_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Read the acknowledged chunks back in order, one block at a time."""
+    for index in range(upload.next_chunk):
+        with open(chunk_path(upload.id, index), "rb") as chunk:
+            while True:
+                data = chunk.read(block_size)
+                if not data:
+                    break
+                yield data
+
+def file_checksum(upload: UploadSession) -> str:
+    digest = hashlib.sha256()
+    for data in iter_chunks(upload):
+        digest.update(data)
+    return digest.hexdigest()
+
+class ChunkReader(io.RawIOBase):
+    """Read-only binary stream over the staged chunks of an upload."""
+
+    def __init__(self, upload: UploadSession):
+        self._blocks = iter_chunks(upload)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = next(self._blocks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def open_text(upload: UploadSession, encoding: str = "utf-8") -> io.TextIOWrapper:
+    """Open the staged upload as a text stream, e.g. for csv.DictReader."""
+    return io.TextIOWrapper(io.BufferedReader(ChunkReader(upload)), encoding=encoding, newline="")
+
+def discard_chunks(upload_id: str):
+    shutil.rmtree(session_dir(upload_id), ignore_errors=True)
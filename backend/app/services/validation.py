@@ -1,80 +1,334 @@
-
-
-
-
-from typing import List
+from typing import Callable, Dict, Iterable, List, Optional
 import re
+import hashlib
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import operator
 from datetime import datetime
 
 from ..models.mdrm import (
-    Report, DataValue, ValidationRule, ValidationResult, MDRMElement
+    Report, DataValue, ValidationRule, ValidationResult, MDRMElement,
+    series_mdrm_association
+)
+from .rule_graph import (
+    RuleGraph, CompiledRule, NodeError, COMPARISON_OPS, split_ref
 )
+from .rule_codegen import PASS, compile_ruleset, numeric_element_values
+from .report_events import PROGRESS_INTERVAL
+from .report_records import as_value_records, load_element_records
+from .foreign_reports import ForeignReportCache
+from .history import (
+    HistoryWindow, history_cache, parse_history_reference, periods_per_year, same_period_last_year
+)
+from .peer_statistics import (
+    PeerSummary, MIN_PEER_COUNT, get_peer_group, load_peer_summaries
+)
+from .validation_summary import (
+    clear_validation_summary, rebuild_passing_results, store_validation_results
+)
+
+class ValidationContext:
+    """
+    State shared by all rules while validating one report: the report's own
+    values plus data from other filings, loaded at most once per validation.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        report: Report,
+        data_value_dict: dict,
+        mdrm_element_dict: dict,
+        foreign_cache: Optional[ForeignReportCache] = None
+    ):
+        self.db = db
+        self.report = report
+        self.data_value_dict = data_value_dict
+        self.mdrm_element_dict = mdrm_element_dict
+        self.foreign_cache = foreign_cache or ForeignReportCache()
+        self._peer_summaries: Optional[Dict[int, PeerSummary]] = None
+        self._history: Optional[HistoryWindow] = None
+        self._history_periods = 0
+
+    def preload(
+        self,
+        history: Optional[HistoryWindow] = None,
+        peer_summaries: Optional[Dict[int, PeerSummary]] = None
+    ):
+        """
+        Use data loaded for a whole batch of reports instead of loading it for
+        this report: a complete history window and the peer summaries.
+        """
+        if history is not None:
+            self._history = history
+            self._history_periods = len(history.periods)
+        if peer_summaries is not None:
+            self._peer_summaries = peer_summaries
+
+    def history(self, periods: int) -> HistoryWindow:
+        """Window of at least the last N periods filed before this report."""
+        if self._history is None or (self._history_periods < periods and not self._history.complete):
+            self._history = history_cache.get_window(self.db, self.report, max(periods, self._history_periods))
+            self._history_periods = max(periods, self._history_periods)
+        return self._history
+
+    def numeric_values(self) -> Dict[int, float]:
+        """Numeric values of the report keyed by MDRM element ID."""
+        values = {}
+        for element_id, data_value in self.data_value_dict.items():
+            mdrm_element = self.mdrm_element_dict.get(element_id)
+            if mdrm_element is None or mdrm_element.data_type not in ("numeric", "integer"):
+                continue
+            try:
+                values[element_id] = float(data_value.value)
+            except (TypeError, ValueError):
+                continue
+        return values
+
+    def peer_group(self) -> str:
+        """Peer group the report's current values place it in."""
+        return get_peer_group(
+            self.report.institution.type if self.report.institution else None,
+            {self.mdrm_element_dict[element_id].mdrm_id: value for element_id, value in self.numeric_values().items()}
+        )
+
+    def peer_summaries(self) -> Dict[int, PeerSummary]:
+        """Peer-group statistics for every element of the report, loaded in one query."""
+        if self._peer_summaries is None:
+            self._peer_summaries = load_peer_summaries(
+                self.db, self.report, self.peer_group(), list(self.data_value_dict), self.numeric_values()
+            )
+        return self._peer_summaries
 
-def validate_report_data(db: Session, report: Report, data_values: List[DataValue]) -> List[ValidationResult]:
+def validate_report_data(
+    db: Session,
+    report: Report,
+    data_values: Iterable,
+    foreign_cache: Optional[ForeignReportCache] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> List[ValidationResult]:
     """
-    Validate report data against defined validation rules.
-    Returns a list of ValidationResult objects.
+    Validate report data against defined validation rules. data_values may
+    be DataValue objects or ValueRecords. Pass a shared foreign_cache when
+    validating a batch of reports, and a progress callback to be called
+    with (rules evaluated, total rules).
+    Returns a ValidationResult for every rule evaluated; which of them are
+    stored as rows depends on the storage mode (see validation_summary).
     """
     validation_results = []
     
-    # Get all validation rules for the MDRM elements in this report
+    # Validation runs on slotted records; ORM objects are created only for the results
+    data_values = as_value_records(data_values)
     mdrm_element_ids = [dv.mdrm_element_id for dv in data_values]
-    validation_rules = db.query(ValidationRule).filter(
-        ValidationRule.mdrm_element_id.in_(mdrm_element_ids)
-    ).all()
     
     # Create a dictionary for quick lookup of data values by MDRM element ID
     data_value_dict = {dv.mdrm_element_id: dv for dv in data_values}
     
     # Create a dictionary for quick lookup of MDRM elements by ID
-    mdrm_elements = db.query(MDRMElement).filter(
-        MDRMElement.id.in_(mdrm_element_ids)
-    ).all()
-    mdrm_element_dict = {elem.id: elem for elem in mdrm_elements}
+    mdrm_element_dict = load_element_records(db, MDRMElement.id.in_(mdrm_element_ids))
+    
+    # Compile the rules for the MDRM elements in this report into a dependency
+    # graph and a generated evaluator for it, both cached per ruleset version
+    evaluator = compile_ruleset(tuple(tuple(rule) for rule in db.execute(
+        select(
+            ValidationRule.id, ValidationRule.mdrm_element_id,
+            ValidationRule.rule_type, ValidationRule.rule_expression
+        ).where(
+            ValidationRule.mdrm_element_id.in_(mdrm_element_ids)
+        ).order_by(ValidationRule.id)
+    )))
+    graph = evaluator.graph
+    context = ValidationContext(db, report, data_value_dict, mdrm_element_dict, foreign_cache)
+    
+    # Resolve every reference once, then let the generated code decide the
+    # numeric rules in one call
+    resolve_ref = ref_resolver(graph, context)
+    resolved = {ref: resolve_ref(ref) for ref in evaluator.ref_nodes}
+    outcomes = evaluator(
+        [resolved[ref] for ref in evaluator.ref_nodes],
+        numeric_element_values(data_value_dict, mdrm_element_dict)
+    )
+    frame = None
     
     # Process each validation rule
-    for rule in validation_rules:
-        if rule.mdrm_element_id not in data_value_dict:
+    for position, compiled in enumerate(graph.rules):
+        if progress is not None and position % PROGRESS_INTERVAL == 0:
+            progress(position, len(graph.rules))
+        if compiled.mdrm_element_id not in data_value_dict:
             continue
         
-        data_value = data_value_dict[rule.mdrm_element_id]
-        is_valid, message = evaluate_rule(
-            rule, data_value, data_value_dict, mdrm_element_dict, db, report
-        )
+        data_value = data_value_dict[compiled.mdrm_element_id]
+        if outcomes is not None and outcomes[position] == PASS:
+            is_valid, message = True, None
+        else:
+            # The interpreter handles the other rule types and explains failures
+            if frame is None:
+                frame = graph.evaluate(resolved.__getitem__)
+            is_valid, message = evaluate_rule(compiled, data_value, frame, context)
         
         # Create validation result
         validation_result = ValidationResult(
             data_value_id=data_value.id,
-            validation_rule_id=rule.id,
+            validation_rule_id=compiled.rule_id,
             is_valid=is_valid,
             message=message if not is_valid else None
         )
         
-        db.add(validation_result)
         validation_results.append(validation_result)
     
-    db.flush()  # Flush to get IDs for validation results
+    if progress is not None:
+        progress(len(graph.rules), len(graph.rules))
+    store_validation_results(db, report, validation_results)
+    db.flush()  # Flush to get IDs for the stored validation results
     return validation_results
 
+def evaluate_graph(graph: RuleGraph, context: ValidationContext) -> list:
+    """
+    Evaluate all expression nodes of a compiled ruleset against a report.
+    Returns the value frame indexed by node, with NodeError for failed nodes.
+    """
+    return graph.evaluate(ref_resolver(graph, context))
+
+def ref_resolver(graph: RuleGraph, context: ValidationContext) -> Callable[[str], object]:
+    """
+    Return a function mapping each reference of the graph to its value in the
+    report, or to a NodeError. Foreign reports referenced by the graph are
+    loaded in one batch first.
+    """
+    report = context.report
+    mdrm_elements_by_code = {elem.mdrm_id: elem for elem in context.mdrm_element_dict.values()}
+    
+    # Load every foreign report referenced by the ruleset in one batch
+    foreign_cache = context.foreign_cache
+    foreign_series_ids = {}
+    for qualifier, _ in graph.foreign_refs():
+        foreign_series_ids[qualifier] = foreign_cache.series_id_for(context.db, qualifier)
+    foreign_cache.load(
+        context.db, report.institution_id, report.reporting_period,
+        [series_id for series_id in foreign_series_ids.values() if series_id not in (None, report.series_id)]
+    )
+    
+    def resolve_local(mdrm_id: str):
+        mdrm_element = mdrm_elements_by_code.get(mdrm_id)
+        if not mdrm_element:
+            return NodeError(f"MDRM element {mdrm_id} not found", is_reference=True)
+        
+        data_value = context.data_value_dict.get(mdrm_element.id)
+        if not data_value:
+            return NodeError(f"Data value for {mdrm_id} not found", is_reference=True)
+        
+        try:
+            return convert_value(data_value.value, mdrm_element.data_type)
+        except ValueError:
+            return NodeError(f"Invalid value format for {mdrm_id}: {data_value.value}", is_reference=True)
+    
+    def resolve_ref(ref: str):
+        qualifier, mdrm_id = split_ref(ref)
+        if qualifier is None:
+            return resolve_local(mdrm_id)
+        
+        series_id = foreign_series_ids.get(qualifier)
+        if series_id is None:
+            return NodeError(f"Series {qualifier} not found", is_reference=True)
+        if series_id == report.series_id:
+            return resolve_local(mdrm_id)
+        
+        foreign_values = foreign_cache.get(series_id, report.institution_id, report.reporting_period)
+        if foreign_values is None:
+            return NodeError(f"No {qualifier} report for period {report.reporting_period}", is_reference=True)
+        if mdrm_id not in foreign_values:
+            return NodeError(f"Data value for {ref} not found", is_reference=True)
+        
+        value, data_type = foreign_values[mdrm_id]
+        try:
+            return convert_value(value, data_type)
+        except ValueError:
+            return NodeError(f"Invalid value format for {ref}: {value}", is_reference=True)
+    
+    return resolve_ref
+
+def get_ruleset_version(db: Session, series_id: int) -> str:
+    """
+    Compute a version string for the validation rules that apply to a series.
+    The version changes whenever a rule of the series is added, edited or removed.
+    """
+    rules = db.query(
+        ValidationRule.id,
+        ValidationRule.mdrm_element_id,
+        ValidationRule.rule_type,
+        ValidationRule.rule_expression,
+        ValidationRule.severity
+    ).join(
+        series_mdrm_association,
+        series_mdrm_association.c.mdrm_element_id == ValidationRule.mdrm_element_id
+    ).filter(
+        series_mdrm_association.c.series_id == series_id
+    ).order_by(ValidationRule.id).all()
+    
+    digest = hashlib.sha256()
+    for rule in rules:
+        digest.update(repr(tuple(rule)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def get_validation_etag(report: Report, ruleset_version: str, dependency_version: str) -> str:
+    """Build a strong ETag for the validation results of a report."""
+    key = f"{report.id}:{report.data_version or 0}:{ruleset_version}:{dependency_version}"
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+def is_validation_current(report: Report, ruleset_version: str, dependency_version: str) -> bool:
+    """
+    Check whether the persisted validation results match the report data, the
+    ruleset and the other reports that cross-series, historical and peer
+    rules can see.
+    """
+    return (
+        report.validated_data_version == (report.data_version or 0)
+        and report.validated_ruleset_version == ruleset_version
+        and report.validated_dependency_version == dependency_version
+    )
+
+def get_persisted_validation_results(db: Session, report_id: int) -> List[ValidationResult]:
+    """
+    Load the persisted validation results for the current data values of a
+    report, with the passing results that compact storage does not keep as rows.
+    """
+    stored = db.query(ValidationResult).join(
+        DataValue, ValidationResult.data_value_id == DataValue.id
+    ).filter(
+        DataValue.report_id == report_id,
+        DataValue.is_current()
+    ).all()
+    results = stored + rebuild_passing_results(db, report_id, stored)
+    # Rules are evaluated in ID order
+    return sorted(results, key=lambda result: result.validation_rule_id)
+
+def clear_validation_results(db: Session, report_id: int):
+    """
+    Delete the persisted validation results for the current data values of a report.
+    Results of values closed by earlier versions are kept with them.
+    """
+    data_value_ids = db.query(DataValue.id).filter(
+        DataValue.report_id == report_id,
+        DataValue.is_current()
+    )
+    db.query(ValidationResult).filter(
+        ValidationResult.data_value_id.in_(data_value_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+    clear_validation_summary(db, report_id)
+
 def evaluate_rule(
-    rule: ValidationRule, 
+    rule: CompiledRule, 
     data_value: DataValue, 
-    data_value_dict: dict, 
-    mdrm_element_dict: dict,
-    db: Session,
-    report: Report
+    frame: list, 
+    context: ValidationContext
 ) -> tuple:
     """
-    Evaluate a validation rule against a data value.
+    Evaluate a compiled validation rule against a data value.
     Returns a tuple of (is_valid, message).
     """
     rule_type = rule.rule_type
-    rule_expression = rule.rule_expression
     
     # Get the data type of the MDRM element
-    mdrm_element = mdrm_element_dict.get(rule.mdrm_element_id)
+    mdrm_element = context.mdrm_element_dict.get(rule.mdrm_element_id)
     if not mdrm_element:
         return False, "MDRM element not found"
     
@@ -84,15 +338,20 @@ def evaluate_rule(
     except ValueError:
         return False, f"Invalid value format for {mdrm_element.data_type}: {data_value.value}"
     
+    if rule.error:
+        return False, rule.error
+    
     # Evaluate based on rule type
     if rule_type == "range":
-        return evaluate_range_rule(rule_expression, value)
+        return evaluate_range_rule(rule, value, frame)
     elif rule_type == "comparison":
-        return evaluate_comparison_rule(rule_expression, value, data_value_dict, mdrm_element_dict)
+        return evaluate_comparison_rule(rule, value, frame)
     elif rule_type == "formula":
-        return evaluate_formula_rule(rule_expression, value, data_value_dict, mdrm_element_dict)
+        return evaluate_formula_rule(rule, value, frame)
     elif rule_type == "historical":
-        return evaluate_historical_rule(rule_expression, value, db, report, mdrm_element)
+        return evaluate_historical_rule(rule.expression, value, context, mdrm_element)
+    elif rule_type == "peer":
+        return evaluate_peer_rule(rule.expression, value, context, mdrm_element)
     else:
         return False, f"Unknown rule type: {rule_type}"
 
@@ -107,264 +366,144 @@ def convert_value(value_str: str, data_type: str):
     else:
         return value_str  # Keep as string for text types
 
-def evaluate_range_rule(expression: str, value) -> tuple:
+def evaluate_range_rule(rule: CompiledRule, value, frame: list) -> tuple:
     """
     Evaluate a range rule like ">= 0" or "between 1 and 100".
     Returns (is_valid, message).
     """
     try:
-        if "between" in expression.lower():
-            match = re.match(r"between\s+(\S+)\s+and\s+(\S+)", expression, re.IGNORECASE)
-            if match:
-                min_val = float(match.group(1))
-                max_val = float(match.group(2))
-                if min_val <= value <= max_val:
-                    return True, None
-                else:
-                    return False, f"Value {value} is not between {min_val} and {max_val}"
-        else:
-            # Handle operators like >, <, >=, <=, ==, !=
-            ops = {
-                '>': operator.gt,
-                '<': operator.lt,
-                '>=': operator.ge,
-                '<=': operator.le,
-                '==': operator.eq,
-                '!=': operator.ne
-            }
-            
-            for op_str, op_func in ops.items():
-                if op_str in expression:
-                    parts = expression.split(op_str)
-                    if len(parts) == 2:
-                        threshold = float(parts[1].strip())
-                        if op_func(value, threshold):
-                            return True, None
-                        else:
-                            return False, f"Value {value} does not satisfy {expression}"
+        if rule.bounds:
+            min_val, max_val = rule.bounds
+            if min_val <= value <= max_val:
+                return True, None
+            else:
+                return False, f"Value {value} is not between {min_val} and {max_val}"
         
-        return False, f"Invalid range expression: {expression}"
+        threshold = frame[rule.target]
+        if COMPARISON_OPS[rule.op](value, threshold):
+            return True, None
+        else:
+            return False, f"Value {value} does not satisfy {rule.expression}"
     except Exception as e:
         return False, f"Error evaluating range rule: {str(e)}"
 
-def evaluate_comparison_rule(
-    expression: str, 
-    value, 
-    data_value_dict: dict, 
-    mdrm_element_dict: dict
-) -> tuple:
+def resolve_target(rule: CompiledRule, frame: list):
+    """
+    Look up the expected value of a rule in the evaluated frame.
+    If it could not be computed, returns the NodeError of the first failing
+    MDRM reference in the rule, or the arithmetic error itself.
+    """
+    expected = frame[rule.target]
+    if isinstance(expected, NodeError):
+        for index in rule.refs:
+            if isinstance(frame[index], NodeError):
+                return frame[index]
+    return expected
+
+def evaluate_comparison_rule(rule: CompiledRule, value, frame: list) -> tuple:
     """
     Evaluate a comparison rule like "= RCFD1480" or "> RCFD1480 + RCFD1481".
     Returns (is_valid, message).
     """
     try:
-        # Extract MDRM IDs from the expression
-        mdrm_ids = re.findall(r'[A-Z]{4}\d{4}', expression)
-        
-        # Replace MDRM IDs with their values
-        expr = expression
-        for mdrm_id in mdrm_ids:
-            # Find the MDRM element by ID
-            mdrm_element = next(
-                (elem for elem in mdrm_element_dict.values() if elem.mdrm_id == mdrm_id), 
-                None
-            )
-            
-            if not mdrm_element:
-                return False, f"MDRM element {mdrm_id} not found"
-            
-            # Find the data value for this MDRM element
-            data_value = next(
-                (dv for dv in data_value_dict.values() if dv.mdrm_element_id == mdrm_element.id),
-                None
-            )
-            
-            if not data_value:
-                return False, f"Data value for {mdrm_id} not found"
-            
-            # Convert value based on data type
-            try:
-                other_value = convert_value(data_value.value, mdrm_element.data_type)
-                expr = expr.replace(mdrm_id, str(other_value))
-            except ValueError:
-                return False, f"Invalid value format for {mdrm_id}: {data_value.value}"
-        
-        # Extract operator
-        ops = {
-            '>': operator.gt,
-            '<': operator.lt,
-            '>=': operator.ge,
-            '<=': operator.le,
-            '==': operator.eq,
-            '=': operator.eq,
-            '!=': operator.ne
-        }
-        
-        op_str = None
-        for op in ops.keys():
-            if op in expr:
-                op_str = op
-                break
-        
-        if not op_str:
-            return False, f"No operator found in expression: {expression}"
-        
-        # Split expression by operator
-        parts = expr.split(op_str, 1)
-        if len(parts) != 2:
-            return False, f"Invalid comparison expression: {expression}"
-        
-        # Evaluate both sides
-        left_side = eval(parts[0].strip())
-        right_side = eval(parts[1].strip())
+        right_side = resolve_target(rule, frame)
+        if isinstance(right_side, NodeError):
+            if right_side.is_reference:
+                return False, right_side.message
+            return False, f"Error evaluating comparison rule: {right_side.message}"
         
         # Compare using the operator
-        if ops[op_str](value, right_side):
+        if COMPARISON_OPS[rule.op](value, right_side):
             return True, None
         else:
-            return False, f"Value {value} does not satisfy {expression} (evaluated as {value} {op_str} {right_side})"
-    
+            return False, f"Value {value} does not satisfy {rule.expression} (evaluated as {value} {rule.op} {right_side})"
+
     except Exception as e:
         return False, f"Error evaluating comparison rule: {str(e)}"
 
-def evaluate_formula_rule(
-    expression: str, 
-    value, 
-    data_value_dict: dict, 
-    mdrm_element_dict: dict
-) -> tuple:
+def evaluate_formula_rule(rule: CompiledRule, value, frame: list) -> tuple:
     """
     Evaluate a formula rule like "= RCFD1480 + RCFD1481".
     Returns (is_valid, message).
     """
     try:
-        # Extract MDRM IDs from the expression
-        mdrm_ids = re.findall(r'[A-Z]{4}\d{4}', expression)
-        
-        # Replace MDRM IDs with their values
-        expr = expression
-        for mdrm_id in mdrm_ids:
-            # Find the MDRM element by ID
-            mdrm_element = next(
-                (elem for elem in mdrm_element_dict.values() if elem.mdrm_id == mdrm_id), 
-                None
-            )
-            
-            if not mdrm_element:
-                return False, f"MDRM element {mdrm_id} not found"
-            
-            # Find the data value for this MDRM element
-            data_value = next(
-                (dv for dv in data_value_dict.values() if dv.mdrm_element_id == mdrm_element.id),
-                None
-            )
-            
-            if not data_value:
-                return False, f"Data value for {mdrm_id} not found"
-            
-            # Convert value based on data type
-            try:
-                other_value = convert_value(data_value.value, mdrm_element.data_type)
-                expr = expr.replace(mdrm_id, str(other_value))
-            except ValueError:
-                return False, f"Invalid value format for {mdrm_id}: {data_value.value}"
-        
-        # Extract operator and expected result
-        match = re.match(r"([=<>!]+)\s*(.*)", expr)
-        if not match:
-            return False, f"Invalid formula expression: {expression}"
-        
-        op_str = match.group(1)
-        formula = match.group(2)
-        
-        # Map operators
-        ops = {
-            '>': operator.gt,
-            '<': operator.lt,
-            '>=': operator.ge,
-            '<=': operator.le,
-            '==': operator.eq,
-            '=': operator.eq,
-            '!=': operator.ne
-        }
-        
-        if op_str not in ops:
-            return False, f"Unsupported operator in formula: {op_str}"
-        
-        # Evaluate the formula
-        expected_value = eval(formula)
+        expected_value = resolve_target(rule, frame)
+        if isinstance(expected_value, NodeError):
+            if expected_value.is_reference:
+                return False, expected_value.message
+            return False, f"Error evaluating formula rule: {expected_value.message}"
         
         # Compare the actual value with the expected value
-        if ops[op_str](value, expected_value):
+        if COMPARISON_OPS[rule.op](value, expected_value):
             return True, None
         else:
-            return False, f"Value {value} does not satisfy {expression} (expected {op_str} {expected_value})"
-    
+            return False, f"Value {value} does not satisfy {rule.expression} (expected {rule.op} {expected_value})"
+
     except Exception as e:
         return False, f"Error evaluating formula rule: {str(e)}"
 
 def evaluate_historical_rule(
     expression: str, 
     value, 
-    db: Session,
-    current_report: Report,
+    context: ValidationContext,
     mdrm_element: MDRMElement
 ) -> tuple:
     """
     Evaluate a rule that compares with historical data.
-    Example: ">= previous_period" or "< previous_period * 1.1"
+    Examples: ">= previous_period", "< previous_period * 1.1",
+    "<= same_period_last_year * 1.5", "< avg(last 4 periods) * 2" or "<= max(last 8 periods)"
     Returns (is_valid, message).
     """
     try:
         # Parse the expression to determine which historical data to fetch
-        match = re.match(r"([=<>!]+)\s*(previous_period)(?:\s*([*/+-])\s*([0-9.]+))?", expression)
+        match = re.match(
+            r"\s*(==|!=|>=|<=|=|>|<)\s*(previous_period|same_period_last_year|(?:avg|max|min)\([^)]*\))"
+            r"(?:\s*([*/+-])\s*([0-9.]+))?\s*$",
+            expression
+        )
         if not match:
             return False, f"Invalid historical expression: {expression}"
         
         op_str = match.group(1)
-        period_ref = match.group(2)
         modifier_op = match.group(3)
         modifier_val = match.group(4)
         
-        # Map operators
-        ops = {
-            '>': operator.gt,
-            '<': operator.lt,
-            '>=': operator.ge,
-            '<=': operator.le,
-            '==': operator.eq,
-            '=': operator.eq,
-            '!=': operator.ne
-        }
-        
-        if op_str not in ops:
-            return False, f"Unsupported operator in historical rule: {op_str}"
-        
-        # Get the previous period report
-        # This is a simplified approach - in a real system, you'd need more sophisticated period handling
-        previous_report = db.query(Report).filter(
-            Report.series_id == current_report.series_id,
-            Report.institution_id == current_report.institution_id,
-            Report.id < current_report.id
-        ).order_by(Report.id.desc()).first()
+        try:
+            aggregate, periods = parse_history_reference(match.group(2))
+        except ValueError:
+            return False, f"Invalid historical expression: {expression}"
         
-        if not previous_report:
-            return True, None  # No previous report to compare with, assume valid
+        # Load (or reuse) the window of earlier periods shared by all historical rules
+        report = context.report
+        if aggregate == "last_year":
+            periods = periods_per_year(report.reporting_period)
+        window = context.history(periods)
         
-        # Get the previous value for this MDRM element
-        previous_value = db.query(DataValue).filter(
-            DataValue.report_id == previous_report.id,
-            DataValue.mdrm_element_id == mdrm_element.id
-        ).first()
+        if aggregate == "last_year":
+            previous = window.value_for_period(mdrm_element.id, same_period_last_year(report.reporting_period))
+            previous_values = [previous] if previous is not None else []
+        else:
+            previous_values = window.series(mdrm_element.id, periods)
         
-        if not previous_value:
+        if not previous_values:
             return True, None  # No previous value to compare with, assume valid
         
-        # Convert previous value based on data type
-        try:
-            prev_val = convert_value(previous_value.value, mdrm_element.data_type)
-        except ValueError:
-            return False, f"Invalid previous value format: {previous_value.value}"
+        # Convert previous values based on data type
+        converted = []
+        for previous_value in previous_values:
+            try:
+                converted.append(convert_value(previous_value, mdrm_element.data_type))
+            except ValueError:
+                return False, f"Invalid previous value format: {previous_value}"
+        
+        if aggregate == "avg":
+            prev_val = sum(converted) / len(converted)
+        elif aggregate == "max":
+            prev_val = max(converted)
+        elif aggregate == "min":
+            prev_val = min(converted)
+        else:
+            prev_val = converted[0]
         
         # Apply modifier if present
         if modifier_op and modifier_val:
@@ -378,8 +517,8 @@ def evaluate_historical_rule(
             elif modifier_op == '-':
                 prev_val -= modifier
         
-        # Compare the current value with the (possibly modified) previous value
-        if ops[op_str](value, prev_val):
+        # Compare the current value with the (possibly modified) historical value
+        if COMPARISON_OPS[op_str](value, prev_val):
             return True, None
         else:
             return False, f"Value {value} does not satisfy historical comparison: {expression} (compared to {prev_val})"
@@ -387,4 +526,43 @@ def evaluate_historical_rule(
     except Exception as e:
         return False, f"Error evaluating historical rule: {str(e)}"
 
-
+def evaluate_peer_rule(
+    expression: str,
+    value,
+    context: ValidationContext,
+    mdrm_element: MDRMElement
+) -> tuple:
+    """
+    Evaluate a rule that compares with the peer group of the report for the same period.
+    Example: "within 3 sigma of peer_median" or "within 2.5 sigma of peer_mean"
+    Returns (is_valid, message).
+    """
+    try:
+        match = re.match(
+            r"\s*within\s+([0-9.]+)\s+sigma\s+of\s+peer_(median|mean)\s*$", expression, re.IGNORECASE
+        )
+        if not match:
+            return False, f"Invalid peer expression: {expression}"
+        
+        sigmas = float(match.group(1))
+        center_name = match.group(2).lower()
+        
+        summary = context.peer_summaries().get(mdrm_element.id)
+        if not summary or summary.count < MIN_PEER_COUNT:
+            return True, None  # Too few peers to compare with, assume valid
+        
+        stddev = summary.stddev
+        center = summary.median if center_name == "median" else summary.mean
+        if stddev is None or center is None:
+            return True, None
+        
+        if abs(value - center) <= sigmas * stddev:
+            return True, None
+        else:
+            return False, (
+                f"Value {value} is more than {sigmas:g} sigma from the peer group {center_name} "
+                f"{center:.6g} (sigma {stddev:.6g}, {summary.count} peers)"
+            )
+    
+    except Exception as e:
+        return False, f"Error evaluating peer rule: {str(e)}"
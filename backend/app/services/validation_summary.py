@@ -0,0 +1,106 @@
+"""
+Compact storage of validation results.
+
+Nearly all results are passes with no message, so in compact mode (the
+default) only failing results are stored as validation_results rows. For
+each report, validation_summaries keeps a zlib-compressed bitmap of every
+rule evaluated on its current data. The passing results are rebuilt from
+that bitmap when results are read, so a validation writes one summary row
+plus one row per failure.
+
+Set VALIDATION_STORAGE=full to store passing results as rows as well.
+Reading works the same with either mode, including data validated before
+a switch.
+"""
+from typing import Dict, Iterable, List
+import os
+import struct
+import zlib
+
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import DataValue, Report, ValidationResult, ValidationRule, ValidationSummary
+from .series_members import chunked
+
+COMPACT_STORAGE = os.environ.get("VALIDATION_STORAGE", "compact").lower() != "full"
+
+# The bitmap starts with the smallest rule ID, so it only spans the rules of one series
+_HEADER = struct.Struct(">I")
+
+def encode_rule_ids(rule_ids: Iterable[int]) -> bytes:
+    """Compress a set of rule IDs into a bitmap offset by the smallest ID."""
+    rule_ids = sorted(set(rule_ids))
+    if not rule_ids:
+        return b""
+    base = rule_ids[0]
+    bitmap = bytearray((rule_ids[-1] - base) // 8 + 1)
+    for rule_id in rule_ids:
+        offset = rule_id - base
+        bitmap[offset >> 3] |= 1 << (offset & 7)
+    return zlib.compress(_HEADER.pack(base) + bytes(bitmap))
+
+def decode_rule_ids(data: bytes) -> List[int]:
+    """Sorted rule IDs of a bitmap written by encode_rule_ids."""
+    if not data:
+        return []
+    raw = zlib.decompress(data)
+    (base,) = _HEADER.unpack_from(raw)
+    rule_ids = []
+    for index, byte in enumerate(raw[_HEADER.size:]):
+        while byte:
+            bit = byte & -byte
+            rule_ids.append(base + index * 8 + bit.bit_length() - 1)
+            byte ^= bit
+    return rule_ids
+
+def store_validation_results(db: Session, report: Report, validation_results: List[ValidationResult]):
+    """
+    Persist the results of one validation of a report: the result rows the
+    storage mode keeps and the summary of evaluated rules. The caller commits.
+    """
+    stored = validation_results if not COMPACT_STORAGE else [
+        result for result in validation_results if not result.is_valid
+    ]
+    db.add_all(stored)
+    db.merge(ValidationSummary(
+        report_id=report.id,
+        data_version=report.data_version or 0,
+        rule_count=len(validation_results),
+        failure_count=sum(1 for result in validation_results if not result.is_valid),
+        evaluated_rules=encode_rule_ids(result.validation_rule_id for result in validation_results)
+    ))
+
+def clear_validation_summary(db: Session, report_id: int):
+    db.query(ValidationSummary).filter(
+        ValidationSummary.report_id == report_id
+    ).delete(synchronize_session=False)
+
+def rebuild_passing_results(
+    db: Session,
+    report_id: int,
+    stored_results: List[ValidationResult]
+) -> List[ValidationResult]:
+    """
+    Passing results of the evaluated rules that have no stored row. They
+    are transient objects with no ID, bound to the current data values.
+    """
+    summary = db.query(ValidationSummary).filter(ValidationSummary.report_id == report_id).first()
+    if summary is None:
+        return []
+    stored_rule_ids = {result.validation_rule_id for result in stored_results}
+    missing = [rule_id for rule_id in decode_rule_ids(summary.evaluated_rules) if rule_id not in stored_rule_ids]
+
+    # Each rule checks the data value of its own MDRM element
+    data_value_ids: Dict[int, int] = {}
+    for chunk in chunked(missing):
+        data_value_ids.update(db.query(ValidationRule.id, DataValue.id).join(
+            DataValue, DataValue.mdrm_element_id == ValidationRule.mdrm_element_id
+        ).filter(
+            ValidationRule.id.in_(chunk),
+            DataValue.report_id == report_id,
+            DataValue.is_current()
+        ))
+    return [
+        ValidationResult(data_value_id=data_value_ids[rule_id], validation_rule_id=rule_id, is_valid=True)
+        for rule_id in missing if rule_id in data_value_ids
+    ]
@@ -0,0 +1,168 @@
+"""
+Streaming ingestion of XBRL instance documents.
+
+Call report instances hold one fact per MDRM item, named by the MDRM ID
+(e.g. <cc:RCON2170 contextRef="..." unitRef="USD">, item codes may also
+contain letters as in RCONF236), plus the contexts that say which entity
+and period each fact is for. The document is read with iterparse and
+every top-level element is cleared once handled, so memory stays bounded
+by the facts that map to the report's series, not by the size of the
+instance.
+
+Concept names are mapped to MDRM elements through a per-series taxonomy
+lookup that is cached until the series membership changes. Facts of
+other periods (e.g. prior-quarter comparatives), of dimensional contexts
+and nil facts are skipped. Values are stored as reported, without scaling.
+"""
+from typing import IO, Dict, List, Optional, Tuple
+import hashlib
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from sqlalchemy.orm import Session
+
+from ..models.mdrm import MDRMElement, Series, series_mdrm_association
+
+XBRLI_NS = "http://www.xbrl.org/2003/instance"
+XSI_NIL = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+
+# Namespaces of instance plumbing rather than facts
+NON_FACT_NAMESPACES = {
+    XBRLI_NS,
+    "http://www.xbrl.org/2003/linkbase",
+    "http://xbrl.org/2006/xbrldi"
+}
+
+_QUARTER_RE = re.compile(r"^\d{4}Q[1-4]$")
+
+class XBRLError(ValueError):
+    """Raised for documents that are not a usable XBRL instance."""
+
+class TaxonomyCache:
+    """Process-wide map of each series' MDRM IDs to element IDs, reloaded when its membership changes."""
+
+    def __init__(self):
+        self.series: Dict[int, Tuple[str, Dict[str, int]]] = {}
+        self.lock = threading.Lock()
+
+    def _membership_stamp(self, db: Session, series_id: int) -> str:
+        """Hash of the series' sorted element IDs."""
+        element_ids = db.query(series_mdrm_association.c.mdrm_element_id).filter(
+            series_mdrm_association.c.series_id == series_id
+        ).order_by(series_mdrm_association.c.mdrm_element_id).all()
+        digest = hashlib.sha256()
+        for (element_id,) in element_ids:
+            digest.update(f"{element_id},".encode())
+        return digest.hexdigest()
+
+    def get(self, db: Session, series: Series) -> Dict[str, int]:
+        stamp = self._membership_stamp(db, series.id)
+        with self.lock:
+            cached = self.series.get(series.id)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+
+        concepts = dict(db.query(MDRMElement.mdrm_id, MDRMElement.id).join(
+            series_mdrm_association, series_mdrm_association.c.mdrm_element_id == MDRMElement.id
+        ).filter(series_mdrm_association.c.series_id == series.id))
+        with self.lock:
+            self.series[series.id] = (stamp, concepts)
+        return concepts
+
+taxonomy_cache = TaxonomyCache()
+
+def period_label(date_text: str) -> Optional[str]:
+    """Quarter label of an XBRL date, e.g. "2023-03-31" -> "2023Q1"."""
+    try:
+        year, month = int(date_text[:4]), int(date_text[5:7])
+    except ValueError:
+        return None
+    if not 1 <= month <= 12:
+        return None
+    return f"{year}Q{(month - 1) // 3 + 1}"
+
+def _split_tag(tag: str) -> Tuple[str, str]:
+    if tag.startswith("{"):
+        namespace, local = tag[1:].split("}", 1)
+        return namespace, local
+    return "", tag
+
+def _context_period(context: ElementTree.Element) -> Optional[str]:
+    """Period label of a context, or None for dimensional contexts and unreadable periods."""
+    if context.find(f".//{{{XBRLI_NS}}}segment") is not None or context.find(f".//{{{XBRLI_NS}}}scenario") is not None:
+        return None
+    period = context.find(f"{{{XBRLI_NS}}}period")
+    if period is None:
+        return None
+    date = period.find(f"{{{XBRLI_NS}}}instant")
+    if date is None:
+        date = period.find(f"{{{XBRLI_NS}}}endDate")
+    if date is None or not (date.text or "").strip():
+        return None
+    return period_label(date.text.strip())
+
+def parse_instance(
+    file: IO[bytes],
+    concepts: Dict[str, int],
+    reporting_period: Optional[str] = None
+) -> Tuple[List[dict], dict]:
+    """
+    Extract the facts of an instance that map to the given concepts
+    (MDRM ID -> element ID). When reporting_period is a quarter such as
+    "2023Q1", only facts of contexts in that quarter are kept.
+    Returns (data values, summary of what was read and skipped).
+    """
+    wanted_period = reporting_period if reporting_period and _QUARTER_RE.match(reporting_period) else None
+    contexts: Dict[str, Optional[str]] = {}
+    facts: List[Tuple[int, str, str]] = []
+    summary = {"facts": 0, "nil_facts": 0, "unmapped_facts": 0, "other_period_facts": 0}
+
+    root = None
+    depth = 0
+    try:
+        for event, element in ElementTree.iterparse(file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                    if element.tag != f"{{{XBRLI_NS}}}xbrl":
+                        raise XBRLError("Document is not an XBRL instance")
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            # A top-level element is complete: handle it, then drop it
+            namespace, local = _split_tag(element.tag)
+            if namespace == XBRLI_NS and local == "context":
+                contexts[element.get("id")] = _context_period(element)
+            elif namespace not in NON_FACT_NAMESPACES and element.get("contextRef") is not None:
+                summary["facts"] += 1
+                element_id = concepts.get(local.upper())
+                if element_id is None:
+                    summary["unmapped_facts"] += 1
+                elif element.get(XSI_NIL) == "true":
+                    summary["nil_facts"] += 1
+                else:
+                    facts.append((element_id, element.get("contextRef"), (element.text or "").strip()))
+            root.clear()
+    except ElementTree.ParseError as e:
+        raise XBRLError(f"Invalid XML: {e}")
+
+    if root is None:
+        raise XBRLError("Empty document")
+
+    # Contexts usually precede the facts, but may follow them, so they are resolved last
+    data_values = []
+    for element_id, context_ref, value in facts:
+        if context_ref not in contexts:
+            raise XBRLError(f"Undefined context {context_ref}")
+        period = contexts[context_ref]
+        if period is None or (wanted_period and period != wanted_period):
+            summary["other_period_facts"] += 1
+            continue
+        data_values.append({"mdrm_element_id": element_id, "value": value})
+    summary["mapped_facts"] = len(data_values)
+    return data_values, summary
@@ -0,0 +1,143 @@
+"""
+Compare the generated ruleset evaluator with the rule interpreter:
+
+    python -m app.utils.benchmark_rules [--elements N] [--runs N] [--fail-rate F]
+
+Builds a synthetic ruleset over N elements (a range edit on every element,
+plus sum and comparison edits over groups of them) and a report that passes
+all but the given fraction of the edits, then times the evaluation of the
+report by both paths and checks that they agree.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the parent directory to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.services.report_records import ElementRecord, ValueRecord
+from app.services.rule_codegen import PASS, UNDECIDED, compile_ruleset, numeric_element_values
+from app.services.validation import ValidationContext, evaluate_rule
+
+GROUP_SIZE = 4
+
+def build_ruleset(elements: int) -> tuple:
+    """Rule specs over elements 1..N: ranges, group totals and comparisons."""
+    specs = []
+    rule_id = 0
+    for element_id in range(1, elements + 1):
+        rule_id += 1
+        specs.append((rule_id, element_id, "range", ">= 0"))
+    # Every GROUP_SIZE + 1 elements, the last is the total of the others
+    for start in range(1, elements - GROUP_SIZE + 1, GROUP_SIZE + 1):
+        parts = " + ".join(f"RCON{element_id:04d}" for element_id in range(start, start + GROUP_SIZE))
+        total_id = start + GROUP_SIZE
+        rule_id += 1
+        specs.append((rule_id, total_id, "formula", f"= {parts}"))
+        rule_id += 1
+        specs.append((rule_id, start, "comparison", f"<= RCON{total_id:04d}"))
+    return tuple(specs)
+
+def build_report(elements: int, fail_rate: float, seed: int = 1) -> dict:
+    """Reported values by element ID that satisfy the ruleset, with some values made negative."""
+    rng = random.Random(seed)
+    values = {}
+    for start in range(1, elements + 1, GROUP_SIZE + 1):
+        group = [rng.randint(0, 10_000) for _ in range(GROUP_SIZE)]
+        for offset, value in enumerate(group + [sum(group)]):
+            if start + offset <= elements:
+                values[start + offset] = value
+    for element_id in values:
+        if rng.random() < fail_rate:
+            values[element_id] = -values[element_id] - 1
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--elements", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.elements > 9999:
+        parser.error("--elements must be at most 9999")
+
+    specs = build_ruleset(args.elements)
+    started = time.perf_counter()
+    evaluator = compile_ruleset(specs)
+    compile_ms = (time.perf_counter() - started) * 1000
+    graph = evaluator.graph
+
+    reported = build_report(args.elements, args.fail_rate)
+    elements = {
+        element_id: ElementRecord(element_id, f"RCON{element_id:04d}", "numeric")
+        for element_id in reported
+    }
+    data_values = {
+        element_id: ValueRecord(element_id, element_id, str(value))
+        for element_id, value in reported.items()
+    }
+    context = ValidationContext(None, None, data_values, elements)
+    by_code = {element.mdrm_id: float(reported[element.id]) for element in elements.values()}
+    resolved = {ref: by_code[ref] for ref in evaluator.ref_nodes}
+
+    def interpret():
+        frame = graph.evaluate(resolved.__getitem__)
+        return [
+            evaluate_rule(rule, data_values[rule.mdrm_element_id], frame, context)[0]
+            for rule in graph.rules
+        ]
+
+    ref_values = [resolved[ref] for ref in evaluator.ref_nodes]
+    element_values = numeric_element_values(data_values, elements)
+
+    def generated_function():
+        return evaluator(ref_values, element_values)
+
+    def generated():
+        outcomes = evaluator(
+            [resolved[ref] for ref in evaluator.ref_nodes],
+            numeric_element_values(data_values, elements)
+        )
+        # Failed rules are interpreted again for their messages, as validation does
+        results = []
+        frame = None
+        for position, rule in enumerate(graph.rules):
+            if outcomes[position] == PASS:
+                results.append(True)
+                continue
+            if frame is None:
+                frame = graph.evaluate(resolved.__getitem__)
+            results.append(evaluate_rule(rule, data_values[rule.mdrm_element_id], frame, context)[0])
+        return results
+
+    expected = interpret()
+    if generated() != expected:
+        sys.exit("Generated evaluator disagrees with the interpreter")
+    undecided = generated_function().count(UNDECIDED)
+
+    print(
+        f"{len(graph.rules)} rules, {len(graph.nodes)} nodes, "
+        f"{expected.count(False)} failing, {undecided} undecided; "
+        f"code generation {compile_ms:.1f} ms ({len(evaluator.source.splitlines())} lines)"
+    )
+    # "generated" includes converting the reported values and interpreting
+    # the failed rules again; "function" is the generated code alone
+    for name, function in (
+        ("interpreter", interpret), ("generated", generated), ("function", generated_function)
+    ):
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(
+            f"{name:>12}: median {statistics.median(timings):8.3f} ms"
+            f"  min {timings[0]:8.3f} ms  max {timings[-1]:8.3f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Measure application startup time, as paid by every worker process:
+
+    python -m app.utils.benchmark_startup [--runs N]
+
+Each run starts a fresh interpreter, imports app.main and runs the startup
+handlers, and reports the time spent in each step.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+
+_RUN_ONCE = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+asyncio.run(app.router.startup())
+ready = time.perf_counter()
+print(json.dumps({"import": imported - started, "startup": ready - imported, "total": ready - started}))
+"""
+
+def run_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _RUN_ONCE],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    for step in ("import", "startup", "total"):
+        timings = sorted(run[step] * 1000 for run in runs)
+        print(
+            f"{step:>8}: median {statistics.median(timings):8.1f} ms"
+            f"  min {timings[0]:8.1f} ms  max {timings[-1]:8.1f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
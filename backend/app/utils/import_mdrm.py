@@ -0,0 +1,41 @@
+"""
+Load the MDRM data dictionary from the command line:
+
+    python -m app.utils.import_mdrm MDRM.zip [--include-inactive] [--no-series]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from app.models.base import SessionLocal
+from app.services.mdrm_dictionary import import_dictionary
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the MDRM data dictionary")
+    parser.add_argument("path", help="MDRM_CSV.csv or the zip file containing it")
+    parser.add_argument("--include-inactive", action="store_true", help="Also import items whose end date has passed")
+    parser.add_argument("--no-series", action="store_true", help="Do not update series memberships")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as file:
+            result = import_dictionary(
+                db, file, active_only=not args.include_inactive, update_series=not args.no_series
+            )
+    finally:
+        db.close()
+
+    print(f"Inserted {result['inserted']} and updated {result['updated']} MDRM elements")
+    for series_id in result["series_updated"]:
+        print(f"Updated members of series {series_id}")
+    print(
+        f"Memberships: {result['memberships_added']} added, {result['memberships_removed']} removed"
+        f" ({result['elapsed_ms']:.0f} ms)"
+    )
+
+if __name__ == "__main__":
+    main()
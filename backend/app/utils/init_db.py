@@ -11,17 +11,19 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent.parent))
 
 from sqlalchemy.orm import Session
-from app.models.base import engine, Base, SessionLocal
+from app.models.base import engine, SessionLocal
 from app.models.user import User, UserRole
 from app.models.mdrm import (
     MDRMElement, Series, Institution, Report, 
     ValidationRule, series_mdrm_association
 )
 from app.auth.jwt import get_password_hash
+from app.utils.migrate import upgrade_schema
 
 def init_db():
-    # Create tables
-    Base.metadata.create_all(bind=engine)
+    # Create or upgrade the tables
+    for change in upgrade_schema(engine):
+        print(change)
     
     # Create a database session
     db = SessionLocal()
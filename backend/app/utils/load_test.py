@@ -0,0 +1,271 @@
+"""
+Filing-day load test against a running server:
+
+    python -m app.utils.load_test [--base-url URL] [--concurrency N] [--duration S]
+                                  [--items N] [--json PATH]
+
+Each virtual user logs in, creates a report and then replays a weighted mix
+of logins, report creation, JSON and CSV submissions of --items values,
+list and detail reads and validation polling until the duration is over.
+Reports throughput and p50/p95/p99 latency per endpoint, with error rates;
+429 responses from submission admission control are counted separately.
+Use a disposable database: the test creates reports and data.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+# Relative frequency of each operation in the replayed mix
+DEFAULT_MIX = {
+    "login": 2,
+    "create_report": 3,
+    "submit_json": 10,
+    "submit_csv": 5,
+    "list_reports": 30,
+    "report_detail": 25,
+    "validation": 25
+}
+
+class Results:
+    """Latencies and outcomes per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Dict[str, Counter] = {}
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int], error: Optional[str] = None):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if error is not None:
+            outcome = error
+        elif status == 429:
+            outcome = "rejected"
+        elif status >= 400:
+            outcome = f"http_{status}"
+        else:
+            outcome = "ok"
+        self.outcomes.setdefault(endpoint, Counter())[outcome] += 1
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(results: Results, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint in sorted(results.latencies):
+        latencies = sorted(results.latencies[endpoint])
+        outcomes = results.outcomes[endpoint]
+        count = len(latencies)
+        errors = count - outcomes["ok"] - outcomes["rejected"]
+        endpoints[endpoint] = {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "error_rate": round(errors / count, 4),
+            "rejected_rate": round(outcomes["rejected"] / count, 4),
+            "outcomes": dict(outcomes)
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    all_latencies = sorted(latency for values in results.latencies.values() for latency in values)
+    errors = sum(
+        sum(count for outcome, count in outcomes.items() if outcome not in ("ok", "rejected"))
+        for outcomes in results.outcomes.values()
+    )
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "endpoints": endpoints
+    }
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, args, fixtures: dict, results: Results, seed: int):
+        self.client = client
+        self.args = args
+        self.fixtures = fixtures
+        self.results = results
+        self.rng = random.Random(seed)
+        self.headers: Dict[str, str] = {}
+        self.report_ids: List[int] = []
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.results.record(endpoint, time.perf_counter() - started, None, type(e).__name__)
+            return None
+        self.results.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def login(self):
+        response = await self.request(
+            "POST /token", "POST", "/token",
+            data={"username": self.args.username, "password": self.args.password}
+        )
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def create_report(self):
+        response = await self.request("POST /reports/", "POST", "/reports/", json={
+            "series_id": self.fixtures["series_id"],
+            "institution_id": self.rng.choice(self.fixtures["institution_ids"]),
+            "reporting_period": f"{self.rng.randint(2000, 2099)}Q{self.rng.randint(1, 4)}"
+        })
+        if response is not None and response.status_code == 200:
+            self.report_ids.append(response.json()["id"])
+
+    def submission_values(self) -> List[tuple]:
+        elements = self.fixtures["elements"]
+        chosen = self.rng.sample(elements, min(self.args.items, len(elements)))
+        return [(element_id, mdrm_id, str(self.rng.randint(0, 1_000_000))) for element_id, mdrm_id in chosen]
+
+    async def submit_json(self):
+        report_id = self.rng.choice(self.report_ids)
+        await self.request("POST /reports/{id}/data", "POST", f"/reports/{report_id}/data", json={
+            "report_id": report_id,
+            "data_values": [
+                {"mdrm_element_id": element_id, "value": value}
+                for element_id, _, value in self.submission_values()
+            ]
+        })
+
+    async def submit_csv(self):
+        report_id = self.rng.choice(self.report_ids)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["mdrm_id", "value"])
+        writer.writerows((mdrm_id, value) for _, mdrm_id, value in self.submission_values())
+        await self.request(
+            "POST /reports/{id}/upload-csv", "POST", f"/reports/{report_id}/upload-csv",
+            files={"file": ("load_test.csv", buffer.getvalue().encode("utf-8"), "text/csv")}
+        )
+
+    async def list_reports(self):
+        await self.request("GET /reports/", "GET", "/reports/", params={"limit": 100})
+
+    async def report_detail(self):
+        await self.request("GET /reports/{id}", "GET", f"/reports/{self.rng.choice(self.report_ids)}")
+
+    async def validation(self):
+        await self.request(
+            "GET /reports/{id}/validation", "GET", f"/reports/{self.rng.choice(self.report_ids)}/validation"
+        )
+
+    async def run(self, deadline: float, mix: Dict[str, int]):
+        await self.login()
+        await self.create_report()
+        operations = list(mix)
+        weights = [mix[operation] for operation in operations]
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            if not self.report_ids and operation not in ("login", "list_reports"):
+                operation = "create_report"
+            await getattr(self, operation)()
+            if self.args.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+async def load_fixtures(client: httpx.AsyncClient, args) -> dict:
+    """Series, institutions and series elements the virtual users submit against."""
+    response = await client.post("/token", data={"username": args.username, "password": args.password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    series = (await client.get("/series/", params={"include_elements": False}, headers=headers)).json()
+    if args.series:
+        series = [item for item in series if item["series_id"] == args.series]
+    if not series:
+        raise SystemExit("No series to submit against")
+    series = max(series, key=lambda item: item.get("element_count") or 0)
+
+    institutions = (await client.get("/institutions/", headers=headers)).json()
+    if not institutions:
+        raise SystemExit("No institutions to submit for")
+
+    elements = []
+    while len(elements) < args.items:
+        page = (await client.get(
+            f"/series/{series['series_id']}/mdrm-elements",
+            params={"skip": len(elements), "limit": 500}, headers=headers
+        )).json()
+        elements.extend((item["id"], item["mdrm_id"]) for item in page["items"])
+        if not page["items"] or len(elements) >= page["total"]:
+            break
+    if not elements:
+        raise SystemExit(f"Series {series['series_id']} has no MDRM elements")
+
+    return {
+        "series_id": series["id"],
+        "institution_ids": [institution["id"] for institution in institutions],
+        "elements": elements
+    }
+
+async def run_load_test(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        fixtures = await load_fixtures(client, args)
+        results = Results()
+        users = [VirtualUser(client, args, fixtures, results, args.seed + index) for index in range(args.concurrency)]
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(user.run(deadline, DEFAULT_MIX) for user in users))
+        elapsed = time.perf_counter() - started
+
+    summary = summarize(results, elapsed)
+    summary["config"] = {
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "items": args.items,
+        "mix": DEFAULT_MIX
+    }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:52308/api")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--series", help="Series ID to submit against (default: the largest)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--items", type=int, default=50, help="Values per submission")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between requests, in seconds")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_load_test(args))
+    print(
+        f"{summary['requests']} requests in {summary['elapsed_s']} s: "
+        f"{summary['throughput_rps']} req/s, error rate {summary['error_rate']:.2%}"
+    )
+    for endpoint, stats in summary["endpoints"].items():
+        print(
+            f"{endpoint:>30}: {stats['requests']:6d} req {stats['throughput_rps']:8.2f}/s"
+            f"  p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms"
+            f"  errors {stats['error_rate']:6.2%}  rejected {stats['rejected_rate']:6.2%}"
+        )
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(summary, output, indent=2)
+
+if __name__ == "__main__":
+    main()
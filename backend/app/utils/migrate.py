@@ -0,0 +1,65 @@
+"""
+Schema creation and upgrade, run once per deployment instead of at startup:
+
+    python -m app.utils.migrate
+
+Creates missing tables, brings existing tables up to date with the models
+by adding the columns and indexes they lack, creates the MDRM
+full-text search index and sets up the partitioning of data values. Added columns are nullable and existing rows keep
+NULL, which the code treats like the column default.
+"""
+import sys
+from pathlib import Path
+
+# Add the parent directory to sys.path
+sys.path.append(str(Path(__file__).parent.parent.parent))
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from app.models.base import engine, Base
+from app.models import user, mdrm  # noqa: F401 -- register the models with Base.metadata
+from app.services.mdrm_search import ensure_search_index
+from app.services.partitions import ensure_partitions
+
+def _column_ddl(engine: Engine, column) -> str:
+    column_type = column.type.compile(dialect=engine.dialect)
+    return f'ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}'
+
+def upgrade_schema(engine: Engine = engine) -> list:
+    """Create missing tables, columns and indexes. Returns a description of each change."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    connection.exec_driver_sql(_column_ddl(engine, column))
+                    changes.append(f"Added column {table.name}.{column.name}")
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f"Added index {index.name}")
+
+    new_tables = [table for table in Base.metadata.sorted_tables if table.name not in existing_tables]
+    Base.metadata.create_all(bind=engine, tables=new_tables)
+    changes.extend(f"Created table {table.name}" for table in new_tables)
+
+    with engine.begin() as connection:
+        changes.extend(ensure_search_index(connection))
+        changes.extend(ensure_partitions(connection))
+    return changes
+
+if __name__ == "__main__":
+    changes = upgrade_schema()
+    for change in changes:
+        print(change)
+    print("Schema is up to date" if not changes else f"Applied {len(changes)} schema changes")
@@ -0,0 +1,27 @@
+from io import BytesIO
+
+from app.services.xbrl import parse_instance
+
+INSTANCE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance" xmlns:cc="http://www.ffiec.gov/xbrl/call/concepts">
+  <xbrli:context id="CI_2023-03-31">
+    <xbrli:entity><xbrli:identifier scheme="http://www.ffiec.gov/cdr">1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2023-03-31</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <cc:RCON2170 contextRef="CI_2023-03-31" unitRef="USD">60</cc:RCON2170>
+  <cc:RCONF236 contextRef="CI_2023-03-31" unitRef="USD">25</cc:RCONF236>
+  <cc:RCFDG301 contextRef="CI_2023-03-31" unitRef="USD">7</cc:RCFDG301>
+  <cc:RCONZZZZ contextRef="CI_2023-03-31" unitRef="USD">1</cc:RCONZZZZ>
+</xbrli:xbrl>
+"""
+
+def test_alphanumeric_item_codes_are_imported():
+    concepts = {"RCON2170": 1, "RCONF236": 2, "RCFDG301": 3}
+    data_values, summary = parse_instance(BytesIO(INSTANCE), concepts, "2023Q1")
+
+    assert sorted((value["mdrm_element_id"], value["value"]) for value in data_values) == [
+        (1, "60"), (2, "25"), (3, "7")
+    ]
+    assert summary["facts"] == 4
+    assert summary["unmapped_facts"] == 1
+    assert summary["mapped_facts"] == 3
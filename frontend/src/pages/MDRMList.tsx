@@ -43,7 +43,13 @@ import {
 import AddIcon from '@mui/icons-material/Add';
 import EditIcon from '@mui/icons-material/Edit';
 import DeleteIcon from '@mui/icons-material/Delete';
-import { getMDRMElements, createMDRMElement, updateMDRMElement, deleteMDRMElement } from '../services/api';
+import {
+  getMDRMElements,
+  searchMDRMElements,
+  createMDRMElement,
+  updateMDRMElement,
+  deleteMDRMElement,
+} from '../services/api';
 
 interface MDRMElement {
   id: string;
@@ -61,6 +67,7 @@ const MDRMList: React.FC = () => {
   const [page, setPage] = useState(0);
   const [rowsPerPage, setRowsPerPage] = useState(10);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState<{ total: number; items: MDRMElement[] } | null>(null);
   const [openDialog, setOpenDialog] = useState(false);
   const [currentMdrm, setCurrentMdrm] = useState<MDRMElement | null>(null);
   const [formData, setFormData] = useState({
@@ -75,6 +82,32 @@ const MDRMList: React.FC = () => {
     fetchMDRMElements();
   }, []);
 
+  // Search on the server, one page at a time, shortly after the user stops typing
+  useEffect(() => {
+    if (!searchTerm.trim()) {
+      setSearchResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const data = await searchMDRMElements(searchTerm, page * rowsPerPage, rowsPerPage);
+        if (!cancelled) {
+          setSearchResults({ total: data.total, items: data.items });
+        }
+      } catch (err) {
+        console.error('Error searching MDRM elements:', err);
+        if (!cancelled) {
+          setError('Failed to search MDRM elements. Please try again.');
+        }
+      }
+    }, 200);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm, page, rowsPerPage]);
+
   const fetchMDRMElements = async () => {
     try {
       setLoading(true);
@@ -167,19 +200,11 @@ const MDRMList: React.FC = () => {
     }
   };
 
-  // Filter MDRM elements based on search term
-  const filteredMdrmElements = mdrmElements.filter(
-    (mdrm) =>
-      mdrm.mdrm_id.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      mdrm.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      mdrm.description.toLowerCase().includes(searchTerm.toLowerCase())
-  );
-
-  // Paginate the filtered elements
-  const paginatedMdrmElements = filteredMdrmElements.slice(
-    page * rowsPerPage,
-    page * rowsPerPage + rowsPerPage
-  );
+  // Search results are already paginated by the server
+  const paginatedMdrmElements = searchResults
+    ? searchResults.items
+    : mdrmElements.slice(page * rowsPerPage, page * rowsPerPage + rowsPerPage);
+  const elementCount = searchResults ? searchResults.total : mdrmElements.length;
 
   return (
     <Box>
@@ -270,7 +295,7 @@ const MDRMList: React.FC = () => {
           <TablePagination
             rowsPerPageOptions={[5, 10, 25]}
             component="div"
-            count={filteredMdrmElements.length}
+            count={elementCount}
             rowsPerPage={rowsPerPage}
             page={page}
             onPageChange={handleChangePage}
@@ -48,12 +48,13 @@ import {
   Accordion,
   AccordionSummary,
   AccordionDetails,
+  LinearProgress,
 } from '@mui/material';
 import ExpandMoreIcon from '@mui/icons-material/ExpandMore';
 import CheckCircleIcon from '@mui/icons-material/CheckCircle';
 import ErrorIcon from '@mui/icons-material/Error';
 import PendingIcon from '@mui/icons-material/Pending';
-import { getReport, validateReport } from '../services/api';
+import { getReport, validateReport, subscribeReportEvents } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 
 interface ReportData {
@@ -82,6 +83,7 @@ const ReportDetail: React.FC = () => {
   const [loading, setLoading] = useState(true);
   const [validating, setValidating] = useState(false);
   const [error, setError] = useState('');
+  const [progress, setProgress] = useState<{ evaluated: number; total: number } | null>(null);
   const { user } = useAuth();
 
   useEffect(() => {
@@ -90,6 +92,22 @@ const ReportDetail: React.FC = () => {
     }
   }, [id]);
 
+  // Follow submissions of this report as they are processed
+  useEffect(() => {
+    if (!id) return;
+    const reportId = parseInt(id);
+    return subscribeReportEvents(reportId, (event, data) => {
+      if (event === 'status') {
+        setReport(prev => prev ? { ...prev, status: data.status } : prev);
+      } else if (event === 'progress') {
+        setProgress({ evaluated: data.rules_evaluated, total: data.rules_total });
+      } else if (event === 'summary') {
+        setProgress(null);
+        getReport(reportId).then(setReport).catch(err => console.error('Error refreshing report:', err));
+      }
+    });
+  }, [id]);
+
   const fetchReport = async (reportId: number) => {
     try {
       setLoading(true);
@@ -189,6 +207,14 @@ const ReportDetail: React.FC = () => {
           <Grid item xs={12} md={6}>
             <Typography variant="subtitle2" color="text.secondary">Status</Typography>
             <Box>{getStatusChip(report.status)}</Box>
+            {progress && progress.total > 0 && (
+              <Box sx={{ mt: 1 }}>
+                <LinearProgress variant="determinate" value={(100 * progress.evaluated) / progress.total} />
+                <Typography variant="caption" color="text.secondary">
+                  {progress.evaluated} of {progress.total} rules evaluated
+                </Typography>
+              </Box>
+            )}
           </Grid>
           <Grid item xs={12} md={6}>
             <Typography variant="subtitle2" color="text.secondary">Series</Typography>
@@ -57,6 +57,11 @@ export const getMDRMElements = async (params = {}) => {
   return response.data;
 };
 
+export const searchMDRMElements = async (q: string, skip = 0, limit = 50) => {
+  const response = await api.get('/mdrm-elements/search', { params: { q, skip, limit } });
+  return response.data;
+};
+
 export const getMDRMElement = async (mdrmId: string) => {
   const response = await api.get(`/mdrm-elements/${mdrmId}`);
   return response.data;
@@ -141,6 +146,47 @@ export const validateReport = async (reportId: number) => {
   return response.data;
 };
 
+// Streams status, progress and summary events of a report; returns a function that stops the stream.
+// Uses fetch rather than EventSource, which cannot send the Authorization header.
+export const subscribeReportEvents = (
+  reportId: number,
+  onEvent: (event: string, data: any) => void
+) => {
+  const controller = new AbortController();
+  const token = localStorage.getItem('token');
+
+  (async () => {
+    const response = await fetch(`${API_URL}/reports/${reportId}/events`, {
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) return;
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      const messages = buffer.split('\n\n');
+      buffer = messages.pop() || '';
+      for (const message of messages) {
+        let event = 'message';
+        let data = '';
+        for (const line of message.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  })().catch((err) => {
+    if (err.name !== 'AbortError') console.error('Report event stream failed:', err);
+  });
+
+  return () => controller.abort();
+};
+
 // Institutions API
 export const getInstitutions = async (params = {}) => {
   const response = await api.get('/institutions/', { params });